@@ -1,3 +1,94 @@
 from django.contrib import admin
+from .models import (
+    Source, SourceTokenCount, SourceChunk, Test, Introduction, LanguageModel, CircuitBreaker, TestRunBatch, TestRun, QuestionResult, Evaluation, AnswerMetrics,
+    Budget, ModelStats, ModelTestStats
+)
 
-# Register your models here.
+# Changelists render TestRun.__str__ and Evaluation.__str__, which follow the
+# test, language_model and test_run foreign keys: list_select_related loads
+# them in the page query. Foreign keys to large tables use raw id inputs so
+# change forms do not render a <select> of every row.
+
+@admin.register(Source)
+class SourceAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'updated_at')
+    search_fields = ('name',)
+
+@admin.register(SourceTokenCount)
+class SourceTokenCountAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source', 'tokenizer_type', 'token_count', 'source_updated_at')
+    list_filter = ('tokenizer_type',)
+    list_select_related = ('source',)
+    raw_id_fields = ('source',)
+
+@admin.register(SourceChunk)
+class SourceChunkAdmin(admin.ModelAdmin):
+    list_display = ('id', '__str__', 'start_token', 'end_token')
+    list_select_related = ('source_token_count',)
+    raw_id_fields = ('source_token_count',)
+
+@admin.register(Test)
+class TestAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'updated_at')
+    search_fields = ('name',)
+    filter_horizontal = ('sources',)
+
+@admin.register(Introduction)
+class IntroductionAdmin(admin.ModelAdmin):
+    list_display = ('id', '__str__', 'updated_at')
+
+@admin.register(LanguageModel)
+class LanguageModelAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'library', 'tokenizer_type', 'input_cost_per_1k_tokens', 'output_cost_per_1k_tokens',
+                    'context_window')
+
+@admin.register(CircuitBreaker)
+class CircuitBreakerAdmin(admin.ModelAdmin):
+    list_display = ('language_model', 'state', 'consecutive_failures', 'opened_at', 'successes', 'failures', 'retries')
+    list_filter = ('state',)
+    list_select_related = ('language_model',)
+
+@admin.register(TestRunBatch)
+class TestRunBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'test', 'created_at')
+    list_select_related = ('test',)
+    raw_id_fields = ('test',)
+
+@admin.register(TestRun)
+class TestRunAdmin(admin.ModelAdmin):
+    list_display = ('id', '__str__', 'status', 'cost', 'completed_at')
+    list_filter = ('status',)
+    list_select_related = ('test', 'language_model')
+    raw_id_fields = ('test', 'language_model', 'batch', 'budget')
+    filter_horizontal = ('introductions',)
+
+@admin.register(QuestionResult)
+class QuestionResultAdmin(admin.ModelAdmin):
+    list_display = ('id', '__str__', 'input_tokens', 'output_tokens', 'cost', 'error')
+    raw_id_fields = ('test_run',)
+
+@admin.register(Evaluation)
+class EvaluationAdmin(admin.ModelAdmin):
+    list_display = ('id', '__str__', 'score', 'created_at')
+    list_select_related = ('test_run__test', 'test_run__language_model')
+    raw_id_fields = ('test_run',)
+
+@admin.register(AnswerMetrics)
+class AnswerMetricsAdmin(admin.ModelAdmin):
+    list_display = ('id', '__str__', 'chrf', 'rouge_l', 'token_f1', 'created_at')
+    list_select_related = ('test_run__test', 'test_run__language_model')
+    raw_id_fields = ('test_run',)
+
+@admin.register(Budget)
+class BudgetAdmin(admin.ModelAdmin):
+    list_display = ('date', 'daily_limit', 'current_usage', 'reserved')
+
+@admin.register(ModelStats)
+class ModelStatsAdmin(admin.ModelAdmin):
+    list_display = ('language_model', 'evaluation_count', 'mean_score', 'run_count', 'total_cost')
+    list_select_related = ('language_model',)
+
+@admin.register(ModelTestStats)
+class ModelTestStatsAdmin(admin.ModelAdmin):
+    list_display = ('language_model', 'test', 'evaluation_count', 'mean_score', 'run_count', 'total_cost')
+    list_select_related = ('language_model', 'test')
@@ -0,0 +1,190 @@
+from decimal import Decimal
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+# Leaderboard rollups: one ModelTestStats row per (language model, test) and
+# one ModelStats row per language model. Signal handlers in api.signals feed
+# every change of an Evaluation or a finished TestRun through here as F()
+# updates, so reads cost O(models) however many evaluations exist.
+# Queryset.update() and bulk_create() send no signals; run
+# `manage.py rebuild_analytics` after writing through them.
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+RUN_FIELDS = ('language_model_id', 'test_id', 'status', 'cost', 'started_at', 'completed_at')
+
+def _models(apps):
+    return {name: apps.get_model('api', name) for name in ('Evaluation', 'TestRun', 'ModelTestStats', 'ModelStats')}
+
+def _targets(language_model_id, test_id):
+    models = _models(global_apps)
+    return (
+        (models['ModelTestStats'], {'language_model_id': language_model_id, 'test_id': test_id}),
+        (models['ModelStats'], {'language_model_id': language_model_id}),
+    )
+
+def _create(model, lookup):
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup)
+    except IntegrityError:
+        # Created concurrently.
+        pass
+
+def _apply(language_model_id, test_id, changes, create=True):
+    """Update both rollup rows with `changes`, creating them first if `create`."""
+    for model, lookup in _targets(language_model_id, test_id):
+        if model.objects.filter(**lookup).update(**changes) or not create:
+            continue
+        _create(model, lookup)
+        model.objects.filter(**lookup).update(**changes)
+
+def _evaluations(lookup):
+    Evaluation = _models(global_apps)['Evaluation']
+    return Evaluation.objects.filter(**{f'test_run__{field}': value for field, value in lookup.items()})
+
+def _refresh_bounds(language_model_id, test_id, removed_score):
+    # Minimum and maximum cannot be decremented; recompute them from the
+    # group's evaluations when the removed score was one of them.
+    for model, lookup in _targets(language_model_id, test_id):
+        row = model.objects.filter(**lookup).values('score_min', 'score_max').first()
+        if row is None or row['score_min'] is None:
+            continue
+        if row['score_min'] < removed_score < row['score_max']:
+            continue
+        bounds = _evaluations(lookup).aggregate(low=Min('score'), high=Max('score'))
+        model.objects.filter(**lookup).update(score_min=bounds['low'], score_max=bounds['high'])
+
+def _recompute_scores(language_model_id, test_id):
+    for model, lookup in _targets(language_model_id, test_id):
+        totals = _evaluations(lookup).aggregate(
+            count=Count('id'), total=Sum('score'), total_sq=Sum(F('score') * F('score')),
+            low=Min('score'), high=Max('score'))
+        model.objects.filter(**lookup).update(
+            evaluation_count=totals['count'], score_sum=totals['total'] or 0, score_sum_sq=totals['total_sq'] or 0,
+            score_min=totals['low'], score_max=totals['high'])
+
+def add_score(language_model_id, test_id, score):
+    add_scores(language_model_id, test_id, [score])
+
+def add_scores(language_model_id, test_id, scores):
+    """Add many scores of one group with a single update per rollup row."""
+    scores = [float(score) for score in scores]
+    if not scores:
+        return
+    low = Value(min(scores), output_field=FloatField())
+    high = Value(max(scores), output_field=FloatField())
+    _apply(language_model_id, test_id, {
+        'evaluation_count': F('evaluation_count') + len(scores),
+        'score_sum': F('score_sum') + sum(scores),
+        'score_sum_sq': F('score_sum_sq') + sum(score * score for score in scores),
+        'score_min': Least(Coalesce('score_min', low), low),
+        'score_max': Greatest(Coalesce('score_max', high), high),
+    })
+
+def remove_score(language_model_id, test_id, score):
+    score = float(score)
+    _apply(language_model_id, test_id, {
+        'evaluation_count': F('evaluation_count') - 1,
+        'score_sum': F('score_sum') - score,
+        'score_sum_sq': F('score_sum_sq') - score * score,
+    }, create=False)
+    _refresh_bounds(language_model_id, test_id, score)
+
+def run_state(test_run):
+    """Snapshot of the fields a test run contributes, without loading deferred ones."""
+    return {field: test_run.__dict__.get(field) for field in RUN_FIELDS}
+
+def run_contribution(state):
+    if state is None or state['status'] not in FINISHED_STATUSES or state['completed_at'] is None:
+        return None
+    latency = 0.0
+    if state['started_at'] is not None:
+        latency = (state['completed_at'] - state['started_at']).total_seconds()
+    return (state['language_model_id'], state['test_id']), Decimal(state['cost'] or 0), latency
+
+def _add_run(group, cost, latency, sign):
+    _apply(*group, {
+        'run_count': F('run_count') + sign,
+        'total_cost': F('total_cost') + sign * cost,
+        'latency_sum': F('latency_sum') + sign * latency,
+    }, create=sign > 0)
+
+def test_run_changed(old_state, new_state):
+    """Move a test run's contribution from `old_state` to `new_state` (either may be None)."""
+    old, new = run_contribution(old_state), run_contribution(new_state)
+    if old != new:
+        if old is not None:
+            _add_run(*old, sign=-1)
+        if new is not None:
+            _add_run(*new, sign=1)
+    if old_state is None or new_state is None:
+        return
+    old_group = (old_state['language_model_id'], old_state['test_id'])
+    new_group = (new_state['language_model_id'], new_state['test_id'])
+    if old_group != new_group:
+        # The run's evaluations moved with it.
+        recompute_scores([old_group, new_group])
+
+def recompute_scores(groups):
+    """Recompute the score totals of (language model id, test id) groups from their evaluations."""
+    groups = set(groups)
+    for group in groups:
+        for model, lookup in _targets(*group):
+            if not model.objects.filter(**lookup).exists():
+                _create(model, lookup)
+    for group in groups:
+        _recompute_scores(*group)
+
+@transaction.atomic
+def rebuild(apps=global_apps):
+    """Recompute every rollup row from evaluations and test runs."""
+    models = _models(apps)
+    models['ModelTestStats'].objects.all().delete()
+    models['ModelStats'].objects.all().delete()
+
+    groups = {}
+
+    def group(language_model_id, test_id):
+        key = (language_model_id, test_id)
+        if key not in groups:
+            groups[key] = models['ModelTestStats'](language_model_id=language_model_id, test_id=test_id)
+        return groups[key]
+
+    scores = (models['Evaluation'].objects
+              .values('test_run__language_model', 'test_run__test')
+              .annotate(count=Count('id'), total=Sum('score'), total_sq=Sum(F('score') * F('score')),
+                        low=Min('score'), high=Max('score'))
+              .order_by())
+    for row in scores:
+        stats = group(row['test_run__language_model'], row['test_run__test'])
+        stats.evaluation_count = row['count']
+        stats.score_sum = row['total']
+        stats.score_sum_sq = row['total_sq']
+        stats.score_min = row['low']
+        stats.score_max = row['high']
+
+    runs = models['TestRun'].objects.filter(status__in=FINISHED_STATUSES, completed_at__isnull=False).values(*RUN_FIELDS)
+    for state in runs.iterator():
+        (language_model_id, test_id), cost, latency = run_contribution(state)
+        stats = group(language_model_id, test_id)
+        stats.run_count += 1
+        stats.total_cost += cost
+        stats.latency_sum += latency
+
+    totals = {}
+    for stats in groups.values():
+        if stats.language_model_id not in totals:
+            totals[stats.language_model_id] = models['ModelStats'](language_model_id=stats.language_model_id)
+        total = totals[stats.language_model_id]
+        for field in ('evaluation_count', 'score_sum', 'score_sum_sq', 'run_count', 'total_cost', 'latency_sum'):
+            setattr(total, field, getattr(total, field) + getattr(stats, field))
+        if stats.score_min is not None:
+            total.score_min = stats.score_min if total.score_min is None else min(total.score_min, stats.score_min)
+            total.score_max = stats.score_max if total.score_max is None else max(total.score_max, stats.score_max)
+
+    models['ModelTestStats'].objects.bulk_create(groups.values(), batch_size=1000)
+    models['ModelStats'].objects.bulk_create(totals.values(), batch_size=1000)
+    return len(totals), len(groups)
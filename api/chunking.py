@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import Source, SourceTokenCount, SourceChunk
+from .tokenizers import get_tokenizer
+
+# Token-bounded chunks of sources, stored per tokenizer type. A source is
+# tokenized once per tokenizer and again only after its `updated_at` (or the
+# chunk settings) change; prompts then fit sources into a model's context
+# window by adding up stored counts instead of tokenizing the prompt.
+
+SENTENCE_ENDS = ('.', '׃', ':', '?', '!')
+
+SOURCE_SEPARATOR = "\n\n"
+
+def _chunk_settings():
+    size = max(settings.SOURCE_CHUNK_TOKENS, 1)
+    return size, min(max(settings.SOURCE_CHUNK_OVERLAP, 0), size - 1)
+
+def _breaks_after(text, spans, index):
+    """Whether a line or sentence ends with token `index` (before token `index + 1`)."""
+    segment = text[spans[index][0]:spans[index + 1][0]]
+    return '\n' in segment or segment.strip().endswith(SENTENCE_ENDS)
+
+def chunk_bounds(text, spans, size, overlap):
+    """(start token, end token) windows of at most `size` tokens covering `spans`.
+
+    A window ends at the last line or sentence break in its final quarter when
+    there is one; the next window starts `overlap` tokens before that end.
+    """
+    bounds = []
+    start = 0
+    while start < len(spans):
+        end = min(start + size, len(spans))
+        if end < len(spans):
+            for candidate in range(end, max(start + size * 3 // 4, start + 1) - 1, -1):
+                if _breaks_after(text, spans, candidate - 1):
+                    end = candidate
+                    break
+        bounds.append((start, end))
+        if end == len(spans):
+            break
+        start = max(end - overlap, start + 1)
+    return bounds
+
+def _count_source(source, tokenizer_type, size, overlap):
+    tokenizer = get_tokenizer(tokenizer_type)
+    spans = tokenizer.spans(source.content)
+    row = SourceTokenCount(
+        source=source, tokenizer_type=tokenizer_type, source_updated_at=source.updated_at,
+        name_tokens=tokenizer.count(f"{source.name}\n"), token_count=len(spans),
+        chunk_tokens=size, overlap_tokens=overlap)
+    chunks = [
+        SourceChunk(index=index, start=spans[start][0], end=spans[end - 1][1], start_token=start, end_token=end)
+        for index, (start, end) in enumerate(chunk_bounds(source.content, spans, size, overlap))
+    ]
+    return row, chunks
+
+def _is_current(row, source, size, overlap):
+    return (row.source_updated_at == source.updated_at
+            and row.chunk_tokens == size and row.overlap_tokens == overlap)
+
+def token_counts(sources, tokenizer_type):
+    """Return {source id: SourceTokenCount with its chunks prefetched} for `sources`.
+
+    Missing or outdated counts are computed and stored; only those sources'
+    texts are loaded.
+    """
+    sources = list(sources)
+    size, overlap = _chunk_settings()
+    rows = {
+        row.source_id: row
+        for row in SourceTokenCount.objects.filter(source__in=[source.pk for source in sources], tokenizer_type=tokenizer_type)
+        .prefetch_related('chunks')
+    }
+    stale = [source for source in sources if source.pk not in rows or not _is_current(rows[source.pk], source, size, overlap)]
+    if not stale:
+        return rows
+    unloaded = [source.pk for source in stale if 'content' in source.get_deferred_fields()]
+    texts = Source.objects.with_text().in_bulk(unloaded) if unloaded else {}
+    computed = [_count_source(texts.get(source.pk, source), tokenizer_type, size, overlap) for source in stale]
+    try:
+        with transaction.atomic():
+            SourceTokenCount.objects.filter(source__in=[source.pk for source in stale], tokenizer_type=tokenizer_type).delete()
+            SourceTokenCount.objects.bulk_create([row for row, _ in computed])
+            for row, chunks in computed:
+                for chunk in chunks:
+                    chunk.source_token_count = row
+            SourceChunk.objects.bulk_create([chunk for _, chunks in computed for chunk in chunks], batch_size=1000)
+    except IntegrityError:
+        # Another worker stored the same counts first.
+        pass
+    for row, chunks in computed:
+        row._prefetched_objects_cache = {'chunks': chunks}
+        rows[row.source_id] = row
+    return rows
+
+def separator_tokens(tokenizer_type):
+    return get_tokenizer(tokenizer_type).count(SOURCE_SEPARATOR)
+
+def total_tokens(rows, separator):
+    """Tokens of all the sources of `rows`, formatted as in prompts.format_sources."""
+    return sum(row.name_tokens + row.token_count for row in rows) + separator * max(len(rows) - 1, 0)
+
+def pack(rows, budget, separator):
+    """Fit the sources of `rows` (in prompt order) into `budget` tokens.
+
+    Whole sources are taken while they fit; the first one that does not is
+    cut at the last chunk end that fits, and packing stops there. One pass
+    over the chunks. Returns ([(row, end character or None for all)], tokens, truncated).
+    """
+    selection = []
+    used = 0
+    for position, row in enumerate(rows):
+        header = row.name_tokens + (separator if position else 0)
+        if used + header + row.token_count <= budget:
+            selection.append((row, None))
+            used += header + row.token_count
+            continue
+        cut = None
+        for chunk in row.chunks.all():
+            if used + header + chunk.end_token > budget:
+                break
+            cut = chunk
+        if cut is not None:
+            selection.append((row, cut.end))
+            used += header + cut.end_token
+        return selection, used, True
+    return selection, used, False
+
+def assemble(selection, sources):
+    """The sources text of a `pack` selection; `sources` maps ids to sources with their content."""
+    parts = []
+    for row, end in selection:
+        source = sources[row.source_id]
+        parts.append(f"{source.name}\n{source.content if end is None else source.content[:end]}")
+    return SOURCE_SEPARATOR.join(parts)
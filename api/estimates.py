@@ -0,0 +1,89 @@
+from django.conf import settings
+from . import chunking
+from .prompts import get_questions, get_template, sources_budget
+from .tokenizers import get_tokenizer
+
+def estimate_runs(tests, language_models, introduction_sets, max_output_tokens=None):
+    """Estimate tokens and cost for every test x language model x introduction set.
+
+    Every template, test and introduction is tokenized once per tokenizer type
+    and sources use their stored counts (api.chunking); each combination is
+    then priced with additions only, using how often the model's compiled
+    template uses each placeholder. Sources are packed into the context window
+    of models that have one, as prompts are.
+    """
+    if max_output_tokens is None:
+        max_output_tokens = settings.RUN_MAX_OUTPUT_TOKENS
+    test_counts = {}
+    introduction_counts = {}
+    rows = []
+    for language_model in language_models:
+        tokenizer_type = language_model.tokenizer_type
+        tokenizer = get_tokenizer(tokenizer_type)
+        template = get_template(language_model)
+        fields = template.field_counts()
+        literal_tokens = tokenizer.count(template.literal_text)
+        separator = chunking.separator_tokens(tokenizer_type)
+        for test in tests:
+            key = (tokenizer_type, test.pk)
+            if key not in test_counts:
+                sources = list(test.sources.order_by('id')) if test.pk is not None else []
+                token_counts = chunking.token_counts(sources, tokenizer_type)
+                source_rows = [token_counts[source.pk] for source in sources]
+                test_counts[key] = {
+                    'test_name': tokenizer.count(test.name),
+                    'test_description': tokenizer.count(test.description),
+                    'source_rows': source_rows,
+                    'sources': chunking.total_tokens(source_rows, separator),
+                    'questions': [tokenizer.count(question) for question in get_questions(test)],
+                    'repeats_description': not test.questions,
+                }
+            counts = test_counts[key]
+            prompts = len(counts['questions'])
+            question_tokens = sum(counts['questions'])
+            if template.uses_default_layout and counts['repeats_description']:
+                question_tokens = 0
+            other_tokens = literal_tokens + sum(
+                fields[field] * counts[field] for field in ('test_name', 'test_description'))
+            for introductions in introduction_sets:
+                introduction_tokens = 0
+                for introduction in introductions:
+                    key = (tokenizer_type, introduction.pk)
+                    if key not in introduction_counts:
+                        introduction_counts[key] = tokenizer.count(introduction.content)
+                    introduction_tokens += introduction_counts[key]
+                source_tokens = counts['sources']
+                budget = None
+                if language_model.context_window is not None and counts['source_rows']:
+                    budget = sources_budget(
+                        language_model,
+                        other_tokens + fields['introductions'] * introduction_tokens
+                        + fields['question'] * max(counts['questions']),
+                        max_output_tokens)
+                if budget is not None and source_tokens > budget:
+                    _, source_tokens, _ = chunking.pack(counts['source_rows'], budget, separator)
+                shared_tokens = other_tokens + fields['sources'] * source_tokens
+                input_tokens = (prompts * (shared_tokens + fields['introductions'] * introduction_tokens)
+                                + fields['question'] * question_tokens)
+                output_tokens = prompts * max_output_tokens
+                rows.append({
+                    'test': test.pk,
+                    'language_model': language_model.pk,
+                    'introductions': [introduction.pk for introduction in introductions],
+                    'prompts': prompts,
+                    'input_tokens': input_tokens,
+                    'output_tokens': output_tokens,
+                    'cost': language_model.calculate_cost(input_tokens, output_tokens),
+                })
+    return rows
+
+def estimate_cost(test, language_model, introductions=()):
+    return estimate_runs([test], [language_model], [list(introductions)])[0]['cost']
+
+def summarize(rows):
+    return {
+        'runs': len(rows),
+        'input_tokens': sum(row['input_tokens'] for row in rows),
+        'output_tokens': sum(row['output_tokens'] for row in rows),
+        'cost': sum((row['cost'] for row in rows), 0),
+    }
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+# In-process fan-out of test run progress events. Runner threads publish;
+# async stream views subscribe with an asyncio queue on their event loop.
+# Events reach only subscribers in the runner's own process: streams of runs
+# executed elsewhere read the run's status and QuestionResult rows instead.
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+_subscribers = defaultdict(set)
+_subscribers_lock = threading.Lock()
+
+class Subscription:
+    def __init__(self, test_run_id):
+        self.test_run_id = test_run_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            # The subscriber's event loop has been closed.
+            unsubscribe(self)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+def subscribe(test_run_id):
+    """Subscribe the running event loop to events of one test run."""
+    subscription = Subscription(test_run_id)
+    with _subscribers_lock:
+        _subscribers[test_run_id].add(subscription)
+    return subscription
+
+def unsubscribe(subscription):
+    with _subscribers_lock:
+        subscribers = _subscribers.get(subscription.test_run_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del _subscribers[subscription.test_run_id]
+
+def publish(test_run_id, event):
+    with _subscribers_lock:
+        subscribers = list(_subscribers.get(test_run_id, ()))
+    for subscription in subscribers:
+        subscription.deliver(event)
+
+def is_terminal(event):
+    return event.get('event') == 'status' and event.get('status') in TERMINAL_STATUSES
@@ -0,0 +1,216 @@
+import csv
+import json
+import math
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+# Streaming exports. Rows come from values_list(...).iterator(), a server-side
+# cursor on PostgreSQL and chunked fetches on SQLite, and every writer yields
+# its output as it goes, so memory does not grow with the number of rows.
+#
+# Text cells of CSV and XLSX files that start like a formula (=, +, -, @, a
+# tab or a carriage return) get a leading apostrophe, so a spreadsheet shows them instead of running
+# them; numbers are left alone.
+
+CHUNK_SIZE = 2000
+
+RUN_COLUMNS = (
+    ('id', 'id'),
+    ('test_id', 'test_id'),
+    ('test_name', 'test__name'),
+    ('language_model_id', 'language_model_id'),
+    ('language_model_name', 'language_model__name'),
+    ('status', 'status'),
+    ('started_at', 'started_at'),
+    ('completed_at', 'completed_at'),
+    ('cost', 'cost'),
+    ('cache_hits', 'cache_hits'),
+    ('result', 'result'),
+)
+
+EVALUATION_COLUMNS = (
+    ('id', 'id'),
+    ('test_run_id', 'test_run_id'),
+    ('test_id', 'test_run__test_id'),
+    ('test_name', 'test_run__test__name'),
+    ('language_model_id', 'test_run__language_model_id'),
+    ('language_model_name', 'test_run__language_model__name'),
+    ('score', 'score'),
+    ('comments', 'comments'),
+    ('created_at', 'created_at'),
+)
+
+def iter_rows(queryset, columns):
+    return queryset.order_by('id').values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=CHUNK_SIZE)
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def _cell_text(value):
+    text = _text(value)
+    if isinstance(value, str) and text.startswith(_FORMULA_PREFIXES):
+        return "'" + text
+    return text
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+class _Buffer:
+    """File-like sink whose written chunks are collected and handed out by `take`."""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+class _TextSink:
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def write(self, text):
+        return self.buffer.write(text.encode())
+
+def write_csv(headers, rows):
+    buffer = _Buffer()
+    writer = csv.writer(_TextSink(buffer))
+    writer.writerow(headers)
+    # The byte order mark makes Excel read the file as UTF-8.
+    yield '\ufeff'.encode() + buffer.take()
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_cell_text(value) for value in row])
+        if count % CHUNK_SIZE == 0:
+            yield buffer.take()
+    yield buffer.take()
+
+def write_jsonl(headers, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(headers, map(_json_value, row))), ensure_ascii=False))
+        if len(lines) == CHUNK_SIZE:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+# Characters XML 1.0 does not allow, even escaped.
+_XML_ILLEGAL = dict.fromkeys(code for code in range(32) if chr(code) not in '\t\n\r')
+
+# The most characters Excel keeps in a cell; longer texts are cut.
+XLSX_MAX_CELL_LENGTH = 32767
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, int) or isinstance(value, (float, Decimal)) and math.isfinite(value):
+        return f'<c><v>{value}</v></c>'
+    # A bare carriage return would be read back as a line feed.
+    text = escape(_cell_text(value).translate(_XML_ILLEGAL)[:XLSX_MAX_CELL_LENGTH], {'\r': '&#13;'})
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+def write_xlsx(headers, rows, sheet_name='Export'):
+    """A one-sheet workbook with inline strings, zipped as it is generated."""
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(sheet_name)))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        yield buffer.take()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(_xlsx_row(headers).encode())
+            lines = []
+            for row in rows:
+                lines.append(_xlsx_row(row))
+                if len(lines) == CHUNK_SIZE:
+                    sheet.write(''.join(lines).encode())
+                    lines = []
+                    yield buffer.take()
+            sheet.write(''.join(lines).encode())
+            sheet.write(b'</sheetData></worksheet>')
+        yield buffer.take()
+    yield buffer.take()
+
+FORMATS = {
+    'csv': (write_csv, 'text/csv; charset=utf-8', 'csv'),
+    'jsonl': (write_jsonl, 'application/x-ndjson', 'jsonl'),
+    'xlsx': (write_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+def export(queryset, columns, export_format):
+    """Return (content iterator, content type, file extension) for `queryset` in `export_format`."""
+    writer, content_type, extension = FORMATS[export_format]
+    headers = [name for name, _ in columns]
+    return writer(headers, iter_rows(queryset, columns)), content_type, extension
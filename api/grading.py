@@ -0,0 +1,239 @@
+import json
+import os
+import re
+from collections import defaultdict
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from . import analytics, similarity
+from .hebrew import normalize
+from .models import AnswerMetrics, Evaluation, QuestionResult, Test, TestRun
+
+# Automatic grading of closed tests. Every question of a multiple-choice or
+# short-answer test carries an answer key: {"question": ..., "answer": "ב"}, or
+# a list of accepted answers. Answers and keys are compared after
+# normalization (no niqqud, cantillation, final letter forms or punctuation),
+# so "בְּרֵאשִׁית." matches "בראשית".
+#
+# Answers are read from the runs' QuestionResult rows; runs without any
+# (stored through the API or before there were rows) from their result.
+#
+# A batch is graded with array operations: every accepted answer becomes a
+# 64-bit (question slot, answer code) pair, every candidate reading of a
+# model's answer another, and np.isin finds the matches; bincount then adds
+# them up per answer and per run. The score of a run is the share of its
+# test's questions answered correctly, stored as an Evaluation with
+# is_automatic set.
+#
+# Open questions may carry reference answers under the same "answer" key;
+# measure_runs stores the similarity of a run's answers to them as
+# AnswerMetrics, so human graders can start from the weakest runs.
+
+CLOSED_TEST_TYPES = ('multiple_choice', 'short_answer')
+
+BATCH_SIZE = 2000
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+_DELIMITED_CHOICE = re.compile(r"(?<!\w)\(?(\w)[.)](?!\w)")
+
+def normalize_answer(text):
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", normalize(str(text)))).strip()
+
+def choice_label(text, choices):
+    """The choice letter an answer picks ("התשובה היא (ב)" -> "ב"), or None.
+
+    Only letters in `choices` count: the last one set off as "(ב)", "ב)" or
+    "ב.", or else the last one standing as a word of its own.
+    """
+    delimited = [letter for letter in _DELIMITED_CHOICE.findall(normalize(str(text))) if letter in choices]
+    if delimited:
+        return delimited[-1]
+    words = [word for word in normalize_answer(text).split(" ") if word in choices]
+    return words[-1] if words else None
+
+def accepted_answers(item):
+    """Normalized accepted answers of a question, or [] if it has no answer key."""
+    answer = item.get('answer') if isinstance(item, dict) else None
+    if answer is None:
+        return []
+    return [normalize_answer(value) for value in (answer if isinstance(answer, list) else [answer])]
+
+def run_answers(runs):
+    """{run id: {question index: answer}} of the given runs."""
+    answers = defaultdict(dict)
+    rows = (QuestionResult.objects.filter(test_run__in=[run.pk for run in runs], error__isnull=True)
+            .values_list('test_run_id', 'index', 'answer'))
+    for test_run_id, index, answer in rows.iterator():
+        answers[test_run_id][index] = answer
+    missing = [run.pk for run in runs if run.pk not in answers]
+    for test_run_id, result in TestRun.objects.filter(pk__in=missing).values_list('pk', 'result').iterator():
+        answers[test_run_id] = {answer.get('index'): answer.get('answer') or '' for answer in json.loads(result or '[]')}
+    return answers
+
+class _Codes(dict):
+    def code(self, text):
+        return self.setdefault(text, len(self))
+
+def score_runs(runs):
+    """[(correct, questions)] of each completed run of a closed test, in order."""
+    codes = _Codes()
+    slots = {}
+    key_pairs = []
+    for test in {run.test_id: run.test for run in runs}.values():
+        for index, item in enumerate(test.questions):
+            slot = slots[test.pk, index] = len(slots)
+            key_pairs.extend((slot << 32) | codes.code(accepted) for accepted in accepted_answers(item))
+    # The choice letters of a multiple-choice test are its one-letter answer keys.
+    choices = {
+        run.test_id: {accepted for item in run.test.questions for accepted in accepted_answers(item) if len(accepted) == 1}
+        for run in runs if run.test.test_type == 'multiple_choice'
+    }
+
+    normalized, labels = {}, {}
+    pairs, pair_answers, answer_runs = [], [], []
+    answers = run_answers(runs)
+    for position, run in enumerate(runs):
+        for index, text in answers[run.pk].items():
+            slot = slots.get((run.test_id, index))
+            if slot is None:
+                continue
+            text = text or ''
+            if text not in normalized:
+                normalized[text] = normalize_answer(text)
+            candidates = [normalized[text]]
+            if run.test_id in choices:
+                if (run.test_id, text) not in labels:
+                    labels[run.test_id, text] = choice_label(text, choices[run.test_id])
+                if labels[run.test_id, text] is not None:
+                    candidates.append(labels[run.test_id, text])
+            for candidate in candidates:
+                code = codes.get(candidate)
+                if code is not None:
+                    pairs.append((slot << 32) | code)
+                    pair_answers.append(len(answer_runs))
+            answer_runs.append(position)
+
+    matched = np.isin(np.array(pairs, dtype=np.int64), np.array(key_pairs, dtype=np.int64))
+    # An answer is correct if any of its readings matches a key.
+    correct_answers = np.bincount(np.array(pair_answers, dtype=np.int64), weights=matched, minlength=len(answer_runs)) > 0
+    correct = np.bincount(np.array(answer_runs, dtype=np.int64), weights=correct_answers, minlength=len(runs))
+    return [(int(count), len(run.test.questions)) for count, run in zip(correct, runs)]
+
+def _evaluation(run, correct, questions):
+    return Evaluation(test_run=run, score=correct / questions if questions else 0.0,
+                      comments=f"{correct}/{questions} correct", is_automatic=True)
+
+def _insert_evaluations(graded):
+    """Insert the evaluations of [(run, (correct, questions))]; return those inserted.
+
+    A run graded meanwhile elsewhere (the runner's grading of a finished run
+    racing the grade endpoint) keeps that evaluation and is skipped.
+    """
+    evaluations = [_evaluation(run, *score) for run, score in graded]
+    try:
+        with transaction.atomic():
+            return Evaluation.objects.bulk_create(evaluations, batch_size=1000)
+    except IntegrityError:
+        pass
+    inserted = []
+    for run, score in graded:
+        evaluation = _evaluation(run, *score)
+        try:
+            with transaction.atomic():
+                Evaluation.objects.bulk_create([evaluation])
+        except IntegrityError:
+            continue
+        inserted.append(evaluation)
+    return inserted
+
+def _grade_batch(test_run_ids):
+    with transaction.atomic():
+        runs = list(
+            TestRun.objects.select_related('test')
+            .filter(pk__in=test_run_ids, status='completed', test__test_type__in=CLOSED_TEST_TYPES)
+            .exclude(evaluation__is_automatic=True)
+            .order_by('pk'))
+        graded = list(zip(runs, score_runs(runs)))
+        evaluations = _insert_evaluations(graded)
+        # bulk_create sends no signals; add the scores to the leaderboard rollups here.
+        scores = defaultdict(list)
+        for evaluation in evaluations:
+            scores[(evaluation.test_run.language_model_id, evaluation.test_run.test_id)].append(evaluation.score)
+        for group, group_scores in scores.items():
+            analytics.add_scores(*group, group_scores)
+    return evaluations
+
+def grade_runs(test_run_ids=None):
+    """Grade completed runs of closed tests that have no automatic evaluation yet.
+
+    Grades the given runs, or every such run if None; returns the number of
+    evaluations created.
+    """
+    if test_run_ids is None:
+        test_run_ids = (TestRun.objects.filter(status='completed', test__test_type__in=CLOSED_TEST_TYPES)
+                        .exclude(evaluation__is_automatic=True).order_by('pk').values_list('pk', flat=True))
+    test_run_ids = list(test_run_ids)
+    return sum(len(_grade_batch(test_run_ids[start:start + BATCH_SIZE]))
+               for start in range(0, len(test_run_ids), BATCH_SIZE))
+
+def _measure_batch(test_run_ids, references, executor):
+    runs = list(TestRun.objects.filter(pk__in=test_run_ids).only('id', 'test_id').order_by('pk'))
+    answers = run_answers(runs)
+    # One pair per (answer, reference); an answer's score is its best over its references.
+    pairs, pair_answers, answer_runs = [], [], []
+    for position, run in enumerate(runs):
+        for index, accepted in enumerate(references[run.test_id]):
+            for reference in accepted:
+                pairs.append((answers[run.pk].get(index) or '', reference))
+                pair_answers.append(len(answer_runs))
+            if accepted:
+                answer_runs.append(position)
+    scores = np.zeros((len(answer_runs), len(similarity.METRICS)))
+    np.maximum.at(scores, np.array(pair_answers, dtype=np.int64), similarity.score_many(pairs, executor))
+    answer_runs = np.array(answer_runs, dtype=np.int64)
+    counts = np.bincount(answer_runs, minlength=len(runs))
+    means = np.column_stack([np.bincount(answer_runs, weights=scores[:, column], minlength=len(runs))
+                             for column in range(len(similarity.METRICS))]) / np.maximum(counts, 1)[:, None]
+
+    rows = []
+    answer = 0
+    for position, run in enumerate(runs):
+        questions = []
+        for accepted in references[run.test_id]:
+            if accepted:
+                questions.append(dict(zip(similarity.METRICS, (round(float(value), 4) for value in scores[answer]))))
+                answer += 1
+            else:
+                questions.append(None)
+        rows.append(AnswerMetrics(test_run_id=run.pk, questions=questions,
+                                  **dict(zip(similarity.METRICS, (float(value) for value in means[position])))))
+    AnswerMetrics.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    return len(rows)
+
+def measure_runs(test_run_ids=None, workers=None):
+    """Store AnswerMetrics for completed runs of open tests with reference answers that have none yet.
+
+    Measures the given runs, or every such run if None, scoring on `workers`
+    processes (METRICS_WORKERS by default, 0 meaning one per core); returns
+    the number of runs measured.
+    """
+    pending = TestRun.objects.filter(status='completed', test__test_type='open', answer_metrics__isnull=True)
+    if test_run_ids is not None:
+        pending = pending.filter(pk__in=list(test_run_ids))
+    references = {}
+    for test in Test.objects.filter(pk__in=pending.values('test_id')):
+        accepted = [accepted_answers(item) for item in test.questions]
+        if any(accepted):
+            references[test.pk] = accepted
+    if not references:
+        return 0
+    test_run_ids = list(pending.filter(test_id__in=references).order_by('pk').values_list('pk', flat=True))
+    if workers is None:
+        workers = settings.METRICS_WORKERS or os.cpu_count() or 1
+    # Small jobs are not worth starting processes for.
+    if len(test_run_ids) * max(map(len, references.values())) < 2 * similarity.CHUNK_SIZE:
+        workers = 1
+    with similarity.pool(workers) as executor:
+        return sum(_measure_batch(test_run_ids[start:start + BATCH_SIZE], references, executor)
+                   for start in range(0, len(test_run_ids), BATCH_SIZE))
@@ -0,0 +1,24 @@
+import unicodedata
+
+# Cantillation marks (te'amim) and vowel points (niqqud), including meteg, rafe,
+# shin/sin dots, upper/lower dots and qamats qatan.
+_MARKS = [chr(code) for code in range(0x0591, 0x05BE)] + ['\u05bf', '\u05c1', '\u05c2', '\u05c4', '\u05c5', '\u05c7']
+
+_FINAL_LETTERS = {'\u05da': '\u05db', '\u05dd': '\u05de', '\u05df': '\u05e0', '\u05e3': '\u05e4', '\u05e5': '\u05e6'}
+
+# Maqaf, paseq and sof pasuq separate words; geresh and gershayim (and their
+# ASCII stand-ins) only mark abbreviations, so they are dropped.
+_SEPARATORS = ['\u05be', '\u05c0', '\u05c3']
+_DROPPED = ['\u05f3', '\u05f4', '"', "'"]
+
+_TABLE = str.maketrans({
+    **{mark: None for mark in _MARKS},
+    **{mark: None for mark in _DROPPED},
+    **{separator: ' ' for separator in _SEPARATORS},
+    **_FINAL_LETTERS,
+})
+
+def normalize(text):
+    """Fold Hebrew text for matching: no niqqud or cantillation, no final letter forms."""
+    # NFKD also splits presentation forms such as U+FB2A (shin with shin dot) into letter + mark.
+    return unicodedata.normalize('NFKD', text).translate(_TABLE).lower()
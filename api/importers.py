@@ -0,0 +1,225 @@
+import csv
+import io
+import json
+import os
+import re
+from .models import Source, content_hash
+
+# Incremental readers for corpus dumps. Every reader is a generator of
+# (name, content) records that holds at most one record (and, for JSON, one
+# read buffer) in memory, so dumps of any size can be imported.
+
+FORMATS = ('json', 'jsonl', 'csv', 'txt')
+
+EXTENSIONS = {'.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv', '.txt': 'txt'}
+
+NAME_LENGTH = Source._meta.get_field('name').max_length
+
+class DumpError(ValueError):
+    pass
+
+class CountingReader(io.RawIOBase):
+    """Wraps a binary file and counts the bytes read from it, for progress reporting."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+def detect_format(path):
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+def _record(item, name_field, content_field, line):
+    if not isinstance(item, dict):
+        raise DumpError(f"Record {line} is not an object")
+    content = item.get(content_field)
+    if not isinstance(content, str):
+        raise DumpError(f"Record {line} has no '{content_field}' text")
+    return str(item.get(name_field) or ''), content
+
+def read_jsonl(stream, name_field='name', content_field='content'):
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                item = json.loads(line)
+            except ValueError as exc:
+                raise DumpError(f"Line {line_number}: {exc}") from exc
+            yield _record(item, name_field, content_field, line_number)
+
+def read_json(stream, name_field='name', content_field='content', read_size=1 << 16):
+    """Yield the objects of a top-level JSON array without loading the whole array."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill(size):
+        nonlocal buffer, position, eof
+        chunk = stream.read(size)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill(read_size)
+
+    skip_whitespace()
+    if buffer[position:position + 1] != '[':
+        raise DumpError("A JSON dump must be an array of objects")
+    position += 1
+    index = 0
+    while True:
+        skip_whitespace()
+        if buffer[position:position + 1] == ']':
+            return
+        if index:
+            if buffer[position:position + 1] != ',':
+                raise DumpError(f"Expected ',' or ']' after record {index}")
+            position += 1
+            skip_whitespace()
+        size = read_size
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                break
+            except ValueError as exc:
+                if eof:
+                    raise DumpError(f"Record {index + 1}: {exc}") from exc
+                # The record continues past the buffer; read more, doubling
+                # the read size so a huge record is not re-parsed many times.
+                fill(size)
+                size *= 2
+        position = end
+        index += 1
+        yield _record(item, name_field, content_field, index)
+
+def read_csv(stream, name_field='name', content_field='content'):
+    csv.field_size_limit(1 << 30)
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None or content_field not in reader.fieldnames:
+        raise DumpError(f"The CSV header has no '{content_field}' column")
+    for row in reader:
+        yield row.get(name_field) or '', row[content_field]
+
+def read_text(stream, name=''):
+    yield name, stream
+
+def split_sections(name, content, pattern=None, max_chars=None):
+    """Split one text into (name, content) sections.
+
+    `content` is a string or an iterable of lines. A line matching `pattern`
+    starts a new section named after that line; sections longer than
+    `max_chars` are further split at line boundaries into numbered parts.
+    """
+    lines = content.splitlines(keepends=True) if isinstance(content, str) else content
+    heading = None
+    section = []
+    size = 0
+    part = 0
+
+    def flush():
+        text = ''.join(section).strip()
+        if not text:
+            return None
+        title = ' '.join(filter(None, [name, heading]))
+        if part:
+            title = f"{title} ({part + 1})" if title else str(part + 1)
+        return (title or text.split('\n', 1)[0])[:NAME_LENGTH].strip(), text
+
+    for line in lines:
+        if pattern is not None and pattern.search(line):
+            record = flush()
+            if record:
+                yield record
+            heading, section, size, part = line.strip(), [], 0, 0
+            continue
+        if max_chars and size + len(line) > max_chars and section:
+            record = flush()
+            if record:
+                yield record
+            section, size, part = [], 0, part + 1
+        section.append(line)
+        size += len(line)
+    record = flush()
+    if record:
+        yield record
+
+def iter_sources(stream, file_format, name_field='name', content_field='content', name='',
+                 section_pattern=None, max_chars=None):
+    """Yield (name, content) Source records parsed from a text `stream`."""
+    pattern = re.compile(section_pattern) if section_pattern else None
+    if file_format == 'json':
+        records = read_json(stream, name_field, content_field)
+    elif file_format == 'jsonl':
+        records = read_jsonl(stream, name_field, content_field)
+    elif file_format == 'csv':
+        records = read_csv(stream, name_field, content_field)
+    elif file_format == 'txt':
+        records = read_text(stream, name)
+    else:
+        raise DumpError(f"Unknown format {file_format!r}; expected one of {', '.join(FORMATS)}")
+    for record_name, content in records:
+        yield from split_sections(record_name, content, pattern, max_chars)
+
+class Checkpoint:
+    """Import progress of one dump, rewritten atomically after every committed batch.
+
+    `options` are the parsing options; resuming with different ones would
+    split the dump into different records, so it is refused.
+    """
+
+    def __init__(self, path, source_path, options):
+        self.path = path
+        self.source_path = os.path.abspath(source_path)
+        self.options = options
+        self.records = 0
+        self.created = 0
+        self.skipped = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as file:
+            data = json.load(file)
+        if data.get('source') != self.source_path:
+            raise DumpError(f"Checkpoint {self.path} belongs to {data.get('source')}")
+        if data.get('options') != self.options:
+            raise DumpError(f"Checkpoint {self.path} was written with other options: {data.get('options')}")
+        self.records, self.created, self.skipped = data['records'], data['created'], data['skipped']
+        return True
+
+    def save(self):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as file:
+            json.dump({'source': self.source_path, 'options': self.options, 'records': self.records,
+                       'created': self.created, 'skipped': self.skipped}, file)
+        os.replace(temporary, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def new_sources(records):
+    """Sources for the records whose content is neither in the database nor earlier in `records`."""
+    hashes = [content_hash(content) for _, content in records]
+    existing = set(Source.objects.filter(content_hash__in=set(hashes)).values_list('content_hash', flat=True))
+    sources = []
+    for (name, content), digest in zip(records, hashes):
+        if digest not in existing:
+            existing.add(digest)
+            sources.append(Source(name=name, content=content.strip()))
+    return sources
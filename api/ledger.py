@@ -0,0 +1,89 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Budget, TestRun
+from .read_cache import read_cache
+
+# All ledger changes are single conditional UPDATE statements, so concurrent
+# workers never lose updates and never reserve past `daily_limit`. Transactions
+# here start with a write so SQLite takes its write lock up front. update()
+# sends no signals, so every budget write invalidates the read cache itself.
+
+class BudgetExceeded(Exception):
+    pass
+
+class AlreadyReserved(Exception):
+    pass
+
+class ReservationExhausted(Exception):
+    pass
+
+def reserve(amount, date=None):
+    """Reserve `amount` against the budget of `date` and return that budget's id."""
+    date = date or timezone.now().date()
+    amount = Decimal(amount)
+    budgets = Budget.objects.filter(date=date)
+    reserved = budgets.filter(
+        daily_limit__gte=F('current_usage') + F('reserved') + amount,
+    ).update(reserved=F('reserved') + amount)
+    if not reserved:
+        raise BudgetExceeded("Daily budget exceeded" if budgets.exists() else "No budget for today")
+    budget_id = budgets.values_list('id', flat=True).get()
+    read_cache.invalidate(Budget, [budget_id])
+    return budget_id
+
+def reserve_for_runs(test_runs, amounts, date=None):
+    """Reserve the estimated cost of several runs in one step; all or nothing."""
+    with transaction.atomic():
+        budget_id = reserve(sum(amounts, Decimal(0)), date)
+        for test_run, amount in zip(test_runs, amounts):
+            claimed = TestRun.objects.filter(pk=test_run.pk, budget__isnull=True).update(
+                budget_id=budget_id, reserved_cost=amount)
+            if not claimed:
+                raise AlreadyReserved(f"Test run {test_run.pk} is already queued")
+            test_run.budget_id = budget_id
+            test_run.reserved_cost = amount
+    return budget_id
+
+def settle(test_run, actual_cost):
+    """Replace the run's reservation with its actual cost.
+
+    Releasing a failed run is settling it with whatever it spent before failing.
+    Settling twice is a no-op for the reservation.
+    """
+    actual_cost = Decimal(actual_cost or 0)
+    reserved_cost = test_run.reserved_cost or Decimal(0)
+    with transaction.atomic():
+        if reserved_cost and not TestRun.objects.filter(pk=test_run.pk, reserved_cost=reserved_cost).update(reserved_cost=0):
+            reserved_cost = Decimal(0)
+        budgets = Budget.objects.filter(pk=test_run.budget_id) if test_run.budget_id else Budget.objects.filter(date=timezone.now().date())
+        budgets.update(reserved=F('reserved') - reserved_cost, current_usage=F('current_usage') + actual_cost)
+        read_cache.invalidate(Budget, [test_run.budget_id] if test_run.budget_id else None)
+    test_run.reserved_cost = Decimal(0)
+
+def charge(test_run, amount):
+    """Move `amount` a run has spent out of its reservation into usage; the run
+    keeps the rest of its reservation, for a run that pauses before finishing."""
+    amount = Decimal(amount or 0)
+    if not amount:
+        return
+    reserved_cost = test_run.reserved_cost or Decimal(0)
+    moved = min(amount, reserved_cost)
+    with transaction.atomic():
+        # The exact remainder, not F() arithmetic, so that settle's match on it holds.
+        if moved and not TestRun.objects.filter(pk=test_run.pk, reserved_cost=reserved_cost).update(
+                reserved_cost=reserved_cost - moved):
+            moved = Decimal(0)
+        budgets = Budget.objects.filter(pk=test_run.budget_id) if test_run.budget_id else Budget.objects.filter(date=timezone.now().date())
+        budgets.update(reserved=F('reserved') - moved, current_usage=F('current_usage') + amount)
+        read_cache.invalidate(Budget, [test_run.budget_id] if test_run.budget_id else None)
+    test_run.reserved_cost = reserved_cost - moved
+
+def add_usage(amount, date=None):
+    date = date or timezone.now().date()
+    budget, _ = Budget.objects.get_or_create(date=date, defaults={'daily_limit': 0})
+    Budget.objects.filter(pk=budget.pk).update(current_usage=F('current_usage') + Decimal(amount))
+    read_cache.invalidate(Budget, [budget.pk])
+    budget.refresh_from_db()
+    return budget
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from api import chunking
+from api.models import Source, LanguageModel
+
+
+class Command(BaseCommand):
+    help = "Store token counts and chunks of every source for the tokenizer types of all language models"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokenizer-type', action='append', dest='tokenizer_types',
+                            help="Count for this tokenizer type only (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        tokenizer_types = options['tokenizer_types'] or sorted(
+            set(LanguageModel.objects.values_list('tokenizer_type', flat=True)))
+        batch_size = options['batch_size']
+        source_ids = list(Source.objects.order_by('id').values_list('id', flat=True))
+        for tokenizer_type in tokenizer_types:
+            for start in range(0, len(source_ids), batch_size):
+                # Sources are loaded without their text; token_counts reads only
+                # the texts of sources whose counts are missing or outdated.
+                chunking.token_counts(Source.objects.filter(id__in=source_ids[start:start + batch_size]), tokenizer_type)
+            self.stdout.write(self.style.SUCCESS(f"Counted {len(source_ids)} sources for {tokenizer_type}"))
@@ -0,0 +1,90 @@
+import io
+import os
+import time
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries, transaction
+from api import retrieval, search
+from api.importers import FORMATS, Checkpoint, CountingReader, DumpError, detect_format, iter_sources, new_sources
+from api.models import Source
+from api.read_cache import read_cache
+
+# Without a section pattern, plain-text dumps are cut into Sources of at most this many characters.
+TEXT_MAX_CHARS = 20000
+
+
+class Command(BaseCommand):
+    help = "Import Sources from a JSON, JSONL, CSV or plain-text dump, resuming from a checkpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Dump format; by default taken from the file extension")
+        parser.add_argument('--name-field', default='name', help="Field or column holding the source name")
+        parser.add_argument('--content-field', default='content', help="Field or column holding the text")
+        parser.add_argument('--name', help="Name of a plain-text dump, prefixed to its section names")
+        parser.add_argument('--section-pattern', help="Regular expression; a matching line starts a new Source named after it")
+        parser.add_argument('--max-chars', type=int, help="Split sections longer than this at line boundaries")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Sources written per transaction")
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--checkpoint', help="Checkpoint file; defaults to PATH.checkpoint.json")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint and start over")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        if file_format is None:
+            raise CommandError(f"Cannot tell the format of {path}; pass --format")
+        max_chars = options['max_chars']
+        if file_format == 'txt' and not options['section_pattern'] and not max_chars:
+            max_chars = TEXT_MAX_CHARS
+        parsing = {
+            'format': file_format,
+            'name_field': options['name_field'],
+            'content_field': options['content_field'],
+            'name': options['name'] if options['name'] is not None else os.path.splitext(os.path.basename(path))[0],
+            'section_pattern': options['section_pattern'],
+            'max_chars': max_chars,
+        }
+        checkpoint = Checkpoint(options['checkpoint'] or f"{path}.checkpoint.json", path, parsing)
+        try:
+            if options['restart']:
+                checkpoint.delete()
+            elif checkpoint.load():
+                self.stdout.write(f"Resuming after {checkpoint.records} records")
+            self._import(path, parsing, checkpoint, options)
+        except (DumpError, OSError) as exc:
+            raise CommandError(str(exc))
+        checkpoint.delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {checkpoint.records} records: {checkpoint.created} created, {checkpoint.skipped} already present"))
+
+    def _import(self, path, parsing, checkpoint, options):
+        total_bytes = os.path.getsize(path) or 1
+        started = time.monotonic()
+        resumed_at = checkpoint.records
+        with open(path, 'rb') as raw:
+            counter = CountingReader(raw)
+            stream = io.TextIOWrapper(io.BufferedReader(counter), encoding=options['encoding'],
+                                      newline='' if parsing['format'] == 'csv' else None)
+            records = iter_sources(stream, parsing['format'], parsing['name_field'], parsing['content_field'],
+                                   parsing['name'], parsing['section_pattern'], parsing['max_chars'])
+            records = islice(records, checkpoint.records, None)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    sources = Source.objects.bulk_create(new_sources(batch))
+                    search.index_objects('source', sources)
+                    retrieval.index_objects('source', sources)
+                    read_cache.invalidate(Source, [source.pk for source in sources])
+                checkpoint.records += len(batch)
+                checkpoint.created += len(sources)
+                checkpoint.skipped += len(batch) - len(sources)
+                checkpoint.save()
+                # With DEBUG on, every query (and its parameters) would stay in the query log.
+                reset_queries()
+                rate = (checkpoint.records - resumed_at) / max(time.monotonic() - started, 1e-9)
+                self.stdout.write(
+                    f"{checkpoint.records} records ({checkpoint.created} created, {checkpoint.skipped} skipped), "
+                    f"{min(counter.bytes_read / total_bytes, 1):.0%} of the file, {rate:.0f} records/s")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api import analytics
+
+
+class Command(BaseCommand):
+    help = "Recompute the leaderboard rollups from evaluations and test runs"
+
+    def handle(self, *args, **options):
+        models, groups = analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {models} language models and {groups} model/test pairs"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from api import search
+from api.models import Source, Introduction
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of sources and introductions"
+
+    def handle(self, *args, **options):
+        sources = search.rebuild('source', Source.objects.with_text())
+        introductions = search.rebuild('introduction', Introduction.objects.with_text())
+        self.stdout.write(self.style.SUCCESS(f"Indexed {sources} sources and {introductions} introductions"))
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.14 on 2026-10-18 10:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_test_questions_run_cost_precision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestRunBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.test')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='test_runs', to='api.testrunbatch'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.14 on 2026-10-18 10:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_test_run_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budget',
+            name='reserved',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='budget',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='test_runs', to='api.budget'),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='reserved_cost',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='budget',
+            name='current_usage',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=12),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_budget_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testrun',
+            name='introductions',
+            field=models.ManyToManyField(blank=True, related_name='test_runs', to='api.introduction'),
+        ),
+    ]
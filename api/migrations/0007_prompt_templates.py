@@ -0,0 +1,23 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_response_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='languagemodel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='sources',
+            field=models.ManyToManyField(blank=True, related_name='tests', to='api.source'),
+        ),
+    ]
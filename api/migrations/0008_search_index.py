@@ -0,0 +1,82 @@
+import unicodedata
+from django.db import migrations
+
+# A frozen copy of the index layout and Hebrew normalization of api.search and
+# api.hebrew as of this migration; later changes to those modules must not
+# change what it creates.
+
+TABLE = 'api_search_index'
+KINDS = ('source', 'introduction')
+
+_MARKS = [chr(code) for code in range(0x0591, 0x05BE)] + ['\u05bf', '\u05c1', '\u05c2', '\u05c4', '\u05c5', '\u05c7']
+_FINAL_LETTERS = {'\u05da': '\u05db', '\u05dd': '\u05de', '\u05df': '\u05e0', '\u05e3': '\u05e4', '\u05e5': '\u05e6'}
+_SEPARATORS = ['\u05be', '\u05c0', '\u05c3']
+_DROPPED = ['\u05f3', '\u05f4', '"', "'"]
+_NORMALIZE = str.maketrans({
+    **{mark: None for mark in _MARKS},
+    **{mark: None for mark in _DROPPED},
+    **{separator: ' ' for separator in _SEPARATORS},
+    **_FINAL_LETTERS,
+})
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKD', text).translate(_NORMALIZE).lower()
+
+
+def sqlite_table(kind):
+    return f"{TABLE}_{kind}"
+
+
+def documents(apps):
+    for obj in apps.get_model('api', 'Source').objects.all():
+        yield 'source', obj.pk, normalize(obj.name), normalize(obj.content)
+    for obj in apps.get_model('api', 'Introduction').objects.all():
+        yield 'introduction', obj.pk, '', normalize(obj.content)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for kind in KINDS:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {sqlite_table(kind)} USING fts5("
+                "name, content, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        with schema_editor.connection.cursor() as cursor:
+            for kind, object_id, name, content in documents(apps):
+                cursor.execute(f"INSERT INTO {sqlite_table(kind)} (rowid, name, content) VALUES (%s, %s, %s)",
+                               [object_id, name, content])
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE {TABLE} ("
+            "kind varchar(20) NOT NULL, object_id bigint NOT NULL, name text NOT NULL, content text NOT NULL, "
+            "document tsvector NOT NULL, PRIMARY KEY (kind, object_id))"
+        )
+        schema_editor.execute(f"CREATE INDEX {TABLE}_document ON {TABLE} USING GIN (document)")
+        with schema_editor.connection.cursor() as cursor:
+            for kind, object_id, name, content in documents(apps):
+                cursor.execute(
+                    f"INSERT INTO {TABLE} (kind, object_id, name, content, document) VALUES (%s, %s, %s, %s, "
+                    "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B'))",
+                    [kind, object_id, name, content, name, content])
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for kind in KINDS:
+            schema_editor.execute(f"DROP TABLE IF EXISTS {sqlite_table(kind)}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_prompt_templates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:26
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+import django.db.models.deletion
+
+# A frozen copy of api.analytics.rebuild as of this migration, so that later
+# changes to it or to the models it reads do not change what this creates.
+
+FINISHED_STATUSES = ('completed', 'failed')
+TOTALS = ('evaluation_count', 'score_sum', 'score_sum_sq', 'run_count', 'total_cost', 'latency_sum')
+
+
+def build_rollups(apps, schema_editor):
+    Evaluation = apps.get_model('api', 'Evaluation')
+    TestRun = apps.get_model('api', 'TestRun')
+    ModelTestStats = apps.get_model('api', 'ModelTestStats')
+    ModelStats = apps.get_model('api', 'ModelStats')
+    groups = {}
+
+    def group(language_model_id, test_id):
+        key = (language_model_id, test_id)
+        if key not in groups:
+            groups[key] = ModelTestStats(language_model_id=language_model_id, test_id=test_id)
+        return groups[key]
+
+    scores = (Evaluation.objects
+              .values('test_run__language_model', 'test_run__test')
+              .annotate(count=Count('id'), total=Sum('score'), total_sq=Sum(F('score') * F('score')),
+                        low=Min('score'), high=Max('score'))
+              .order_by())
+    for row in scores:
+        stats = group(row['test_run__language_model'], row['test_run__test'])
+        stats.evaluation_count = row['count']
+        stats.score_sum = row['total']
+        stats.score_sum_sq = row['total_sq']
+        stats.score_min = row['low']
+        stats.score_max = row['high']
+
+    runs = (TestRun.objects.filter(status__in=FINISHED_STATUSES, completed_at__isnull=False)
+            .values('language_model_id', 'test_id', 'cost', 'started_at', 'completed_at'))
+    for run in runs.iterator():
+        stats = group(run['language_model_id'], run['test_id'])
+        stats.run_count += 1
+        stats.total_cost += Decimal(run['cost'] or 0)
+        if run['started_at'] is not None:
+            stats.latency_sum += (run['completed_at'] - run['started_at']).total_seconds()
+
+    totals = {}
+    for stats in groups.values():
+        if stats.language_model_id not in totals:
+            totals[stats.language_model_id] = ModelStats(language_model_id=stats.language_model_id)
+        total = totals[stats.language_model_id]
+        for field in TOTALS:
+            setattr(total, field, getattr(total, field) + getattr(stats, field))
+        if stats.score_min is not None:
+            total.score_min = stats.score_min if total.score_min is None else min(total.score_min, stats.score_min)
+            total.score_max = stats.score_max if total.score_max is None else max(total.score_max, stats.score_max)
+
+    ModelTestStats.objects.bulk_create(groups.values(), batch_size=1000)
+    ModelStats.objects.bulk_create(totals.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelTestStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evaluation_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_sum_sq', models.FloatField(default=0)),
+                ('score_min', models.FloatField(blank=True, null=True)),
+                ('score_max', models.FloatField(blank=True, null=True)),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+                ('latency_sum', models.FloatField(default=0)),
+                ('language_model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_stats', to='api.languagemodel')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='model_stats', to='api.test')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ModelStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evaluation_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_sum_sq', models.FloatField(default=0)),
+                ('score_min', models.FloatField(blank=True, null=True)),
+                ('score_max', models.FloatField(blank=True, null=True)),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+                ('latency_sum', models.FloatField(default=0)),
+                ('language_model', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='api.languagemodel')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='modelteststats',
+            constraint=models.UniqueConstraint(fields=('language_model', 'test'), name='unique_model_test_stats'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
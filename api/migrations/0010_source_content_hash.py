@@ -0,0 +1,37 @@
+import hashlib
+from django.db import migrations
+import api.models
+
+
+# A frozen copy of api.models.content_hash as of this migration.
+def content_hash(text):
+    return hashlib.sha256(text.strip().encode()).hexdigest()
+
+
+def fill_content_hashes(apps, schema_editor):
+    Source = apps.get_model('api', 'Source')
+    batch = []
+    for source in Source.objects.only('id', 'content').iterator(chunk_size=1000):
+        source.content_hash = content_hash(source.content)
+        batch.append(source)
+        if len(batch) == 1000:
+            Source.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    Source.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='content_hash',
+            field=api.models.ContentHashField(db_index=True, default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_content_hashes, migrations.RunPython.noop),
+    ]
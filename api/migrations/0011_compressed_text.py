@@ -0,0 +1,85 @@
+from django.db import migrations, models
+import api.models
+
+# Each text column is copied into a new compressed binary column, then
+# replaced by it; converting in place would need a text-to-bytea cast. The old
+# columns are made nullable first so that unapplying can add them back.
+
+FIELDS = (
+    ('Source', 'content'),
+    ('Introduction', 'content'),
+    ('TestRun', 'result'),
+)
+
+
+def copy_texts(apps, source_field, target_field):
+    for model_name, field in FIELDS:
+        model = apps.get_model('api', model_name)
+        batch = []
+        rows = model.objects.values_list('id', source_field.format(field)).iterator(chunk_size=1000)
+        for pk, text in rows:
+            batch.append(model(pk=pk, **{target_field.format(field): text}))
+            if len(batch) == 1000:
+                model.objects.bulk_update(batch, [target_field.format(field)])
+                batch = []
+        model.objects.bulk_update(batch, [target_field.format(field)])
+
+
+def compress(apps, schema_editor):
+    copy_texts(apps, '{}', '{}_compressed')
+
+
+def decompress(apps, schema_editor):
+    copy_texts(apps, '{}_compressed', '{}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_source_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='source',
+            name='content',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='introduction',
+            name='content',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='source',
+            name='content_compressed',
+            field=api.models.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='introduction',
+            name='content_compressed',
+            field=api.models.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='result_compressed',
+            field=api.models.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress, decompress),
+        migrations.RemoveField(model_name='source', name='content'),
+        migrations.RemoveField(model_name='introduction', name='content'),
+        migrations.RemoveField(model_name='testrun', name='result'),
+        migrations.RenameField(model_name='source', old_name='content_compressed', new_name='content'),
+        migrations.RenameField(model_name='introduction', old_name='content_compressed', new_name='content'),
+        migrations.RenameField(model_name='testrun', old_name='result_compressed', new_name='result'),
+        migrations.AlterField(
+            model_name='source',
+            name='content',
+            field=api.models.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='introduction',
+            name='content',
+            field=api.models.CompressedTextField(),
+        ),
+    ]
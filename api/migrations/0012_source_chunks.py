@@ -0,0 +1,55 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_compressed_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='languagemodel',
+            name='context_window',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SourceTokenCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tokenizer_type', models.CharField(max_length=100)),
+                ('source_updated_at', models.DateTimeField()),
+                ('name_tokens', models.PositiveIntegerField()),
+                ('token_count', models.PositiveIntegerField()),
+                ('chunk_tokens', models.PositiveIntegerField()),
+                ('overlap_tokens', models.PositiveIntegerField()),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_counts', to='api.source')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SourceChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('start', models.PositiveIntegerField()),
+                ('end', models.PositiveIntegerField()),
+                ('start_token', models.PositiveIntegerField()),
+                ('end_token', models.PositiveIntegerField()),
+                ('source_token_count', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.sourcetokencount')),
+            ],
+            options={
+                'ordering': ['source_token_count', 'index'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sourcetokencount',
+            constraint=models.UniqueConstraint(fields=('source', 'tokenizer_type'), name='unique_source_token_count'),
+        ),
+        migrations.AddConstraint(
+            model_name='sourcechunk',
+            constraint=models.UniqueConstraint(fields=('source_token_count', 'index'), name='unique_source_chunk'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evaluation',
+            name='is_automatic',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='test_type',
+            field=models.CharField(choices=[('open', 'Open'), ('multiple_choice', 'Multiple Choice'), ('short_answer', 'Short Answer')], default='open', max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='evaluation',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_automatic', True)), fields=('test_run',), name='unique_automatic_evaluation'),
+        ),
+    ]
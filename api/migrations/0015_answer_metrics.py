@@ -0,0 +1,26 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_automatic_grading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chrf', models.FloatField(db_index=True)),
+                ('rouge_l', models.FloatField(db_index=True)),
+                ('token_f1', models.FloatField(db_index=True)),
+                ('questions', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('test_run', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='answer_metrics', to='api.testrun')),
+            ],
+        ),
+    ]
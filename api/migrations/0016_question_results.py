@@ -0,0 +1,36 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:51
+
+import api.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_answer_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('prompt_hash', models.CharField(max_length=64)),
+                ('answer', api.models.CompressedTextField(blank=True, default='')),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('latency', models.FloatField(default=0)),
+                ('cost', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('cached', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('test_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_results', to='api.testrun')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='questionresult',
+            constraint=models.UniqueConstraint(fields=('test_run', 'index'), name='unique_question_result'),
+        ),
+    ]
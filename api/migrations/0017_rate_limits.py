@@ -0,0 +1,33 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_question_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=201, unique=True)),
+                ('requests', models.FloatField(default=0)),
+                ('tokens', models.FloatField(default=0)),
+                ('updated_at', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='languagemodel',
+            name='requests_per_minute',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='languagemodel',
+            name='tokens_per_minute',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
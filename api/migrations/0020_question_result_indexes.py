@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_paused_test_runs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='questionresult',
+            index=models.Index(condition=models.Q(('error__isnull', True)), fields=['test_run', 'index', 'prompt_hash'], name='answered_question_results'),
+        ),
+        migrations.AddIndex(
+            model_name='questionresult',
+            index=models.Index(fields=['test_run', 'cost'], name='question_result_costs'),
+        ),
+    ]
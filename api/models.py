@@ -1,17 +1,183 @@
+import hashlib
+import zlib
+from decimal import Decimal
+from django.conf import settings
 from django.db import models
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def content_hash(text):
+    return hashlib.sha256(text.strip().encode()).hexdigest()
+
+class ContentHashField(models.CharField):
+    """SHA-256 of the instance's stripped `content`, recomputed whenever the field is saved."""
+
+    derived = True
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 64)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('db_index', True)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        if 'content' in model_instance.get_deferred_fields():
+            # Saving an instance loaded without its text leaves the text, and so its hash, unchanged.
+            return getattr(model_instance, self.attname)
+        value = content_hash(model_instance.content)
+        setattr(model_instance, self.attname, value)
+        return value
+
+# Stored text starts with one byte naming its encoding. Short or
+# incompressible texts are kept as plain UTF-8.
+RAW, ZLIB, ZSTD = b'\x00', b'\x01', b'\x02'
+
+def compress_text(text):
+    data = text.encode('utf-8')
+    if len(data) < settings.TEXT_COMPRESSION_MIN_BYTES:
+        return RAW + data
+    if settings.TEXT_COMPRESSION == 'zstd' and zstandard is not None:
+        compressed = ZSTD + zstandard.ZstdCompressor(level=settings.TEXT_COMPRESSION_LEVEL).compress(data)
+    else:
+        compressed = ZLIB + zlib.compress(data, settings.TEXT_COMPRESSION_LEVEL)
+    return compressed if len(compressed) < len(data) + 1 else RAW + data
+
+def decompress_text(data):
+    data = bytes(data)
+    kind, payload = data[:1], data[1:]
+    if kind == ZLIB:
+        payload = zlib.decompress(payload)
+    elif kind == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Text was compressed with zstd; install zstandard to read it")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    elif kind != RAW:
+        raise ValueError(f"Unknown text encoding {kind!r}")
+    return payload.decode('utf-8')
+
+class CompressedTextField(models.TextField):
+    """Text stored compressed in a binary column; reads and writes str.
+
+    The column cannot be searched or filtered on by content. Models with such
+    fields use TextManager, which defers them unless asked for `with_text()`.
+    """
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        return None if value is None else compress_text(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        return None if value is None else connection.Database.Binary(value)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            return value
+        return decompress_text(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return decompress_text(value)
+        return super().to_python(value)
+
+def text_fields(model):
+    return {field.name for field in model._meta.concrete_fields if isinstance(field, CompressedTextField)}
+
+class TextQuerySet(models.QuerySet):
+    def with_text(self):
+        """Also load the text fields TextManager defers, keeping any other deferral."""
+        clone = self._chain()
+        names, deferring = clone.query.deferred_loading
+        if deferring:
+            clone.query.deferred_loading = (frozenset(names) - text_fields(self.model), True)
+        return clone
+
+class TextManager(models.Manager.from_queryset(TextQuerySet)):
+    """Defers the model's CompressedTextFields, so lists and lookups never read
+    long texts they do not use; a deferred field is loaded on first access."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer(*text_fields(self.model))
+
 class Source(models.Model):
     name = models.CharField(max_length=100)
-    content = models.TextField()
+    content = CompressedTextField()
+    content_hash = ContentHashField()
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TextManager()
 
     def __str__(self):
         return self.name
 
+class SourceTokenCount(models.Model):
+    """Token count of a source under one tokenizer type, with its chunks.
+
+    Kept by api.chunking and recomputed when the source's `updated_at` or the
+    chunk settings change.
+    """
+
+    source = models.ForeignKey(Source, on_delete=models.CASCADE, related_name='token_counts')
+    tokenizer_type = models.CharField(max_length=100)
+    source_updated_at = models.DateTimeField()
+    name_tokens = models.PositiveIntegerField()
+    token_count = models.PositiveIntegerField()
+    chunk_tokens = models.PositiveIntegerField()
+    overlap_tokens = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'tokenizer_type'], name='unique_source_token_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.source_id} ({self.tokenizer_type}): {self.token_count} tokens"
+
+class SourceChunk(models.Model):
+    """Tokens [start_token, end_token) of a source, characters [start, end) of its content.
+
+    Consecutive chunks overlap by up to `overlap_tokens`, and every chunk end
+    is a place where the source can be cut.
+    """
+
+    source_token_count = models.ForeignKey(SourceTokenCount, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    start = models.PositiveIntegerField()
+    end = models.PositiveIntegerField()
+    start_token = models.PositiveIntegerField()
+    end_token = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['source_token_count', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['source_token_count', 'index'], name='unique_source_chunk'),
+        ]
+
+    def __str__(self):
+        return f"Chunk {self.index} of {self.source_token_count}"
+
 class Test(models.Model):
+    # Closed tests give every question an answer key ({"question": ..., "answer": ...})
+    # and their completed runs are graded automatically by api.grading.
+    TEST_TYPE_CHOICES = [
+        ('open', 'Open'),
+        ('multiple_choice', 'Multiple Choice'),
+        ('short_answer', 'Short Answer'),
+    ]
+
     name = models.CharField(max_length=100)
     description = models.TextField()
+    test_type = models.CharField(max_length=20, choices=TEST_TYPE_CHOICES, default='open')
+    questions = models.JSONField(default=list, blank=True)
+    sources = models.ManyToManyField(Source, blank=True, related_name='tests')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -19,9 +185,11 @@ class Test(models.Model):
         return self.name
 
 class Introduction(models.Model):
-    content = models.TextField()
+    content = CompressedTextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TextManager()
 
     def __str__(self):
         return f"Introduction {self.id}"
@@ -34,42 +202,226 @@ class LanguageModel(models.Model):
     tokenizer_type = models.CharField(max_length=100)
     input_cost_per_1k_tokens = models.DecimalField(max_digits=10, decimal_places=4)
     output_cost_per_1k_tokens = models.DecimalField(max_digits=10, decimal_places=4)
+    # Prompt plus completion tokens the model accepts; sources are packed to fit. Unknown if null.
+    context_window = models.PositiveIntegerField(null=True, blank=True)
+    # Provider rate limits (api.rate_limits), shared by the models with the same library and name. Unlimited if null.
+    requests_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    tokens_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def calculate_cost(self, input_tokens, output_tokens):
+        return (Decimal(input_tokens) * self.input_cost_per_1k_tokens
+                + Decimal(output_tokens) * self.output_cost_per_1k_tokens) / 1000
+
+class RateLimitBucket(models.Model):
+    # Token bucket levels of one provider model (api.rate_limits). Levels go
+    # negative while calls wait for reserved capacity; updated_at is the Unix
+    # time they were last refilled.
+    key = models.CharField(max_length=201, unique=True)
+    requests = models.FloatField(default=0)
+    tokens = models.FloatField(default=0)
+    updated_at = models.FloatField(default=0)
+
+    def __str__(self):
+        return self.key
+
+class CircuitBreaker(models.Model):
+    # Circuit breaker of one language model's provider calls (api.resilience),
+    # shared by all workers, with counters of what happened to those calls.
+    STATE_CHOICES = [
+        ('closed', 'Closed'),
+        ('open', 'Open'),
+        ('half_open', 'Half open'),
+    ]
+
+    language_model = models.OneToOneField(LanguageModel, on_delete=models.CASCADE, related_name='circuit_breaker')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='closed')
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    # When the circuit opened, or when the current probe call started.
+    opened_at = models.DateTimeField(null=True, blank=True)
+    successes = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    timeouts = models.PositiveIntegerField(default=0)
+    retries = models.PositiveIntegerField(default=0)
+    hedges = models.PositiveIntegerField(default=0)
+    rejections = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Circuit breaker of {self.language_model_id}"
+
+class TestRunBatch(models.Model):
+    test = models.ForeignKey(Test, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Batch {self.id}"
+
 class TestRun(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('in_progress', 'In Progress'),
+        ('paused', 'Paused'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
     ]
     
     test = models.ForeignKey(Test, on_delete=models.CASCADE)
     language_model = models.ForeignKey(LanguageModel, on_delete=models.CASCADE)
+    batch = models.ForeignKey(TestRunBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='test_runs')
+    introductions = models.ManyToManyField(Introduction, blank=True, related_name='test_runs')
+    budget = models.ForeignKey('Budget', on_delete=models.SET_NULL, null=True, blank=True, related_name='test_runs')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
-    result = models.TextField(null=True, blank=True)
-    cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # When a paused run is due to be queued again (api.runner.requeue_paused).
+    resume_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    result = CompressedTextField(null=True, blank=True)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, null=True, blank=True)
+    reserved_cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    use_cache = models.BooleanField(default=True)
+    cache_hits = models.PositiveIntegerField(default=0)
+
+    objects = TextManager()
 
     def __str__(self):
         return f"{self.test.name} - {self.language_model.name} - {self.status}"
 
+class QuestionResult(models.Model):
+    # One row per question of a test run, inserted in batches while the run
+    # executes, so a failed run keeps the answers it already paid for and can
+    # be resumed; a question whose call failed has `error` set. `prompt_hash`
+    # tells whether a resumed run would send the same prompt again. A row's
+    # cost covers every attempt at its question, so a run's cost is the sum
+    # of its rows'.
+    test_run = models.ForeignKey(TestRun, on_delete=models.CASCADE, related_name='question_results')
+    index = models.PositiveIntegerField()
+    prompt_hash = models.CharField(max_length=64)
+    answer = CompressedTextField(blank=True, default='')
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    latency = models.FloatField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    cached = models.BooleanField(default=False)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TextManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test_run', 'index'], name='unique_question_result'),
+        ]
+        indexes = [
+            # The answers grading and resuming read, and the costs a run's total is summed from.
+            models.Index(fields=['test_run', 'index', 'prompt_hash'], condition=models.Q(error__isnull=True),
+                         name='answered_question_results'),
+            models.Index(fields=['test_run', 'cost'], name='question_result_costs'),
+        ]
+
+    def __str__(self):
+        return f"Question {self.index} of {self.test_run_id}"
+
+class CachedResponse(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    text = models.TextField()
+    input_tokens = models.PositiveIntegerField()
+    output_tokens = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
 class Evaluation(models.Model):
     test_run = models.ForeignKey(TestRun, on_delete=models.CASCADE)
     score = models.FloatField()
     comments = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    is_automatic = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test_run'], condition=models.Q(is_automatic=True),
+                                    name='unique_automatic_evaluation'),
+        ]
 
     def __str__(self):
         return f"Evaluation for {self.test_run}"
 
+class AnswerMetrics(models.Model):
+    # Similarity of a run's answers to the reference answers of its open
+    # questions (api.similarity), averaged over the questions that have one;
+    # `questions` holds each question's scores, or None where it has no reference.
+    test_run = models.OneToOneField(TestRun, on_delete=models.CASCADE, related_name='answer_metrics')
+    chrf = models.FloatField(db_index=True)
+    rouge_l = models.FloatField(db_index=True)
+    token_f1 = models.FloatField(db_index=True)
+    questions = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Answer metrics for {self.test_run}"
+
 class Budget(models.Model):
     date = models.DateField(unique=True)
     daily_limit = models.DecimalField(max_digits=10, decimal_places=2)
-    current_usage = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    current_usage = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    reserved = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+
+    def __str__(self):
+        return f"Budget for {self.date}"
+
+class RollupStats(models.Model):
+    """Running totals over evaluations and finished test runs, kept by api.analytics."""
+
+    evaluation_count = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_sum_sq = models.FloatField(default=0)
+    score_min = models.FloatField(null=True, blank=True)
+    score_max = models.FloatField(null=True, blank=True)
+    run_count = models.PositiveIntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+    latency_sum = models.FloatField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def mean_score(self):
+        if not self.evaluation_count:
+            return None
+        return self.score_sum / self.evaluation_count
+
+    @property
+    def score_variance(self):
+        if not self.evaluation_count:
+            return None
+        return max(self.score_sum_sq / self.evaluation_count - self.mean_score ** 2, 0.0)
+
+    @property
+    def average_latency(self):
+        if not self.run_count:
+            return None
+        return self.latency_sum / self.run_count
+
+class ModelTestStats(RollupStats):
+    language_model = models.ForeignKey(LanguageModel, on_delete=models.CASCADE, related_name='test_stats')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='model_stats')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['language_model', 'test'], name='unique_model_test_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.language_model} on {self.test}"
+
+class ModelStats(RollupStats):
+    language_model = models.OneToOneField(LanguageModel, on_delete=models.CASCADE, related_name='stats')
 
     def __str__(self):
-        return f"Budget for {self.date}"
\ No newline at end of file
+        return f"Stats for {self.language_model}"
@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+class IdCursorPagination(CursorPagination):
+    """Cursor pagination on the primary key, so every page is an index range scan."""
+
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+class OffsetPagination(LimitOffsetPagination):
+    """For lists sorted on non-unique values, where a cursor on the first sort key
+    would skip or repeat rows with equal values."""
+
+    default_limit = 50
+    max_limit = 1000
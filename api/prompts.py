@@ -0,0 +1,180 @@
+import threading
+from collections import Counter
+from string import Formatter
+from django.conf import settings
+from . import chunking
+from .tokenizers import get_tokenizer
+
+# Placeholders a LanguageModel.prompt_template may use, e.g.
+# "Read the sources:\n{sources}\n\nAnswer: {question}". Literal braces are written {{ and }}.
+PLACEHOLDERS = ('question', 'test_name', 'test_description', 'introductions', 'sources')
+
+# Layout of templates without placeholders: the template is followed by the
+# introductions, sources, test description and question, blank-line separated.
+DEFAULT_LAYOUT = ('introductions', 'sources', 'test_description', 'question')
+
+class TemplateError(ValueError):
+    pass
+
+class CompiledTemplate:
+    """A prompt template parsed once into literal text and placeholder slots."""
+
+    def __init__(self, template):
+        self.template = template
+        self.segments = []
+        for literal, field_name, format_spec, conversion in self._parse(template):
+            if literal:
+                self.segments.append((literal, None))
+            if field_name is None:
+                continue
+            if field_name not in PLACEHOLDERS:
+                raise TemplateError(f"Unknown placeholder {{{field_name}}}; expected one of {', '.join(PLACEHOLDERS)}")
+            if format_spec or conversion:
+                raise TemplateError(f"Placeholder {{{field_name}}} cannot have a format spec or conversion")
+            self.segments.append((None, field_name))
+        self.fields = [field for _, field in self.segments if field]
+        self.uses_default_layout = not self.fields
+        self.literal_text = "".join(literal for literal, _ in self.segments if literal)
+
+    @staticmethod
+    def _parse(template):
+        try:
+            return list(Formatter().parse(template))
+        except ValueError as exc:
+            raise TemplateError(str(exc)) from exc
+
+    def field_counts(self):
+        if self.uses_default_layout:
+            return Counter(DEFAULT_LAYOUT)
+        return Counter(self.fields)
+
+    def render(self, context):
+        return self.render_batch(context, [context['question']])[0]
+
+    def render_batch(self, context, questions):
+        """Render one prompt per question, substituting the shared context only once."""
+        return list(self.iter_render(context, questions))
+
+    def iter_render(self, context, questions):
+        """Like `render_batch`, but yields prompts one at a time so large sources are not held N times."""
+        if self.uses_default_layout:
+            head = "\n\n".join(part for part in [self.literal_text] + [context[field] for field in DEFAULT_LAYOUT[:-1]] if part)
+            for question in questions:
+                yield "\n\n".join(part for part in (head, question) if part) if question != context['test_description'] else head
+            return
+        pieces = []
+        for literal, field in self.segments:
+            if field == 'question':
+                pieces.append(None)
+            else:
+                text = literal if field is None else context[field]
+                if pieces and pieces[-1] is not None:
+                    pieces[-1] += text
+                else:
+                    pieces.append(text)
+        for question in questions:
+            yield "".join(question if piece is None else piece for piece in pieces)
+
+def compile_template(template):
+    return CompiledTemplate(template)
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+def get_template(language_model):
+    """Return the compiled prompt template of `language_model`, cached by id and `updated_at`."""
+    if language_model.pk is None:
+        return compile_template(language_model.prompt_template)
+    version = language_model.updated_at
+    cached = _compiled.get(language_model.pk)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    compiled = compile_template(language_model.prompt_template)
+    with _compiled_lock:
+        _compiled[language_model.pk] = (version, compiled)
+    return compiled
+
+def question_text(item):
+    if isinstance(item, dict):
+        return item.get('question', '')
+    return str(item)
+
+def get_questions(test):
+    questions = [question_text(item) for item in test.questions]
+    return questions or [test.description]
+
+def get_introductions(test_run):
+    if test_run.pk is None:
+        return []
+    return list(test_run.introductions.with_text().order_by('id'))
+
+def get_sources(test):
+    if test.pk is None:
+        return []
+    return list(test.sources.with_text().order_by('id'))
+
+def format_introductions(introductions):
+    return "\n\n".join(introduction.content for introduction in introductions)
+
+def format_sources(sources):
+    return "\n\n".join(f"{source.name}\n{source.content}" for source in sources)
+
+def build_context(test, introductions=(), sources=(), sources_text=None):
+    return {
+        'test_name': test.name,
+        'test_description': test.description,
+        'introductions': format_introductions(introductions),
+        'sources': format_sources(sources) if sources_text is None else sources_text,
+    }
+
+def sources_budget(language_model, other_tokens, max_output_tokens):
+    """Tokens each {sources} placeholder may use in the model's context window.
+
+    `other_tokens` counts the rest of the prompt. None when the context window
+    is unknown or the template does not use sources.
+    """
+    occurrences = get_template(language_model).field_counts()['sources']
+    if language_model.context_window is None or not occurrences:
+        return None
+    return max((language_model.context_window - max_output_tokens - other_tokens) // occurrences, 0)
+
+def tokens_besides_sources(language_model, test, introductions):
+    """Tokens of the longest prompt of `test`, leaving out its sources."""
+    tokenizer = get_tokenizer(language_model.tokenizer_type)
+    template = get_template(language_model)
+    fields = template.field_counts()
+    return (tokenizer.count(template.literal_text)
+            + fields['test_name'] * tokenizer.count(test.name)
+            + fields['test_description'] * tokenizer.count(test.description)
+            + fields['introductions'] * tokenizer.count(format_introductions(introductions))
+            + fields['question'] * max(tokenizer.count(question) for question in get_questions(test)))
+
+def fit_sources(language_model, test, introductions, sources, max_output_tokens):
+    """The sources text of a prompt, cut at chunk ends to fit the model's context window."""
+    budget = None
+    if language_model.context_window is not None and sources:
+        budget = sources_budget(language_model, tokens_besides_sources(language_model, test, introductions), max_output_tokens)
+    if budget is None:
+        return format_sources(sources)
+    rows = chunking.token_counts(sources, language_model.tokenizer_type)
+    selection, _, _ = chunking.pack([rows[source.pk] for source in sources], budget,
+                                    chunking.separator_tokens(language_model.tokenizer_type))
+    return chunking.assemble(selection, {source.pk: source for source in sources})
+
+def build_prompt(language_model, test, question, introductions=(), sources=()):
+    context = build_context(test, introductions, sources)
+    context['question'] = question
+    return get_template(language_model).render(context)
+
+def iter_prompts(test_run, introductions=None, sources=None):
+    if introductions is None:
+        introductions = get_introductions(test_run)
+    test = test_run.test
+    if sources is None:
+        sources = get_sources(test)
+    sources_text = fit_sources(test_run.language_model, test, introductions, sources, settings.RUN_MAX_OUTPUT_TOKENS)
+    context = build_context(test, introductions, sources, sources_text)
+    return get_template(test_run.language_model).iter_render(context, get_questions(test))
+
+def build_prompts(test_run, introductions=None, sources=None):
+    return list(iter_prompts(test_run, introductions, sources))
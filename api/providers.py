@@ -0,0 +1,73 @@
+import random
+import time
+from collections import namedtuple
+from django.conf import settings
+
+Completion = namedtuple('Completion', ['text', 'input_tokens', 'output_tokens'])
+
+class ProviderError(Exception):
+    pass
+
+class ProviderNotFound(ProviderError):
+    pass
+
+class TransientProviderError(ProviderError):
+    """A failure worth retrying: rate limited, overloaded, unavailable. `retry_after`
+    is the wait in seconds the provider asked for, if any."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class ProviderTimeout(TransientProviderError):
+    pass
+
+class BaseProvider:
+    """Calls a model hosted by one `LanguageModel.library`.
+
+    Subclasses implement `complete`, which sends a single rendered prompt and
+    returns a `Completion` with the token usage reported by the provider. They
+    raise TransientProviderError for failures that may pass on a retry;
+    api.resilience retries those.
+    """
+
+    def __init__(self, language_model):
+        self.language_model = language_model
+
+    def complete(self, prompt, **params):
+        raise NotImplementedError
+
+_registry = {}
+
+def register(library):
+    def decorator(provider_class):
+        _registry[library] = provider_class
+        return provider_class
+    return decorator
+
+def get_provider(language_model):
+    provider_class = _registry.get(language_model.library)
+    if provider_class is None:
+        raise ProviderNotFound(f"No provider registered for library '{language_model.library}'")
+    return provider_class(language_model)
+
+@register('fake')
+class FakeProvider(BaseProvider):
+    """Offline provider that answers deterministically, for tests and local runs.
+
+    It can also misbehave like a real one: FAKE_PROVIDER_ERROR_RATE of the
+    calls fail with a transient error, and FAKE_PROVIDER_SLOW_RATE of them take
+    FAKE_PROVIDER_SLOW_LATENCY seconds instead of FAKE_PROVIDER_LATENCY.
+    """
+
+    def complete(self, prompt, **params):
+        if random.random() < getattr(settings, 'FAKE_PROVIDER_ERROR_RATE', 0):
+            raise TransientProviderError("Injected failure")
+        latency = getattr(settings, 'FAKE_PROVIDER_LATENCY', 0)
+        if random.random() < getattr(settings, 'FAKE_PROVIDER_SLOW_RATE', 0):
+            latency = getattr(settings, 'FAKE_PROVIDER_SLOW_LATENCY', 0)
+        if latency:
+            time.sleep(latency)
+        question = prompt.strip().splitlines()[-1] if prompt.strip() else ''
+        text = f"Answer: {question}"
+        return Completion(text=text, input_tokens=len(prompt.split()), output_tokens=len(text.split()))
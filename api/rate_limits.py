@@ -0,0 +1,100 @@
+import time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest, Least
+from .models import RateLimitBucket
+from .tokenizers import count_tokens
+
+# Pacing of provider calls: one token bucket per (LanguageModel.library, name)
+# for requests per minute and one for tokens per minute. The levels are a
+# database row, so every thread and worker process on the host shares them.
+#
+# A call reserves its cost up front: a single UPDATE refills the buckets for
+# the time since the last call and subtracts the cost, letting the levels go
+# negative, and the caller sleeps until the refill covers its debt. The order
+# of those UPDATEs is the order calls go out, so waiting runs are served first
+# come, first served and the provider sees its full rate, never more.
+
+def bucket_key(language_model):
+    return f"{language_model.library}:{language_model.name}"
+
+def _buckets(language_model):
+    """(field, capacity, refill per second) of each limited bucket of the model."""
+    buckets = []
+    for field, per_minute in (('requests', language_model.requests_per_minute),
+                              ('tokens', language_model.tokens_per_minute)):
+        if per_minute:
+            rate = per_minute / 60
+            buckets.append((field, max(rate * settings.RATE_LIMIT_BURST_SECONDS, 1.0), rate))
+    return buckets
+
+def _create(key):
+    try:
+        with transaction.atomic():
+            RateLimitBucket.objects.create(key=key)
+    except IntegrityError:
+        # Created concurrently.
+        pass
+
+def _changes(buckets, tokens):
+    """The UPDATE of a reservation, and (field, refilled level, cost) of each bucket."""
+    now = time.time()
+    elapsed = Greatest(Value(now) - F('updated_at'), Value(0.0), output_field=FloatField())
+    changes = {'updated_at': Greatest(Value(now), F('updated_at'), output_field=FloatField())}
+    levels = []
+    for field, capacity, rate in buckets:
+        # A call larger than the bucket would never fit; it waits for a full bucket instead.
+        cost = min(1 if field == 'requests' else tokens, capacity)
+        level = Least(Value(capacity), F(field) + elapsed * Value(rate), output_field=FloatField())
+        changes[field] = level - Value(cost)
+        levels.append((field, level, cost))
+    return changes, levels
+
+def reserve(language_model, tokens):
+    """Reserve one request and `tokens` tokens; return the seconds to wait before making the call."""
+    buckets = _buckets(language_model)
+    if not buckets:
+        return 0.0
+    changes, _ = _changes(buckets, tokens)
+    key = bucket_key(language_model)
+    bucket = RateLimitBucket.objects.filter(key=key)
+    with transaction.atomic():
+        if not bucket.update(**changes):
+            _create(key)
+            bucket.update(**changes)
+        levels = bucket.values('requests', 'tokens').get()
+    return max(max(-levels[field], 0.0) / rate for field, _, rate in buckets)
+
+def try_reserve(language_model, tokens):
+    """Reserve like `reserve` if that needs no wait, for optional calls; return whether it did."""
+    buckets = _buckets(language_model)
+    if not buckets:
+        return True
+    changes, levels = _changes(buckets, tokens)
+    key = bucket_key(language_model)
+    if not RateLimitBucket.objects.filter(key=key).exists():
+        _create(key)
+    bucket = RateLimitBucket.objects.filter(key=key)
+    for field, level, cost in levels:
+        bucket = bucket.alias(**{f'{field}_level': level}).filter(**{f'{field}_level__gte': cost})
+    return bool(bucket.update(**changes))
+
+def acquire(language_model, prompt, max_output_tokens):
+    """Wait until the model's rate limits allow a call with `prompt`; return the tokens reserved."""
+    tokens = 0
+    if language_model.tokens_per_minute:
+        tokens = count_tokens(prompt, language_model.tokenizer_type) + max_output_tokens
+    wait = reserve(language_model, tokens)
+    if wait > 0:
+        time.sleep(wait)
+    return tokens
+
+def release(language_model, tokens):
+    """Give back reserved tokens a call did not use."""
+    buckets = {field: (capacity, rate) for field, capacity, rate in _buckets(language_model)}
+    if tokens <= 0 or 'tokens' not in buckets:
+        return
+    capacity, _ = buckets['tokens']
+    RateLimitBucket.objects.filter(key=bucket_key(language_model)).update(
+        tokens=Least(Value(capacity), F('tokens') + Value(float(tokens)), output_field=FloatField()))
@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import uuid
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Cache of serialized API reads on Django's cache framework. Keys embed
+# generation tokens: every write to a model replaces that model's list
+# generation and the generations of the written objects, so stale entries are
+# never read again and simply expire. Signal handlers in api.signals
+# invalidate on save and delete; code that writes with update(), bulk_create()
+# or bulk_update() calls `invalidate` itself.
+#
+# Entries are stored only once the reading transaction commits, and
+# invalidation is repeated on commit, so a concurrent reader cannot store data
+# from before a write under the generation that write created. Generations
+# live in the cache too: use a shared backend (Redis, Memcached) when several
+# processes serve the API.
+
+class ReadCache:
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+        self._counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _generations(self, keys):
+        generations = self.cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                # A lost generation is replaced by a new one, never reset, so
+                # entries stored under the old one cannot come back.
+                token = uuid.uuid4().hex
+                self.cache.add(key, token, timeout=None)
+                generations[key] = self.cache.get(key) or token
+        return [generations[key] for key in keys]
+
+    def key(self, model, variant, pk=None):
+        """Cache key of one representation (`variant`) of `model`'s lists, or of its object `pk`."""
+        model_label = model._meta.label_lower
+        if pk is None:
+            keys = [f"read:{model_label}:list"]
+        else:
+            keys = [f"read:{model_label}:all", f"read:{model_label}:object:{pk}"]
+        digest = hashlib.sha256(repr(variant).encode()).hexdigest()[:32]
+        return ":".join(["read", model_label, *self._generations(keys), digest])
+
+    def get(self, model, key):
+        value = self.cache.get(key)
+        with self._lock:
+            self._counters[model._meta.label_lower]['misses' if value is None else 'hits'] += 1
+        return value
+
+    def set(self, key, value):
+        transaction.on_commit(lambda: self.cache.set(key, value, self.timeout))
+
+    def _bump(self, model_label, pks):
+        keys = [f"read:{model_label}:list"]
+        if pks is None:
+            keys.append(f"read:{model_label}:all")
+        else:
+            keys.extend(f"read:{model_label}:object:{pk}" for pk in pks)
+        self.cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+
+    def invalidate(self, model, pks=None):
+        """Drop cached lists of `model` and its objects `pks` (all objects if None)."""
+        model_label = model._meta.label_lower
+        pks = None if pks is None else list(pks)
+        self._bump(model_label, pks)
+        transaction.on_commit(lambda: self._bump(model_label, pks))
+
+    def stats(self):
+        with self._lock:
+            models = {name: dict(counters) for name, counters in self._counters.items()}
+        for counters in models.values():
+            lookups = counters['hits'] + counters['misses']
+            counters['hit_rate'] = counters['hits'] / lookups if lookups else 0.0
+        hits = sum(counters['hits'] for counters in models.values())
+        misses = sum(counters['misses'] for counters in models.values())
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'models': models}
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters.clear()
+
+read_cache = ReadCache(settings.READ_CACHE_ALIAS, settings.READ_CACHE_TIMEOUT)
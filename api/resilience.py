@@ -0,0 +1,221 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from . import rate_limits
+from .ledger import ReservationExhausted
+from .models import CircuitBreaker
+from .providers import ProviderError, ProviderTimeout, TransientProviderError
+
+# Provider calls that survive a flaky provider. `complete` makes one call of a
+# run's question:
+#
+# - Transient failures (TransientProviderError, timeouts, dropped connections)
+#   are retried after a full-jitter exponential backoff, so runs that failed
+#   together do not retry together; every attempt is paced by the rate limits.
+# - Each attempt runs on a shared thread pool and is abandoned after
+#   PROVIDER_TIMEOUT seconds. A model has at most PROVIDER_MODEL_CALL_THREADS
+#   calls on the pool, abandoned ones included, so a hanging provider cannot
+#   take the threads other models' calls need. With PROVIDER_HEDGE_DELAY set, an attempt still
+#   unanswered after that delay is sent again if the rate limits have room,
+#   and the first answer wins: one slow call no longer sets a run's pace.
+# - Each LanguageModel has a circuit breaker, a database row shared by every
+#   worker. PROVIDER_BREAKER_THRESHOLD consecutive failures open it; the call
+#   that opened it and the calls after it raise CircuitOpen, which the runner
+#   turns into a pause of the run, not a failure, until
+#   PROVIDER_BREAKER_COOLDOWN has passed. Then one
+#   call is let through as a probe, and its outcome closes or reopens the
+#   circuit. Other models' runs are not held up meanwhile.
+#
+# Every call sent is billed, answer used or not: `Calls` counts the dropped
+# ones (lost hedges and abandoned attempts) for the runner to charge, and
+# caps how many calls a question may send. The rate limit tokens of dropped
+# calls stay spent; those of failed calls are given back.
+#
+# The breaker rows also count successes, failures, timeouts, retries, hedges
+# and refused calls; they are served at /api/language-models/{id}/circuit/.
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = {}
+_slots_lock = threading.Lock()
+
+class CircuitOpen(ProviderError):
+    """Raised instead of calling a model whose circuit is open."""
+
+    def __init__(self, language_model, retry_after):
+        super().__init__(f"Circuit breaker of {language_model} is open; retrying in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class Calls:
+    """The provider calls sent for one question. At most `limit` are sent (None:
+    no cap); `dropped` counts those whose answer was not used."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.sent = 0
+        self.dropped = 0
+
+    def allow(self):
+        return self.limit is None or self.sent < self.limit
+
+def get_executor():
+    """The thread pool attempts run on, so that a timed out attempt can be abandoned."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.PROVIDER_CALL_THREADS, thread_name_prefix='provider-call')
+        return _executor
+
+def get_slots(language_model):
+    """The semaphore that caps the model's calls on the shared pool."""
+    key = (language_model.pk, settings.PROVIDER_MODEL_CALL_THREADS)
+    with _slots_lock:
+        if key not in _slots:
+            _slots[key] = threading.BoundedSemaphore(settings.PROVIDER_MODEL_CALL_THREADS)
+        return _slots[key]
+
+def _submit(slots, provider, prompt, params):
+    """Call the provider on the pool in a slot already taken; the slot is freed when the call ends."""
+    future = get_executor().submit(provider.complete, prompt, **params)
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+def is_transient(exc):
+    return isinstance(exc, (TransientProviderError, TimeoutError, ConnectionError))
+
+def backoff(attempt, exc):
+    """Seconds to wait before retry number `attempt` (from 0) after `exc`."""
+    delay = random.uniform(0, min(settings.PROVIDER_BACKOFF_MAX, settings.PROVIDER_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, getattr(exc, 'retry_after', None) or 0)
+
+def get_breaker(language_model):
+    breaker = CircuitBreaker.objects.filter(language_model=language_model).first()
+    if breaker is None:
+        try:
+            with transaction.atomic():
+                breaker = CircuitBreaker.objects.create(language_model=language_model)
+        except IntegrityError:
+            # Created concurrently.
+            breaker = CircuitBreaker.objects.get(language_model=language_model)
+    return breaker
+
+def retry_after(breaker, now=None):
+    """Seconds until an open circuit lets a probe call through; 0 if it is closed or due."""
+    if breaker.state == 'closed' or breaker.opened_at is None:
+        return 0.0
+    reopens_at = breaker.opened_at + timedelta(seconds=settings.PROVIDER_BREAKER_COOLDOWN)
+    return max((reopens_at - (now or timezone.now())).total_seconds(), 0.0)
+
+def _count(breaker, **counters):
+    CircuitBreaker.objects.filter(pk=breaker.pk).update(**{name: F(name) + value for name, value in counters.items()})
+
+def admit(language_model):
+    """Return the model's breaker if a call may go out now; raise CircuitOpen otherwise."""
+    breaker = get_breaker(language_model)
+    if breaker.state == 'closed':
+        return breaker
+    now = timezone.now()
+    wait_for = retry_after(breaker, now)
+    # Once the cooldown has passed, the first caller to move the circuit to
+    # half open makes the probe call. A probe that never reported back is
+    # replaced after another cooldown.
+    if not wait_for and CircuitBreaker.objects.filter(pk=breaker.pk, state=breaker.state, opened_at=breaker.opened_at).update(
+            state='half_open', opened_at=now):
+        breaker.state, breaker.opened_at = 'half_open', now
+        return breaker
+    _count(breaker, rejections=1)
+    raise CircuitOpen(language_model, max(wait_for, 1.0))
+
+def record_success(breaker):
+    CircuitBreaker.objects.filter(pk=breaker.pk).update(
+        state='closed', consecutive_failures=0, opened_at=None, successes=F('successes') + 1)
+
+def record_failure(breaker, exc):
+    """Count a failed attempt; return whether it opened the circuit, which transient
+    failures do once they reach the threshold in a row."""
+    counters = {'failures': 1, 'timeouts': int(isinstance(exc, (ProviderTimeout, TimeoutError)))}
+    if not is_transient(exc):
+        # The request was at fault, not the provider: the circuit stays as it is.
+        _count(breaker, **counters)
+        return False
+    breakers = CircuitBreaker.objects.filter(pk=breaker.pk)
+    with transaction.atomic():
+        breakers.update(consecutive_failures=F('consecutive_failures') + 1,
+                        **{name: F(name) + value for name, value in counters.items()})
+        # A failed probe reopens the circuit at once.
+        return bool(breakers.exclude(state='open').filter(
+            consecutive_failures__gte=1 if breaker.state == 'half_open' else settings.PROVIDER_BREAKER_THRESHOLD,
+        ).update(state='open', opened_at=timezone.now()))
+
+def _attempt(breaker, language_model, provider, prompt, params, tokens, calls):
+    """One call of the provider, with its timeout and hedge."""
+    timeout = settings.PROVIDER_TIMEOUT or None
+    hedge_delay = settings.PROVIDER_HEDGE_DELAY
+    if timeout is None and not hedge_delay:
+        calls.sent += 1
+        return provider.complete(prompt, **params)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    slots = get_slots(language_model)
+    # Slots held by the model's own hanging calls time this one out, not other models' calls.
+    if not slots.acquire(timeout=timeout):
+        raise ProviderTimeout(f"No call slot for {language_model} within {timeout:g}s")
+    calls.sent += 1
+    pending = {_submit(slots, provider, prompt, params)}
+    if hedge_delay and (timeout is None or hedge_delay < timeout) and calls.allow():
+        done, _ = wait(pending, timeout=hedge_delay)
+        if not done and slots.acquire(blocking=False):
+            if rate_limits.try_reserve(language_model, tokens):
+                calls.sent += 1
+                pending.add(_submit(slots, provider, prompt, params))
+                _count(breaker, hedges=1)
+            else:
+                slots.release()
+    error = None
+    while pending:
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            # The attempt keeps its pool thread until the provider gives up; its answer is dropped.
+            calls.dropped += len(pending)
+            raise ProviderTimeout(f"No answer within {timeout:g}s")
+        answered = [future for future in done if future.exception() is None]
+        if answered:
+            calls.dropped += len(pending) + len(answered) - 1
+            return answered[0].result()
+        error = next(iter(done)).exception()
+    raise error
+
+def complete(language_model, provider, prompt, params, calls=None):
+    """provider.complete(prompt, **params) with rate limiting, timeouts, hedging, retries and the circuit breaker.
+
+    The calls sent are counted on `calls`, which may also cap them.
+    """
+    calls = calls or Calls()
+    attempts = max(settings.PROVIDER_MAX_ATTEMPTS, 1)
+    for attempt in range(attempts):
+        if not calls.allow():
+            raise ReservationExhausted(f"No reservation left for another call after {calls.sent}")
+        breaker = admit(language_model)
+        tokens = rate_limits.acquire(language_model, prompt, params.get('max_tokens', 0))
+        sent, dropped = calls.sent, calls.dropped
+        try:
+            completion = _attempt(breaker, language_model, provider, prompt, params, tokens, calls)
+        except Exception as exc:
+            # The tokens of calls that failed or were never sent go back.
+            rate_limits.release(language_model, tokens * (max(calls.sent - sent, 1) - (calls.dropped - dropped)))
+            if record_failure(breaker, exc):
+                raise CircuitOpen(language_model, settings.PROVIDER_BREAKER_COOLDOWN) from exc
+            if not is_transient(exc) or attempt == attempts - 1:
+                raise
+            _count(breaker, retries=1)
+            time.sleep(backoff(attempt, exc))
+            continue
+        rate_limits.release(language_model, tokens - completion.input_tokens - completion.output_tokens)
+        record_success(breaker)
+        return completion
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import CachedResponse
+from .providers import Completion
+
+def cache_key(language_model, prompt, params):
+    payload = json.dumps([language_model.name, language_model.library, prompt, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class MemoryTier:
+    """Thread-safe LRU of completions with a per-entry time to live."""
+
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            completion, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return completion
+
+    def set(self, key, completion, ttl=None):
+        """Store a completion for `ttl` seconds, the tier's ttl by default."""
+        with self._lock:
+            self._entries[key] = (completion, self.clock() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class PersistentTier:
+    """Completions stored in the CachedResponse table, evicted by age, count and size."""
+
+    def __init__(self, ttl, max_entries, max_bytes, evict_every):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """(completion, seconds it has left to live) of a stored entry, or None."""
+        entry = CachedResponse.objects.filter(key=key).values_list('text', 'input_tokens', 'output_tokens', 'created_at').first()
+        if entry is None:
+            return None
+        text, input_tokens, output_tokens, created_at = entry
+        now = timezone.now()
+        remaining = (created_at + timedelta(seconds=self.ttl) - now).total_seconds()
+        if remaining <= 0:
+            CachedResponse.objects.filter(key=key).delete()
+            return None
+        CachedResponse.objects.filter(key=key).update(last_used_at=now)
+        return Completion(text=text, input_tokens=input_tokens, output_tokens=output_tokens), remaining
+
+    def get(self, key):
+        entry = self.lookup(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, completion):
+        values = {
+            'text': completion.text,
+            'input_tokens': completion.input_tokens,
+            'output_tokens': completion.output_tokens,
+            'size': len(completion.text.encode('utf-8')),
+            'last_used_at': timezone.now(),
+        }
+        if not CachedResponse.objects.filter(key=key).update(**values):
+            try:
+                with transaction.atomic():
+                    CachedResponse.objects.create(key=key, **values)
+            except IntegrityError:
+                pass
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        CachedResponse.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=self.ttl)).delete()
+        kept = 0
+        kept_bytes = 0
+        stale = []
+        for pk, size in CachedResponse.objects.order_by('-last_used_at').values_list('id', 'size').iterator():
+            kept += 1
+            kept_bytes += size
+            if kept > self.max_entries or kept_bytes > self.max_bytes:
+                stale.append(pk)
+        for start in range(0, len(stale), 500):
+            CachedResponse.objects.filter(pk__in=stale[start:start + 500]).delete()
+
+    def clear(self):
+        CachedResponse.objects.all().delete()
+
+class ResponseCache:
+    def __init__(self, memory, persistent):
+        self.memory = memory
+        self.persistent = persistent
+        self._counters = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, key):
+        completion = self.memory.get(key)
+        if completion is not None:
+            self._count('memory_hits')
+            return completion
+        entry = self.persistent.lookup(key)
+        if entry is not None:
+            self._count('persistent_hits')
+            completion, remaining = entry
+            # Promoted entries expire when the stored row does, not a full memory ttl later.
+            self.memory.set(key, completion, ttl=min(self.memory.ttl, remaining))
+            return completion
+        self._count('misses')
+        return None
+
+    def set(self, key, completion):
+        self.memory.set(key, completion)
+        self.persistent.set(key, completion)
+
+    def clear(self):
+        self.memory.clear()
+        self.persistent.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        hits = stats['memory_hits'] + stats['persistent_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        stats['memory_entries'] = len(self.memory)
+        stats['persistent_entries'] = CachedResponse.objects.count()
+        return stats
+
+response_cache = ResponseCache(
+    MemoryTier(settings.RESPONSE_CACHE_MEMORY_ENTRIES, settings.RESPONSE_CACHE_TTL),
+    PersistentTier(settings.RESPONSE_CACHE_TTL, settings.RESPONSE_CACHE_MAX_ENTRIES,
+                   settings.RESPONSE_CACHE_MAX_BYTES, settings.RESPONSE_CACHE_EVICT_EVERY),
+)
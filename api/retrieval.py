@@ -0,0 +1,322 @@
+import re
+import threading
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from .hebrew import normalize
+from .models import Source, Introduction
+from .prompts import question_text
+
+# In-memory TF-IDF index over character n-grams of Source (name and content)
+# and Introduction content, for picking the documents most similar to a test.
+#
+# Documents are Hebrew-normalized and cut into character 3- and 4-grams, which
+# are hashed to 32 bits; weights are sublinear tf times smoothed idf, and rows
+# are L2-normalized, so a query's scores are cosine similarities. The index is
+# an inverted file (the documents and weights of every n-gram, sorted by
+# n-gram) held in NumPy arrays: a query adds up the postings of its n-grams
+# into one score per document, so its cost is the length of those postings.
+#
+# Each process builds the index from the database on first use. Saves in the
+# process are applied when they commit; before answering, the index compares
+# each table's row count and latest `updated_at` with what it has seen and
+# vectorizes only the documents changed since. Changed documents go to a small
+# delta index weighted with the main index's idf; once the delta grows past
+# MERGE_FRACTION of the documents, everything is rebuilt with fresh idf.
+
+KINDS = {'source': Source, 'introduction': Introduction}
+
+NGRAM_SIZES = (3, 4)
+
+# N-grams in more than RETRIEVAL_MAX_DF of the documents (the likes of
+# "של" and "את") carry little weight and have the longest postings; they are
+# dropped, as with a max_df, once an index has this many documents.
+PRUNE_MIN_DOCUMENTS = 1000
+
+MERGE_FRACTION = 0.05
+MERGE_MIN_DOCUMENTS = 256
+
+BATCH_SIZE = 2000
+
+# Rows written by other processes are found by `updated_at`; a transaction
+# that commits after a later-stamped one is still found within this window.
+SYNC_LOOKBACK = timedelta(seconds=10)
+
+_SPACES = re.compile(r"\s+")
+_PRIME = np.uint64(0x100000001B3)
+_MIX = np.uint64(0xFF51AFD7ED558CCD)
+
+def document_text(kind, obj):
+    return obj.name + "\n" + obj.content if kind == 'source' else obj.content
+
+def _prepare(text):
+    return " " + _SPACES.sub(" ", normalize(text)).strip() + " "
+
+def vectorize_many(texts):
+    """[(sorted n-gram hashes, their counts)] of each of `texts`, hashed in one pass.
+
+    Hashes are stable 32-bit values of the normalized n-grams, the same
+    whichever texts are vectorized together.
+    """
+    texts = [_prepare(text) for text in texts]
+    lengths = np.array([len(text) for text in texts], dtype=np.int64)
+    codes = np.frombuffer("".join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    owners = np.repeat(np.arange(len(texts), dtype=np.uint64), lengths)
+    keys = [np.empty(0, dtype=np.uint64)]
+    for size in NGRAM_SIZES:
+        if len(codes) < size:
+            continue
+        h = np.full(len(codes) - size + 1, size, dtype=np.uint64)
+        for offset in range(size):
+            h = h * _PRIME + codes[offset:offset + len(h)]
+        h ^= h >> np.uint64(33)
+        h *= _MIX
+        h ^= h >> np.uint64(33)
+        # N-grams that run from one text into the next are dropped.
+        within = owners[:len(h)] == owners[size - 1:]
+        keys.append((owners[:len(h)][within] << np.uint64(32)) | (h[within] & np.uint64(0xFFFFFFFF)))
+    keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+    features, counts = (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32), counts.astype(np.uint32)
+    bounds = np.searchsorted(keys >> np.uint64(32), np.arange(len(texts) + 1, dtype=np.uint64))
+    return [(features[start:end], counts[start:end]) for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+def vectorize(text):
+    """(sorted n-gram hashes, their counts) of `text`."""
+    return vectorize_many([text])[0]
+
+def smoothed_idf(document_frequencies, documents):
+    """log((1 + n) / (1 + df)) + 1; 0 for n-grams pruned as too common."""
+    idf = np.log((1 + documents) / (1 + document_frequencies)) + 1
+    if documents >= PRUNE_MIN_DOCUMENTS:
+        idf[document_frequencies > settings.RETRIEVAL_MAX_DF * documents] = 0
+    return idf
+
+class _Postings:
+    """Documents as an inverted file: for each n-gram of `vocabulary`, its
+    documents and normalized weights are docs/weights[indptr[i]:indptr[i + 1]].
+
+    Weights use `idf` (a function of n-grams) or, without one, the smoothed
+    idf of the documents themselves. Pruned n-grams have no postings.
+    """
+
+    def __init__(self, vectors, idf=None):
+        self.size = len(vectors)
+        lengths = np.array([len(features) for features, _ in vectors], dtype=np.int64)
+        features = np.concatenate([features for features, _ in vectors] + [np.empty(0, dtype=np.uint32)])
+        counts = np.concatenate([counts for _, counts in vectors] + [np.empty(0, dtype=np.uint32)])
+        docs = np.repeat(np.arange(self.size, dtype=np.int32), lengths)
+        # Sorting (n-gram, position) pairs packed in 64 bits is several times faster than argsort.
+        keys = (features.astype(np.uint64) << np.uint64(32)) | np.arange(len(features), dtype=np.uint64)
+        keys.sort()
+        order = (keys & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        features, counts, docs = (keys >> np.uint64(32)).astype(np.uint32), counts[order], docs[order]
+        first = np.ones(len(features), dtype=bool)
+        first[1:] = features[1:] != features[:-1]
+        self.vocabulary = features[first]
+        # Every n-gram appears once per document, so its postings count its documents.
+        self.document_frequencies = np.diff(np.append(np.flatnonzero(first), len(features)))
+        term_idf = smoothed_idf(self.document_frequencies, self.size) if idf is None else idf(self.vocabulary)
+        terms = np.cumsum(first) - 1
+        weights = (1 + np.log(counts)) * term_idf[terms]
+        norms = np.sqrt(np.bincount(docs, weights ** 2, minlength=self.size))
+        kept = weights > 0
+        self.docs = docs[kept]
+        self.weights = (weights[kept] / norms[self.docs]).astype(np.float32)
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms[kept], minlength=len(self.vocabulary)), out=self.indptr[1:])
+
+    def scores(self, features, weights):
+        """Dot products of every document with a query's normalized (n-gram, weight) vector."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        positions = np.searchsorted(self.vocabulary, features)
+        found = positions < len(self.vocabulary)
+        found[found] = self.vocabulary[positions[found]] == features[found]
+        indptr = self.indptr
+        for position, weight in zip(positions[found].tolist(), weights[found].tolist()):
+            start, end = indptr[position], indptr[position + 1]
+            if start == end:
+                continue
+            # A document appears once per n-gram, so the indexed add is exact.
+            scores[self.docs[start:end]] += self.weights[start:end] * np.float32(weight)
+        return scores
+
+class _KindIndex:
+    def __init__(self, kind):
+        self.kind = kind
+        self.model = KINDS[kind]
+        self.lock = threading.Lock()
+        # One sync at a time, so concurrent first queries build the index once.
+        self.sync_lock = threading.Lock()
+        self.vectors = {}
+        self.versions = {}
+        self.signature = None
+        self.synced_until = None
+        self.main_ids = np.empty(0, dtype=np.int64)
+        self.main_positions = {}
+        self.main = _Postings([])
+        self.stale = np.zeros(0, dtype=bool)
+        self.delta_ids = []
+        self.delta = None
+
+    def _main_idf(self, features):
+        """Idf of `features` among the documents of the main index."""
+        vocabulary = self.main.vocabulary
+        df = np.zeros(len(features), dtype=np.int64)
+        if len(vocabulary):
+            positions = np.minimum(np.searchsorted(vocabulary, features), len(vocabulary) - 1)
+            matched = vocabulary[positions] == features
+            df[matched] = self.main.document_frequencies[positions[matched]]
+        return smoothed_idf(df, self.main.size)
+
+    def _rebuild(self):
+        self.main_ids = np.array(sorted(self.vectors), dtype=np.int64)
+        self.main = _Postings([self.vectors[pk] for pk in self.main_ids.tolist()])
+        self.main_positions = {pk: position for position, pk in enumerate(self.main_ids.tolist())}
+        self.stale = np.zeros(len(self.main_ids), dtype=bool)
+        self.delta_ids = []
+        self.delta = None
+
+    def _changed(self, pks):
+        pks = set(pks)
+        for pk in pks:
+            position = self.main_positions.get(pk)
+            if position is not None:
+                self.stale[position] = True
+        self.delta_ids = [pk for pk in self.delta_ids if pk not in pks] + sorted(pk for pk in pks if pk in self.vectors)
+        self.delta = None
+
+    def apply(self, documents):
+        """Replace the vectors of {pk: (text, updated_at)}; a None text removes the document."""
+        if self.signature is None:
+            # Not built in this process: the first sync reads the table anyway.
+            return
+        texts = {pk: text for pk, (text, _) in documents.items() if text is not None}
+        vectors = dict(zip(texts, vectorize_many(texts.values()))) if texts else {}
+        with self.lock:
+            for pk, (_, updated_at) in documents.items():
+                if pk in vectors:
+                    self.vectors[pk] = vectors[pk]
+                    self.versions[pk] = updated_at
+                else:
+                    self.vectors.pop(pk, None)
+                    self.versions.pop(pk, None)
+            self._changed(documents)
+
+    def _documents(self, queryset):
+        """{pk: (text, updated_at)} of the objects of `queryset`."""
+        documents = {}
+        for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+            documents[obj.pk] = (document_text(self.kind, obj), obj.updated_at)
+        return documents
+
+    def _signature(self):
+        # Two queries: SQLite answers a lone MAX from the index, but not MAX next to COUNT.
+        return self.model.objects.count(), self.model.objects.aggregate(latest=Max('updated_at'))['latest']
+
+    def sync(self):
+        """Catch up with the table: vectorize documents changed since the last sync."""
+        with self.sync_lock:
+            self._sync()
+
+    def _sync(self):
+        signature = self._signature()
+        with self.lock:
+            if signature == self.signature:
+                return
+            first = self.signature is None
+            synced_until = self.synced_until
+        if first:
+            vectors, versions = {}, {}
+            queryset = self.model.objects.with_text().order_by('pk')
+            pks = list(queryset.values_list('pk', flat=True))
+            for start in range(0, len(pks), BATCH_SIZE):
+                documents = self._documents(queryset.filter(pk__in=pks[start:start + BATCH_SIZE]))
+                vectors.update(zip(documents, vectorize_many(text for text, _ in documents.values())))
+                versions.update((pk, updated_at) for pk, (_, updated_at) in documents.items())
+            with self.lock:
+                self.vectors, self.versions = vectors, versions
+                self._rebuild()
+                self.signature, self.synced_until = signature, signature[1]
+            return
+        recent = self.model.objects.values_list('pk', 'updated_at')
+        if synced_until is not None:
+            recent = recent.filter(updated_at__gte=synced_until - SYNC_LOOKBACK)
+        changed = [pk for pk, updated_at in recent if self.versions.get(pk) != updated_at]
+        documents = {}
+        for start in range(0, len(changed), BATCH_SIZE):
+            documents.update(self._documents(
+                self.model.objects.with_text().filter(pk__in=changed[start:start + BATCH_SIZE])))
+        if signature[0] != len(self.vectors.keys() | documents.keys()):
+            existing = set(self.model.objects.values_list('pk', flat=True))
+            documents.update({pk: (None, None) for pk in self.vectors if pk not in existing})
+        self.apply(documents)
+        with self.lock:
+            self.signature, self.synced_until = signature, signature[1]
+            if len(self.delta_ids) > max(MERGE_MIN_DOCUMENTS, MERGE_FRACTION * len(self.main_ids)):
+                self._rebuild()
+
+    def _query_vector(self, text):
+        features, counts = vectorize(text)
+        weights = (1 + np.log(counts)) * self._main_idf(features)
+        norm = np.sqrt((weights ** 2).sum())
+        return features, (weights / norm if norm else weights).astype(np.float32)
+
+    def query(self, texts, k):
+        results = []
+        with self.lock:
+            if self.delta is None and self.delta_ids:
+                self.delta = _Postings([self.vectors[pk] for pk in self.delta_ids], self._main_idf)
+            ids = np.concatenate([self.main_ids, np.array(self.delta_ids, dtype=np.int64)])
+            for features, weights in map(self._query_vector, texts):
+                scores = self.main.scores(features, weights)
+                scores[self.stale] = 0
+                if self.delta_ids:
+                    scores = np.concatenate([scores, self.delta.scores(features, weights)])
+                results.append(_top(scores, ids, k))
+        return results
+
+def _top(scores, ids, k):
+    """[(id, score)] of the `k` best positive scores, best first (ties by id)."""
+    k = min(k, len(scores))
+    if not k:
+        return []
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    candidates = candidates[scores[candidates] > 0]
+    candidates = candidates[np.lexsort((ids[candidates], -scores[candidates]))]
+    return [(int(ids[index]), float(scores[index])) for index in candidates]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(kind):
+    index = _indexes.get(kind)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(kind, _KindIndex(kind))
+    return index
+
+def index_objects(kind, objects):
+    """Update the vectors of saved `objects` once the transaction commits."""
+    documents = {obj.pk: (document_text(kind, obj), obj.updated_at) for obj in objects}
+    if documents:
+        transaction.on_commit(lambda: get_index(kind).apply(documents))
+
+def remove_objects(kind, object_ids):
+    documents = {pk: (None, None) for pk in object_ids}
+    transaction.on_commit(lambda: get_index(kind).apply(documents))
+
+def top_k(kind, queries, k=10):
+    """For each query text, [(object id, cosine similarity)] of the k most similar documents of `kind`."""
+    index = get_index(kind)
+    index.sync()
+    return index.query(list(queries), k)
+
+def test_query(test):
+    return "\n".join([test.name, test.description] + [question_text(item) for item in test.questions])
+
+def related(tests, kind, k=10):
+    """{test id: [(object id, similarity)]} of the documents of `kind` closest to each test."""
+    tests = list(tests)
+    return {test.pk: matches for test, matches in zip(tests, top_k(kind, [test_query(test) for test in tests], k))}
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from . import events, grading, ledger, resilience
+from .models import QuestionResult, TestRun
+from .prompts import get_questions, iter_prompts
+from .providers import get_provider
+from .response_cache import cache_key, response_cache
+from .tokenizers import count_tokens
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executors_lock = threading.Lock()
+_sweeper = None
+
+def get_concurrency(library):
+    return settings.RUN_CONCURRENCY.get(library, settings.RUN_DEFAULT_CONCURRENCY)
+
+def get_executor(library):
+    """Return the thread pool for `library`; its size caps concurrent calls to that provider."""
+    with _executors_lock:
+        executor = _executors.get(library)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=get_concurrency(library), thread_name_prefix=f'test-run-{library}')
+            _executors[library] = executor
+        return executor
+
+def enqueue(test_run):
+    """Schedule a pending run once the surrounding transaction commits."""
+    library = test_run.language_model.library
+    transaction.on_commit(lambda: submit(test_run.pk, library))
+
+def submit(test_run_id, library):
+    if settings.RUN_EAGER:
+        return execute_test_run(test_run_id)
+    return get_executor(library).submit(_execute_in_worker, test_run_id)
+
+def _execute_in_worker(test_run_id):
+    close_old_connections()
+    try:
+        execute_test_run(test_run_id)
+    finally:
+        close_old_connections()
+
+class ResultWriter:
+    """Buffers a run's QuestionResult rows and inserts them in batches of
+    RUN_RESULT_BATCH_SIZE, or once RUN_RESULT_FLUSH_SECONDS have passed."""
+
+    def __init__(self, test_run_id):
+        self.test_run_id = test_run_id
+        self.rows = []
+        self.flushed_at = time.monotonic()
+
+    def add(self, **fields):
+        self.rows.append(QuestionResult(test_run_id=self.test_run_id, **fields))
+        if len(self.rows) >= settings.RUN_RESULT_BATCH_SIZE or time.monotonic() - self.flushed_at >= settings.RUN_RESULT_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            # A resumed run replaces the rows of failed or changed questions.
+            QuestionResult.objects.bulk_create(
+                self.rows, update_conflicts=True, unique_fields=['test_run', 'index'],
+                update_fields=['prompt_hash', 'answer', 'input_tokens', 'output_tokens', 'latency', 'cost', 'cached', 'error'])
+            self.rows = []
+        self.flushed_at = time.monotonic()
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+def execute_test_run(test_run_id):
+    # Claim the run atomically so a run enqueued twice is only executed once.
+    claimed = TestRun.objects.filter(pk=test_run_id, status='pending').update(
+        status='in_progress', started_at=timezone.now())
+    if not claimed:
+        return None
+
+    test_run = TestRun.objects.select_related('test', 'language_model').get(pk=test_run_id)
+    events.publish(test_run_id, {'event': 'status', 'status': 'in_progress', 'started_at': test_run.started_at.isoformat()})
+    language_model = test_run.language_model
+    # Answers kept from an earlier attempt of a resumed run are not asked again;
+    # the rows of questions asked again carry the cost of the earlier attempts.
+    earlier = {row.index: row for row in QuestionResult.objects.with_text().filter(test_run_id=test_run_id)}
+    writer = ResultWriter(test_run_id)
+    answers = []
+    cost = Decimal(0)
+    params = {'max_tokens': settings.RUN_MAX_OUTPUT_TOKENS}
+    current = None
+    try:
+        provider = get_provider(language_model)
+        for index, (question, prompt) in enumerate(zip(get_questions(test_run.test), iter_prompts(test_run))):
+            current = (index, prompt_hash(prompt))
+            question_cost = Decimal(0)
+            kept = earlier.get(index)
+            spent = kept.cost if kept is not None else Decimal(0)
+            if kept is not None and kept.error is None and kept.prompt_hash == current[1]:
+                answers.append({
+                    'index': index,
+                    'question': question,
+                    'answer': kept.answer,
+                    'input_tokens': kept.input_tokens,
+                    'output_tokens': kept.output_tokens,
+                    'cached': kept.cached,
+                })
+                continue
+            completion = None
+            if test_run.use_cache:
+                key = cache_key(language_model, prompt, params)
+                completion = response_cache.get(key)
+            cached = completion is not None
+            if cached:
+                started = time.perf_counter()
+                test_run.cache_hits += 1
+            else:
+                ceiling = language_model.calculate_cost(count_tokens(prompt, language_model.tokenizer_type), params['max_tokens'])
+                calls = resilience.Calls()
+                # A reserved run never sends a call that could take it past its reservation.
+                if test_run.budget_id is not None and ceiling:
+                    calls.limit = int(((test_run.reserved_cost or 0) - cost) // ceiling)
+                    if calls.limit < 1:
+                        raise ledger.ReservationExhausted(
+                            f"Question {index} could take the run past its reservation of {test_run.reserved_cost}")
+                started = time.perf_counter()
+                try:
+                    completion = resilience.complete(language_model, provider, prompt, params, calls)
+                finally:
+                    # Lost hedges and abandoned attempts are billed too; at their worst case, as their usage is unknown.
+                    question_cost = ceiling * calls.dropped
+                    cost += question_cost
+                completion_cost = language_model.calculate_cost(completion.input_tokens, completion.output_tokens)
+                question_cost += completion_cost
+                cost += completion_cost
+                if test_run.use_cache:
+                    response_cache.set(key, completion)
+            answer = {
+                'index': index,
+                'question': question,
+                'answer': completion.text,
+                'input_tokens': completion.input_tokens,
+                'output_tokens': completion.output_tokens,
+                'cached': cached,
+            }
+            answers.append(answer)
+            writer.add(index=index, prompt_hash=current[1], answer=completion.text, input_tokens=completion.input_tokens,
+                       output_tokens=completion.output_tokens, latency=time.perf_counter() - started, cost=spent + question_cost,
+                       cached=cached, error=None)
+            current = None
+            events.publish(test_run_id, dict(answer, event='question', cost=str(cost)))
+    except resilience.CircuitOpen as exc:
+        if current is not None:
+            writer.add(index=current[0], prompt_hash=current[1], cost=spent + question_cost, error=str(exc))
+        writer.flush()
+        return pause(test_run, cost, exc.retry_after)
+    except Exception as exc:
+        logger.exception("Test run %s failed", test_run_id)
+        test_run.status = 'failed'
+        test_run.result = str(exc)
+        if current is not None:
+            writer.add(index=current[0], prompt_hash=current[1], cost=spent + question_cost, error=str(exc))
+    else:
+        test_run.status = 'completed'
+        test_run.result = json.dumps(answers, ensure_ascii=False)
+    writer.flush()
+
+    # A resumed run's cost includes its earlier attempts; the ledger is settled with this attempt's.
+    test_run.cost = question_cost_total(test_run)
+    test_run.completed_at = timezone.now()
+    with transaction.atomic():
+        test_run.save(update_fields=['status', 'result', 'cost', 'cache_hits', 'completed_at'])
+        ledger.settle(test_run, cost)
+        transaction.on_commit(lambda: events.publish(test_run_id, {
+            'event': 'status',
+            'status': test_run.status,
+            'cost': str(test_run.cost),
+            'cache_hits': test_run.cache_hits,
+            'completed_at': test_run.completed_at.isoformat(),
+        }))
+        if test_run.status == 'completed':
+            transaction.on_commit(lambda: grade(test_run_id, test_run.test.test_type))
+    return test_run
+
+def pause(test_run, cost, delay):
+    """Pause an interrupted run for `delay` seconds, keeping its answers and what
+    is left of its reservation; it continues where it stopped."""
+    test_run.cost = question_cost_total(test_run)
+    test_run.status = 'paused'
+    test_run.resume_at = timezone.now() + timedelta(seconds=delay)
+    with transaction.atomic():
+        test_run.save(update_fields=['status', 'resume_at', 'cost', 'cache_hits'])
+        ledger.charge(test_run, cost)
+        transaction.on_commit(lambda: events.publish(test_run.pk, {
+            'event': 'status',
+            'status': 'paused',
+            'cost': str(test_run.cost),
+            'resume_at': test_run.resume_at.isoformat(),
+        }))
+        transaction.on_commit(lambda: schedule(delay))
+    return test_run
+
+def wake(test_run):
+    """Queue a paused run now, whatever its resume_at; return whether it was paused."""
+    # Conditional, so that a run is queued by one process only.
+    if not TestRun.objects.filter(pk=test_run.pk, status='paused').update(status='pending', resume_at=None):
+        return False
+    test_run.status = 'pending'
+    test_run.resume_at = None
+    enqueue(test_run)
+    return True
+
+def requeue_paused():
+    """Queue the paused runs whose resume_at has passed; return how many."""
+    due = TestRun.objects.filter(status='paused', resume_at__lte=timezone.now()).select_related('language_model')
+    return sum(wake(test_run) for test_run in due)
+
+def _sweep():
+    close_old_connections()
+    try:
+        requeue_paused()
+    except Exception:
+        logger.exception("Requeueing paused test runs failed")
+    finally:
+        close_old_connections()
+
+def schedule(delay):
+    """Requeue due paused runs after `delay` seconds."""
+    timer = threading.Timer(delay, _sweep)
+    timer.daemon = True
+    timer.start()
+
+def start_sweeper():
+    """Requeue due paused runs now and every RUN_PAUSED_SWEEP_SECONDS.
+
+    The timer set by `pause` dies with its process; the sweep picks up runs
+    paused by a process that was restarted since. Started by the WSGI and ASGI
+    entry points.
+    """
+    global _sweeper
+    with _executors_lock:
+        if _sweeper is not None or not settings.RUN_PAUSED_SWEEP_SECONDS:
+            return
+        _sweeper = threading.Thread(target=_sweep_forever, name='paused-run-sweeper', daemon=True)
+        _sweeper.start()
+
+def _sweep_forever():
+    while True:
+        _sweep()
+        time.sleep(settings.RUN_PAUSED_SWEEP_SECONDS)
+
+def resume(test_run, amount):
+    """Queue a failed run again, reserving `amount`; it continues after the questions it already answered."""
+    with transaction.atomic():
+        if not TestRun.objects.filter(pk=test_run.pk, status='failed').update(budget=None):
+            raise ledger.AlreadyReserved(f"Test run {test_run.pk} is not failed")
+        test_run.budget_id = None
+        ledger.reserve_for_runs([test_run], [amount])
+        # Saved, not updated, so the analytics rollups drop the failed attempt;
+        # from a fresh copy, whose snapshot of the analytics fields is current.
+        failed = TestRun.objects.get(pk=test_run.pk)
+        failed.status = test_run.status = 'pending'
+        failed.result = test_run.result = None
+        failed.completed_at = test_run.completed_at = None
+        failed.save(update_fields=['status', 'result', 'completed_at'])
+    enqueue(test_run)
+
+def question_cost_total(test_run):
+    """What the run has spent, over all its attempts: the sum of its questions' costs."""
+    return QuestionResult.objects.filter(test_run_id=test_run.pk).aggregate(total=Sum('cost'))['total'] or Decimal(0)
+
+def remaining_questions(test_run):
+    """How many of the run's questions have no answer to their current prompt yet."""
+    hashes = {index: prompt_hash(prompt) for index, prompt in enumerate(iter_prompts(test_run))}
+    answered = test_run.question_results.filter(error__isnull=True).values_list('index', 'prompt_hash')
+    return len(hashes) - sum(hashes.get(index) == digest for index, digest in answered)
+
+def grade(test_run_id, test_type):
+    """Grade a closed test's run against its answer keys, or measure an open test's run against its references."""
+    try:
+        if test_type in grading.CLOSED_TEST_TYPES:
+            grading.grade_runs([test_run_id])
+        else:
+            grading.measure_runs([test_run_id], workers=1)
+    except Exception:
+        logger.exception("Grading test run %s failed", test_run_id)
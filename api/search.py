@@ -0,0 +1,125 @@
+import re
+from django.db import connection
+from .hebrew import normalize
+
+# Full-text index over Source (name, content) and Introduction (content).
+# Text is stored Hebrew-normalized, so queries match regardless of niqqud,
+# cantillation or final letter forms, and snippets show the normalized text.
+#
+# SQLite uses one FTS5 table per kind, keyed by object id, so a search never
+# has to filter on an unindexed column; PostgreSQL uses one table with a
+# weighted tsvector column and a GIN index. Both are created by migration 0008.
+
+TABLE = 'api_search_index'
+KINDS = ('source', 'introduction')
+
+_TOKEN = re.compile(r"\w+")
+
+def document_for(kind, obj):
+    if kind == 'source':
+        return normalize(obj.name), normalize(obj.content)
+    return '', normalize(obj.content)
+
+def query_tokens(query):
+    return _TOKEN.findall(normalize(query))
+
+def sqlite_table(kind):
+    return f"{TABLE}_{kind}"
+
+class SqliteBackend:
+    def index(self, cursor, kind, objects):
+        table = sqlite_table(kind)
+        rows = [(obj.pk,) + document_for(kind, obj) for obj in objects]
+        cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(f"INSERT INTO {table} (rowid, name, content) VALUES (%s, %s, %s)", rows)
+
+    def remove(self, cursor, kind, object_ids):
+        cursor.executemany(f"DELETE FROM {sqlite_table(kind)} WHERE rowid = %s", [(pk,) for pk in object_ids])
+
+    def clear(self, cursor, kind):
+        cursor.execute(f"DELETE FROM {sqlite_table(kind)}")
+
+    def search(self, cursor, kind, tokens, limit):
+        table = sqlite_table(kind)
+        match = " ".join('"%s"' % token.replace('"', '""') for token in tokens)
+        cursor.execute(
+            f"SELECT rowid, snippet({table}, 1, '<mark>', '</mark>', '…', 16), bm25({table}, 10.0, 1.0) AS rank "
+            f"FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s",
+            [match, limit])
+        return [(object_id, snippet, -rank) for object_id, snippet, rank in cursor.fetchall()]
+
+class PostgresBackend:
+    def index(self, cursor, kind, objects):
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (kind, object_id, name, content, document) "
+            "VALUES (%s, %s, %s, %s, setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B')) "
+            "ON CONFLICT (kind, object_id) DO UPDATE SET "
+            "name = EXCLUDED.name, content = EXCLUDED.content, document = EXCLUDED.document",
+            [(kind, obj.pk) + document_for(kind, obj) * 2 for obj in objects])
+
+    def remove(self, cursor, kind, object_ids):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s AND object_id = ANY(%s)", [kind, list(object_ids)])
+
+    def clear(self, cursor, kind):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s", [kind])
+
+    def search(self, cursor, kind, tokens, limit):
+        # Headlines are only computed for the top `limit` rows.
+        cursor.execute(
+            "SELECT object_id, ts_headline('simple', content, query, "
+            "'StartSel=<mark>, StopSel=</mark>, MaxWords=16, MinWords=8'), rank FROM ("
+            f"SELECT object_id, content, query, ts_rank(document, query) AS rank FROM {TABLE}, "
+            "to_tsquery('simple', %s) query "
+            "WHERE kind = %s AND document @@ query ORDER BY rank DESC LIMIT %s) top ORDER BY rank DESC",
+            [" & ".join(tokens), kind, limit])
+        return cursor.fetchall()
+
+def get_backend():
+    if connection.vendor == 'sqlite':
+        return SqliteBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    return None
+
+def index_objects(kind, objects):
+    backend = get_backend()
+    objects = list(objects)
+    if backend is None or not objects:
+        return
+    with connection.cursor() as cursor:
+        backend.index(cursor, kind, objects)
+
+def remove_objects(kind, object_ids):
+    backend = get_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, kind, object_ids)
+
+def rebuild(kind, queryset, batch_size=1000):
+    backend = get_backend()
+    if backend is None:
+        return 0
+    count = 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor, kind)
+        batch = []
+        for obj in queryset.iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) == batch_size:
+                backend.index(cursor, kind, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            backend.index(cursor, kind, batch)
+            count += len(batch)
+    return count
+
+def search(kind, query, limit=20):
+    """Return (object_id, snippet, rank) tuples, best match first."""
+    backend = get_backend()
+    tokens = query_tokens(query)
+    if backend is None or not tokens:
+        return []
+    with connection.cursor() as cursor:
+        return backend.search(cursor, kind, tokens, limit)
@@ -1,28 +1,105 @@
+from decimal import Decimal
+from django.db.models import Count, Q, Sum
 from rest_framework import serializers
-from .models import Source, Test, Introduction, LanguageModel, TestRun, Evaluation, Budget
+from .models import Source, Test, Introduction, LanguageModel, CircuitBreaker, TestRunBatch, TestRun, QuestionResult, Evaluation, AnswerMetrics, Budget, ModelStats, ModelTestStats
+from .grading import CLOSED_TEST_TYPES
+from .resilience import retry_after
+from .prompts import TemplateError, compile_template
 
-class SourceSerializer(serializers.ModelSerializer):
+class SelectableFieldsMixin:
+    """Accepts `fields`, the subset of fields to serialize, and `expand`, the
+    relations in `expandable_fields` to nest instead of giving their ids.
+
+    `expandable_fields` maps a field to (serializer class, its fields); a
+    dotted name such as `test_run.test` expands a relation of a nested object.
+    """
+
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in {name.split('.')[0] for name in expand}:
+            if name not in self.expandable_fields or name not in self.fields:
+                continue
+            serializer_class, serializer_fields = self.expandable_fields[name]
+            nested = [item.split('.', 1)[1] for item in expand if item.startswith(name + '.')]
+            self.fields[name] = serializer_class(fields=serializer_fields, expand=nested, read_only=True)
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Resolves ids from `context['preloaded']` when a bulk request loaded them up front."""
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.get_queryset().model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in preloaded:
+            self.fail('does_not_exist', pk_value=data)
+        return preloaded[pk]
+
+class SourceSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Source
         fields = ['id', 'name', 'content', 'created_at', 'updated_at']
 
-class TestSerializer(serializers.ModelSerializer):
+class TestSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
+
     class Meta:
         model = Test
-        fields = ['id', 'name', 'description', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'description', 'test_type', 'questions', 'sources', 'created_at', 'updated_at']
+
+    def validate_questions(self, value):
+        if not isinstance(value, list):
+            raise serializers.ValidationError("Questions must be a list.")
+        for item in value:
+            question = item.get('question') if isinstance(item, dict) else item
+            if not isinstance(question, str) or not question.strip():
+                raise serializers.ValidationError("Each question must be a non-empty string or an object with a 'question' string.")
+        return value
+
+    def validate(self, data):
+        test_type = data.get('test_type', getattr(self.instance, 'test_type', 'open'))
+        questions = data.get('questions', getattr(self.instance, 'questions', []))
+        if test_type in CLOSED_TEST_TYPES:
+            if not questions:
+                raise serializers.ValidationError({'questions': "Closed tests need questions with answer keys."})
+            for item in questions:
+                answer = item.get('answer') if isinstance(item, dict) else None
+                answers = answer if isinstance(answer, list) else [answer]
+                if not answers or not all(isinstance(value, (str, int)) and str(value).strip() for value in answers):
+                    raise serializers.ValidationError(
+                        {'questions': "Every question of a closed test needs an 'answer': a string or a list of strings."})
+        return data
 
-class IntroductionSerializer(serializers.ModelSerializer):
+class IntroductionSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Introduction
         fields = ['id', 'content', 'created_at', 'updated_at']
 
-class LanguageModelSerializer(serializers.ModelSerializer):
+class LanguageModelSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = LanguageModel
         fields = ['id', 'name', 'api_key', 'prompt_template', 'library', 'tokenizer_type', 
-                  'input_cost_per_1k_tokens', 'output_cost_per_1k_tokens']
+                  'input_cost_per_1k_tokens', 'output_cost_per_1k_tokens', 'context_window',
+                  'requests_per_minute', 'tokens_per_minute']
         extra_kwargs = {'api_key': {'write_only': True}}
 
+    def validate_prompt_template(self, value):
+        try:
+            compile_template(value)
+        except TemplateError as exc:
+            raise serializers.ValidationError(str(exc))
+        return value
+
     def validate(self, data):
         input_cost = data.get('input_cost_per_1k_tokens')
         output_cost = data.get('output_cost_per_1k_tokens')
@@ -35,17 +112,153 @@ class LanguageModelSerializer(serializers.ModelSerializer):
 
         return data
 
-class TestRunSerializer(serializers.ModelSerializer):
+class TestRunSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'test': (TestSerializer, ['id', 'name', 'description']),
+        'language_model': (LanguageModelSerializer, ['id', 'name', 'library', 'tokenizer_type']),
+    }
+
     class Meta:
         model = TestRun
-        fields = ['id', 'test', 'language_model', 'status', 'started_at', 'completed_at', 'result', 'cost']
+        fields = ['id', 'test', 'language_model', 'introductions', 'batch', 'status', 'started_at', 'completed_at',
+                  'resume_at', 'result', 'cost', 'use_cache', 'cache_hits']
+        read_only_fields = ['batch', 'resume_at', 'cache_hits']
+
+class CircuitBreakerSerializer(serializers.ModelSerializer):
+    retry_after = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CircuitBreaker
+        fields = ['language_model', 'state', 'consecutive_failures', 'opened_at', 'retry_after',
+                  'successes', 'failures', 'timeouts', 'retries', 'hedges', 'rejections']
+
+    def get_retry_after(self, obj):
+        return retry_after(obj)
+
+class QuestionResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = QuestionResult
+        fields = ['index', 'prompt_hash', 'answer', 'input_tokens', 'output_tokens', 'latency', 'cost', 'cached', 'error', 'created_at']
+
+class RunEstimateSerializer(serializers.Serializer):
+    tests = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    language_models = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    introductions = serializers.ListField(
+        child=serializers.ListField(child=serializers.IntegerField(), allow_empty=True),
+        required=False, default=[[]])
+    max_output_tokens = serializers.IntegerField(required=False, min_value=0)
+
+    def _load(self, queryset, ids, field):
+        objects = queryset.in_bulk(set(ids))
+        missing = sorted(set(ids) - set(objects))
+        if missing:
+            raise serializers.ValidationError({field: f"Unknown ids: {missing}"})
+        return objects
+
+    def validate(self, data):
+        tests = self._load(Test.objects.all(), data['tests'], 'tests')
+        language_models = self._load(LanguageModel.objects.all(), data['language_models'], 'language_models')
+        introductions = self._load(Introduction.objects.with_text(), [pk for ids in data['introductions'] for pk in ids], 'introductions')
+        data['tests'] = [tests[pk] for pk in data['tests']]
+        data['language_models'] = [language_models[pk] for pk in data['language_models']]
+        data['introductions'] = [[introductions[pk] for pk in ids] for ids in data['introductions'] or [[]]]
+        return data
+
+class RunAllModelsSerializer(serializers.Serializer):
+    language_models = serializers.PrimaryKeyRelatedField(queryset=LanguageModel.objects.all(), many=True, required=False)
+    introductions = serializers.PrimaryKeyRelatedField(queryset=Introduction.objects.with_text(), many=True, required=False)
+
+class UsageSerializer(serializers.Serializer):
+    usage = serializers.DecimalField(max_digits=12, decimal_places=6, min_value=Decimal(0), default=Decimal(0))
+
+class GradeSerializer(serializers.Serializer):
+    test_runs = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+
+class RelatedDocumentsSerializer(serializers.Serializer):
+    tests = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    kind = serializers.ChoiceField(choices=['introduction', 'source'], default='introduction')
+    k = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    def validate_tests(self, value):
+        tests = Test.objects.in_bulk(set(value))
+        missing = sorted(set(value) - set(tests))
+        if missing:
+            raise serializers.ValidationError(f"Unknown ids: {missing}")
+        return [tests[pk] for pk in value]
+
+def batch_progress(prefix=''):
+    """Aggregates of a batch's test runs; with a prefix, as annotations on TestRunBatch."""
+    return {
+        'total': Count(f'{prefix}id'),
+        'pending': Count(f'{prefix}id', filter=Q(**{f'{prefix}status': 'pending'})),
+        'in_progress': Count(f'{prefix}id', filter=Q(**{f'{prefix}status': 'in_progress'})),
+        'paused': Count(f'{prefix}id', filter=Q(**{f'{prefix}status': 'paused'})),
+        'completed': Count(f'{prefix}id', filter=Q(**{f'{prefix}status': 'completed'})),
+        'failed': Count(f'{prefix}id', filter=Q(**{f'{prefix}status': 'failed'})),
+        'cost': Sum(f'{prefix}cost'),
+    }
+
+BATCH_PROGRESS_ANNOTATIONS = {f'progress_{name}': value for name, value in batch_progress('test_runs__').items()}
+
+class TestRunBatchSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TestRunBatch
+        fields = ['id', 'test', 'created_at', 'progress']
+
+    def get_progress(self, obj):
+        if hasattr(obj, 'progress_total'):
+            # Annotated by the viewset queryset with BATCH_PROGRESS_ANNOTATIONS.
+            progress = {name: getattr(obj, f'progress_{name}') for name in batch_progress()}
+        else:
+            progress = obj.test_runs.aggregate(**batch_progress())
+        finished = progress['completed'] + progress['failed']
+        progress['cost'] = progress['cost'] or 0
+        progress['done'] = finished == progress['total']
+        progress['fraction'] = finished / progress['total'] if progress['total'] else 1.0
+        return progress
+
+class EvaluationSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    # Option labels in the browsable API render TestRun.__str__.
+    test_run = PreloadedPrimaryKeyRelatedField(queryset=TestRun.objects.select_related('test', 'language_model'))
+
+    expandable_fields = {
+        'test_run': (TestRunSerializer, ['id', 'test', 'language_model', 'status', 'cost', 'started_at', 'completed_at']),
+    }
 
-class EvaluationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Evaluation
-        fields = ['id', 'test_run', 'score', 'comments', 'created_at']
+        fields = ['id', 'test_run', 'score', 'comments', 'is_automatic', 'created_at']
+        read_only_fields = ['is_automatic']
+
+class AnswerMetricsSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    test = serializers.IntegerField(source='test_run.test_id', read_only=True)
+    language_model = serializers.IntegerField(source='test_run.language_model_id', read_only=True)
 
-class BudgetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AnswerMetrics
+        fields = ['id', 'test_run', 'test', 'language_model', 'chrf', 'rouge_l', 'token_f1', 'questions', 'created_at']
+
+class BudgetSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Budget
-        fields = ['id', 'date', 'daily_limit', 'current_usage']
\ No newline at end of file
+        fields = ['id', 'date', 'daily_limit', 'current_usage', 'reserved']
+        # Moved by api.ledger only; update_usage adds to current_usage.
+        read_only_fields = ['current_usage', 'reserved']
+
+class ModelStatsSerializer(serializers.ModelSerializer):
+    language_model_name = serializers.CharField(source='language_model.name', read_only=True)
+    mean_score = serializers.FloatField(read_only=True)
+    score_variance = serializers.FloatField(read_only=True)
+    average_latency = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ModelStats
+        fields = ['language_model', 'language_model_name', 'evaluation_count', 'mean_score', 'score_variance',
+                  'score_min', 'score_max', 'run_count', 'total_cost', 'average_latency']
+
+class ModelTestStatsSerializer(ModelStatsSerializer):
+    class Meta(ModelStatsSerializer.Meta):
+        model = ModelTestStats
+        fields = ModelStatsSerializer.Meta.fields[:2] + ['test'] + ModelStatsSerializer.Meta.fields[2:]
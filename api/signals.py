@@ -0,0 +1,111 @@
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from . import analytics, retrieval, search
+from .models import Source, Test, Introduction, LanguageModel, TestRun, Evaluation, Budget
+from .read_cache import read_cache
+
+@receiver(post_save, sender=Source)
+def index_source(sender, instance, **kwargs):
+    search.index_objects('source', [instance])
+    retrieval.index_objects('source', [instance])
+
+@receiver(post_delete, sender=Source)
+def unindex_source(sender, instance, **kwargs):
+    search.remove_objects('source', [instance.pk])
+    retrieval.remove_objects('source', [instance.pk])
+
+# A test's representation lists its sources, so changing them must move its
+# updated_at (the basis of its ETag) and drop its cached reads, even though
+# the test row is not saved.
+
+def _touch_tests(test_ids):
+    now = timezone.now()
+    test_ids = list(test_ids)
+    if test_ids:
+        Test.objects.filter(pk__in=test_ids).update(updated_at=now)
+        read_cache.invalidate(Test, test_ids)
+    return now
+
+@receiver(m2m_changed, sender=Test.sources.through)
+def touch_tests_on_sources_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.updated_at = _touch_tests([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        _touch_tests(pk_set)
+    elif action == 'pre_clear':
+        _touch_tests(instance.tests.values_list('pk', flat=True))
+
+@receiver(pre_delete, sender=Source)
+def touch_tests_on_source_delete(sender, instance, **kwargs):
+    _touch_tests(instance.tests.values_list('pk', flat=True))
+
+@receiver(post_save, sender=Source)
+@receiver(post_save, sender=Test)
+@receiver(post_save, sender=LanguageModel)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Source)
+@receiver(post_delete, sender=Test)
+@receiver(post_delete, sender=LanguageModel)
+@receiver(post_delete, sender=Budget)
+def invalidate_read_cache(sender, instance, **kwargs):
+    read_cache.invalidate(sender, [instance.pk])
+
+@receiver(post_save, sender=Introduction)
+def index_introduction(sender, instance, **kwargs):
+    search.index_objects('introduction', [instance])
+    retrieval.index_objects('introduction', [instance])
+
+@receiver(post_delete, sender=Introduction)
+def unindex_introduction(sender, instance, **kwargs):
+    search.remove_objects('introduction', [instance.pk])
+    retrieval.remove_objects('introduction', [instance.pk])
+
+def _evaluation_group(evaluation):
+    if Evaluation.test_run.is_cached(evaluation):
+        return evaluation.test_run.language_model_id, evaluation.test_run.test_id
+    return TestRun.objects.filter(pk=evaluation.test_run_id).values_list('language_model_id', 'test_id').first()
+
+@receiver(post_init, sender=Evaluation)
+def remember_evaluation(sender, instance, **kwargs):
+    instance._analytics_state = (instance.__dict__.get('test_run_id'), instance.__dict__.get('score'))
+
+@receiver(post_save, sender=Evaluation)
+def update_evaluation_stats(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_analytics_state', None)
+    new = (instance.test_run_id, instance.score)
+    if old == new:
+        return
+    if old is not None and None not in old:
+        # The test run of an evaluation rarely changes; look up its old group only then.
+        group = _evaluation_group(instance) if old[0] == new[0] else TestRun.objects.filter(
+            pk=old[0]).values_list('language_model_id', 'test_id').first()
+        if group is not None:
+            analytics.remove_score(*group, old[1])
+    group = _evaluation_group(instance)
+    if group is not None:
+        analytics.add_score(*group, instance.score)
+    instance._analytics_state = new
+
+@receiver(post_delete, sender=Evaluation)
+def remove_evaluation_stats(sender, instance, **kwargs):
+    # Cascades delete evaluations before their test run, so the group can still be looked up.
+    group = _evaluation_group(instance)
+    if group is not None:
+        analytics.remove_score(*group, instance.score)
+
+@receiver(post_init, sender=TestRun)
+def remember_test_run(sender, instance, **kwargs):
+    instance._analytics_state = analytics.run_state(instance)
+
+@receiver(post_save, sender=TestRun)
+def update_test_run_stats(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_analytics_state', None)
+    new = analytics.run_state(instance)
+    analytics.test_run_changed(old, new)
+    instance._analytics_state = new
+
+@receiver(post_delete, sender=TestRun)
+def remove_test_run_stats(sender, instance, **kwargs):
+    analytics.test_run_changed(analytics.run_state(instance), None)
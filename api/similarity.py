@@ -0,0 +1,149 @@
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import chain
+import numpy as np
+from .hebrew import normalize
+
+# Similarity of a model's answer to a reference answer, for triaging open
+# questions: chrF (character 1-6-gram F-score with recall weighted by beta=2),
+# ROUGE-L (F1 of the longest common token subsequence) and token F1 (F1 of the
+# token multisets). All three are in [0, 1] and computed on normalized text
+# (no niqqud, cantillation, final letter forms or punctuation).
+#
+# A chunk of pairs is scored at once: every character n-gram and token becomes
+# a 64-bit (pair, hash, side) key; one sort of the keys of all hypotheses and
+# references lines up equal features, and bincount sums the clipped matches
+# per pair. The LCS is bit-parallel, one big-integer step per token. This
+# module imports nothing from Django so that process pool workers can score
+# chunks on every core.
+
+METRICS = ('chrf', 'rouge_l', 'token_f1')
+
+CHRF_ORDER = 6
+CHRF_BETA = 2
+
+CHUNK_SIZE = 1000
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+_PRIME = np.uint64(1099511628211)
+# Multiply-shift: the high 32 bits of hash * _SPREAD depend on every character.
+_SPREAD = np.uint64(0x9E3779B97F4A7C15)
+
+def tokenize(text):
+    return _PUNCTUATION.sub(" ", normalize(str(text))).split()
+
+def _f_score(precision, recall, beta=1):
+    beta2 = beta * beta
+    denominator = beta2 * precision + recall
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, (1 + beta2) * precision * recall / denominator, 0.0)
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator, 0.0)
+
+def _matches(keys, pairs):
+    """Clipped matches per pair, given (pair << 33 | feature << 1 | side) keys of both texts of every pair."""
+    # Sorting lines up equal features of a pair; within each run of equal
+    # features the hypothesis entries (side 0) come first.
+    keys = np.sort(keys)
+    if not len(keys):
+        return np.zeros(pairs)
+    features = keys >> np.uint64(1)
+    boundaries = np.empty(len(keys), dtype=bool)
+    boundaries[0] = True
+    np.not_equal(features[1:], features[:-1], out=boundaries[1:])
+    starts = np.flatnonzero(boundaries)
+    totals = np.diff(starts, append=len(keys))
+    from_hypothesis = np.add.reduceat((keys & np.uint64(1)) == 0, starts)
+    matches = np.minimum(from_hypothesis, totals - from_hypothesis)
+    return np.bincount((features[starts] >> np.uint64(32)).astype(np.int64), weights=matches, minlength=pairs)
+
+def _prefixes(lengths, pairs):
+    """The (pair << 33 | side) part of the keys of every item of the hypotheses followed by the references."""
+    owners = np.repeat(np.arange(2 * pairs, dtype=np.uint64), lengths)
+    return ((owners % np.uint64(pairs)) << np.uint64(33)) | (owners >= pairs).astype(np.uint64), owners
+
+def chrf_scores(hypotheses, references):
+    """chrF of each (hypothesis, reference) pair of token lists."""
+    pairs = len(hypotheses)
+    texts = ["".join(tokens) for tokens in hypotheses] + ["".join(tokens) for tokens in references]
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    prefixes, owners = _prefixes(lengths, pairs)
+    remaining = np.repeat(np.cumsum(lengths), lengths) - np.arange(len(codes))
+    hashes = np.zeros_like(codes)
+    following = np.empty_like(codes)
+    precision = np.zeros(pairs)
+    recall = np.zeros(pairs)
+    orders = np.zeros(pairs)
+    for n in range(1, CHRF_ORDER + 1):
+        # Extend the hashes of the (n-1)-grams starting at each position by one character.
+        following[:len(codes) - n + 1] = codes[n - 1:]
+        following[len(codes) - n + 1:] = 0
+        hashes = hashes * _PRIME + following + np.uint64(1)
+        valid = remaining >= n
+        matches = _matches(prefixes[valid] | (((hashes[valid] * _SPREAD) >> np.uint64(32)) << np.uint64(1)), pairs)
+        totals = np.bincount(owners[valid].astype(np.int64), minlength=2 * pairs)
+        hypothesis_total, reference_total = totals[:pairs], totals[pairs:]
+        # Orders longer than either text are left out of the averages.
+        counted = (hypothesis_total > 0) & (reference_total > 0)
+        precision += np.where(counted, _ratio(matches, hypothesis_total), 0.0)
+        recall += np.where(counted, _ratio(matches, reference_total), 0.0)
+        orders += counted
+    return _f_score(_ratio(precision, orders), _ratio(recall, orders), CHRF_BETA)
+
+def lcs_length(a, b):
+    """Length of the longest common subsequence of two sequences (Hyyrö's bit-vector algorithm)."""
+    if not a or not b:
+        return 0
+    if len(a) > len(b):
+        a, b = b, a
+    positions = {}
+    for index, item in enumerate(a):
+        positions[item] = positions.get(item, 0) | (1 << index)
+    mask = (1 << len(a)) - 1
+    vector = mask
+    for item in b:
+        matched = vector & positions.get(item, 0)
+        vector = ((vector + matched) | (vector - matched)) & mask
+    return len(a) - vector.bit_count()
+
+def score_pairs(pairs):
+    """chrF, ROUGE-L and token F1 of each (hypothesis, reference) pair of texts, as a (pairs, 3) array."""
+    if not pairs:
+        return np.zeros((0, len(METRICS)))
+    hypotheses = [tokenize(hypothesis) for hypothesis, _ in pairs]
+    references = [tokenize(reference) for _, reference in pairs]
+    codes = {}
+    token_codes = [[codes.setdefault(token, len(codes)) for token in tokens] for tokens in hypotheses + references]
+    lengths = np.fromiter(map(len, token_codes), dtype=np.int64, count=len(token_codes))
+    flat = np.fromiter(chain.from_iterable(token_codes), dtype=np.uint64, count=int(lengths.sum()))
+    common = _matches(_prefixes(lengths, len(pairs))[0] | (flat << np.uint64(1)), len(pairs))
+    hypothesis_lengths, reference_lengths = lengths[:len(pairs)], lengths[len(pairs):]
+    token_f1 = _f_score(_ratio(common, hypothesis_lengths), _ratio(common, reference_lengths))
+
+    lcs = np.fromiter((lcs_length(a, b) for a, b in zip(token_codes, token_codes[len(pairs):])),
+                      dtype=np.float64, count=len(pairs))
+    rouge_l = _f_score(_ratio(lcs, hypothesis_lengths), _ratio(lcs, reference_lengths))
+
+    return np.column_stack([chrf_scores(hypotheses, references), rouge_l, token_f1])
+
+def pool(workers):
+    """A process pool of `workers` processes for score_many, or a null context if workers <= 1."""
+    if workers <= 1:
+        return nullcontext(None)
+    # Spawned rather than forked: the parent has database connections and runner threads.
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+def score_many(pairs, executor=None):
+    """score_pairs over chunks of CHUNK_SIZE pairs, spread over `executor`'s processes if given."""
+    chunks = [pairs[start:start + CHUNK_SIZE] for start in range(0, len(pairs), CHUNK_SIZE)]
+    if executor is None or len(chunks) < 2:
+        results = [score_pairs(chunk) for chunk in chunks]
+    else:
+        results = list(executor.map(score_pairs, chunks))
+    return np.concatenate(results) if results else np.zeros((0, len(METRICS)))
@@ -0,0 +1,149 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api import analytics, runner
+from api.models import Test, TestRun, Evaluation, ModelStats, ModelTestStats
+from api.tests.test_runner import create_language_model
+
+def stats_values(model):
+    fields = ('evaluation_count', 'score_sum', 'score_sum_sq', 'score_min', 'score_max',
+              'run_count', 'total_cost', 'latency_sum')
+    return sorted(model.objects.values_list('language_model_id', *fields))
+
+class RollupTest(TestCase):
+    def setUp(self):
+        self.model = create_language_model()
+        self.other_model = create_language_model(name='Other')
+        self.test = Test.objects.create(name="בראשית", description="שאלות")
+        self.other_test = Test.objects.create(name="שמות", description="שאלות")
+        self.run = TestRun.objects.create(test=self.test, language_model=self.model)
+
+    def evaluate(self, score, test_run=None):
+        return Evaluation.objects.create(test_run=test_run or self.run, score=score)
+
+    def test_scores_roll_up(self):
+        for score in (2, 4, 9):
+            self.evaluate(score)
+        stats = ModelTestStats.objects.get(language_model=self.model, test=self.test)
+        self.assertEqual(stats.evaluation_count, 3)
+        self.assertAlmostEqual(stats.mean_score, 5)
+        self.assertAlmostEqual(stats.score_variance, 26 / 3)
+        self.assertEqual((stats.score_min, stats.score_max), (2, 9))
+        self.assertEqual(ModelStats.objects.get(language_model=self.model).evaluation_count, 3)
+
+    def test_update_and_delete_adjust_bounds(self):
+        low = self.evaluate(1)
+        self.evaluate(5)
+        high = self.evaluate(8)
+        high.score = 6
+        high.save()
+        low.delete()
+        stats = ModelStats.objects.get(language_model=self.model)
+        self.assertEqual(stats.evaluation_count, 2)
+        self.assertAlmostEqual(stats.mean_score, 5.5)
+        self.assertEqual((stats.score_min, stats.score_max), (5, 6))
+
+    def test_finished_runs_add_cost_and_latency(self):
+        started = timezone.now()
+        self.run.status = 'completed'
+        self.run.started_at = started
+        self.run.completed_at = started + timedelta(seconds=3)
+        self.run.cost = Decimal('0.5')
+        self.run.save()
+        self.run.save()
+        TestRun.objects.create(test=self.other_test, language_model=self.model, status='failed', cost=Decimal('0.25'),
+                               started_at=started, completed_at=started + timedelta(seconds=1))
+        stats = ModelStats.objects.get(language_model=self.model)
+        self.assertEqual(stats.run_count, 2)
+        self.assertEqual(stats.total_cost, Decimal('0.75'))
+        self.assertAlmostEqual(stats.average_latency, 2)
+        self.assertEqual(ModelTestStats.objects.get(language_model=self.model, test=self.test).run_count, 1)
+
+    @override_settings(RUN_EAGER=True, FAKE_PROVIDER_LATENCY=0)
+    def test_runner_updates_rollups(self):
+        self.test.questions = ["מי ברא?"]
+        self.test.save()
+        runner.execute_test_run(self.run.pk)
+        stats = ModelStats.objects.get(language_model=self.model)
+        self.assertEqual(stats.run_count, 1)
+        self.assertEqual(stats.total_cost, TestRun.objects.get(pk=self.run.pk).cost)
+
+    def test_deleting_run_removes_its_evaluations_and_cost(self):
+        now = timezone.now()
+        finished = TestRun.objects.create(test=self.test, language_model=self.model, status='completed',
+                                          cost=Decimal('1'), started_at=now, completed_at=now)
+        self.evaluate(3, finished)
+        self.evaluate(7)
+        finished.delete()
+        stats = ModelStats.objects.get(language_model=self.model)
+        self.assertEqual((stats.evaluation_count, stats.run_count, stats.total_cost), (1, 0, 0))
+        self.assertEqual((stats.score_min, stats.score_max), (7, 7))
+
+    def test_moving_run_moves_its_evaluations(self):
+        self.evaluate(4)
+        self.run.language_model = self.other_model
+        self.run.save()
+        self.assertEqual(ModelStats.objects.get(language_model=self.model).evaluation_count, 0)
+        self.assertEqual(ModelStats.objects.get(language_model=self.other_model).evaluation_count, 1)
+
+    def test_deleting_language_model_removes_its_stats(self):
+        self.evaluate(4)
+        self.model.delete()
+        self.assertFalse(ModelStats.objects.exists())
+        self.assertFalse(ModelTestStats.objects.exists())
+
+    def test_rebuild_matches_incremental(self):
+        now = timezone.now()
+        for index, (language_model, test) in enumerate([(self.model, self.test), (self.model, self.other_test),
+                                                        (self.other_model, self.test)]):
+            run = TestRun.objects.create(test=test, language_model=language_model, status='completed',
+                                         cost=Decimal(index), started_at=now, completed_at=now + timedelta(seconds=index))
+            for score in range(index + 2):
+                self.evaluate(score * 1.5, run)
+        self.evaluate(10).delete()
+        incremental = (stats_values(ModelStats), stats_values(ModelTestStats))
+        out = StringIO()
+        call_command('rebuild_analytics', stdout=out)
+        self.assertIn("2 language models and 3 model/test pairs", out.getvalue())
+        self.assertEqual((stats_values(ModelStats), stats_values(ModelTestStats)), incremental)
+
+class LeaderboardViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.test = Test.objects.create(name="בראשית", description="שאלות")
+        self.models = [create_language_model(name=f"Model {i}") for i in range(3)]
+        for index, language_model in enumerate(self.models):
+            run = TestRun.objects.create(test=self.test, language_model=language_model)
+            for score in (index, index + 2):
+                Evaluation.objects.create(test_run=run, score=score)
+        create_language_model(name="Unevaluated")
+
+    def test_ranks_by_mean_score(self):
+        response = self.client.get(reverse('analytics-leaderboard'))
+        self.assertEqual(response.status_code, 200)
+        names = [row['language_model_name'] for row in response.data['results']]
+        self.assertEqual(names, ["Model 2", "Model 1", "Model 0"])
+        self.assertEqual(response.data['results'][0]['mean_score'], 3)
+        self.assertEqual(response.data['results'][0]['score_variance'], 1)
+
+    def test_per_test_leaderboard(self):
+        other = Test.objects.create(name="שמות", description="שאלות")
+        Evaluation.objects.create(test_run=TestRun.objects.create(test=other, language_model=self.models[0]), score=10)
+        response = self.client.get(reverse('analytics-leaderboard'), {'test': other.pk})
+        [row] = response.data['results']
+        self.assertEqual((row['language_model'], row['test'], row['mean_score']), (self.models[0].pk, other.pk, 10))
+
+    def test_reads_do_not_scan_evaluations(self):
+        run = TestRun.objects.create(test=self.test, language_model=self.models[0])
+        Evaluation.objects.bulk_create([Evaluation(test_run=run, score=1) for _ in range(500)])
+        with self.assertNumQueries(1):
+            self.client.get(reverse('analytics-leaderboard'))
+
+    def test_invalid_test(self):
+        response = self.client.get(reverse('analytics-leaderboard'), {'test': 'x'})
+        self.assertEqual(response.status_code, 400)
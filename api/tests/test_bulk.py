@@ -0,0 +1,121 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api import search
+from api.models import Source, Test, TestRun, Evaluation, ModelStats, ModelTestStats
+from api.tests.test_runner import create_language_model
+
+class BulkSourceTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('source-bulk')
+
+    def test_creates_in_constant_queries(self):
+        counts = []
+        for size in (10, 2000):
+            items = [{'name': f"מקור {size}-{i}", 'content': "בראשית ברא"} for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, items, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['created']), size)
+            counts.append(len(queries))
+        self.assertEqual(Source.objects.count(), 2010)
+        self.assertLess(counts[1], counts[0] + 20)
+
+    def test_created_sources_are_searchable(self):
+        self.client.post(self.url, [{'name': "שמות", 'content': "ואלה שמות בני ישראל"}], format='json')
+        self.assertEqual(len(search.search('source', "ישראל")), 1)
+
+    def test_creates_and_updates(self):
+        source = Source.objects.create(name="ישן", content="תוכן")
+        response = self.client.post(self.url, [
+            {'id': source.pk, 'name': "חדש"},
+            {'name': "עוד", 'content': "תוכן"},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['updated'], [source.pk])
+        updated = Source.objects.get(pk=source.pk)
+        self.assertEqual((updated.name, updated.content), ("חדש", "תוכן"))
+        self.assertGreater(updated.updated_at, source.updated_at)
+        self.assertEqual([hit[0] for hit in search.search('source', "חדש")], [source.pk])
+
+    def test_invalid_items_write_nothing(self):
+        response = self.client.post(self.url, [
+            {'name': "טוב", 'content': "תוכן"},
+            {'name': "x" * 101, 'content': "תוכן"},
+            {'id': 999, 'name': "חסר"},
+            "not an object",
+            {'name': "בלי תוכן"},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('name', errors[1])
+        self.assertIn('id', errors[2])
+        self.assertIn('non_field_errors', errors[3])
+        self.assertIn('content', errors[4])
+        self.assertFalse(Source.objects.exists())
+
+    def test_requires_list(self):
+        response = self.client.post(self.url, {'name': "מקור"}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+class BulkTestTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.sources = [Source.objects.create(name=f"מקור {i}", content="תוכן") for i in range(3)]
+
+    def test_sets_and_replaces_sources(self):
+        response = self.client.post(reverse('test-bulk'), [
+            {'name': f"מבחן {i}", 'description': "שאלות", 'questions': ["מה?"], 'sources': [self.sources[i].pk]}
+            for i in range(3)
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        test = Test.objects.get(pk=response.data['created'][0])
+        self.assertEqual(list(test.sources.all()), [self.sources[0]])
+
+        response = self.client.post(reverse('test-bulk'), [
+            {'id': test.pk, 'sources': [self.sources[1].pk, self.sources[2].pk]},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(test.sources.values_list('id', flat=True)), [self.sources[1].pk, self.sources[2].pk])
+
+    def test_unknown_source(self):
+        response = self.client.post(reverse('test-bulk'), [
+            {'name': "מבחן", 'description': "שאלות", 'sources': [self.sources[0].pk, 999]},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('sources', response.data['errors'][0])
+
+class BulkEvaluationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.model = create_language_model()
+        self.test = Test.objects.create(name="בראשית", description="שאלות")
+        self.runs = [TestRun.objects.create(test=self.test, language_model=self.model) for _ in range(5)]
+
+    def test_grades_roll_up(self):
+        response = self.client.post(reverse('evaluation-bulk'), [
+            {'test_run': run.pk, 'score': index} for index, run in enumerate(self.runs)
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        stats = ModelTestStats.objects.get(language_model=self.model, test=self.test)
+        self.assertEqual((stats.evaluation_count, stats.mean_score, stats.score_min, stats.score_max), (5, 2, 0, 4))
+
+        top = Evaluation.objects.get(score=4)
+        response = self.client.post(reverse('evaluation-bulk'), [{'id': top.pk, 'score': 1}], format='json')
+        self.assertEqual(response.status_code, 200)
+        stats = ModelStats.objects.get(language_model=self.model)
+        self.assertEqual((stats.evaluation_count, stats.score_sum, stats.score_max), (5, 7, 3))
+
+    def test_unknown_test_run(self):
+        response = self.client.post(reverse('evaluation-bulk'), [
+            {'test_run': self.runs[0].pk, 'score': 1},
+            {'test_run': 999, 'score': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0], {})
+        self.assertIn('test_run', response.data['errors'][1])
+        self.assertFalse(Evaluation.objects.exists())
@@ -0,0 +1,135 @@
+from decimal import Decimal
+from django.test import TestCase, override_settings
+from api import chunking
+from api.estimates import estimate_runs
+from api.models import Source, SourceTokenCount, SourceChunk, Test, LanguageModel, TestRun
+from api.prompts import build_prompts, format_sources
+from api.tokenizers import count_tokens, get_tokenizer
+
+def create_language_model(prompt_template="{sources}\n{question}", context_window=None):
+    return LanguageModel.objects.create(
+        name="Fake",
+        api_key="test_api_key",
+        prompt_template=prompt_template,
+        library="fake",
+        tokenizer_type="fallback",
+        input_cost_per_1k_tokens=Decimal("1.0000"),
+        output_cost_per_1k_tokens=Decimal("2.0000"),
+        context_window=context_window,
+    )
+
+def words(count, prefix="מלה"):
+    return " ".join(f"{prefix}{i % 10}" for i in range(count))
+
+class ChunkBoundsTest(TestCase):
+    def test_windows_cover_text_with_overlap(self):
+        text = words(100)
+        spans = get_tokenizer("fallback").spans(text)
+        bounds = chunking.chunk_bounds(text, spans, 20, 5)
+        self.assertEqual(bounds[0][0], 0)
+        self.assertEqual(bounds[-1][1], len(spans))
+        for (start, end), (next_start, _) in zip(bounds, bounds[1:]):
+            self.assertLessEqual(end - start, 20)
+            self.assertEqual(next_start, end - 5)
+
+    def test_prefers_sentence_end(self):
+        text = words(17) + ". " + words(20)
+        spans = get_tokenizer("fallback").spans(text)
+        start, end = chunking.chunk_bounds(text, spans, 20, 0)[0]
+        self.assertTrue(text[:spans[end - 1][1]].endswith("."))
+        self.assertLess(end, 20)
+
+    def test_empty_text(self):
+        self.assertEqual(chunking.chunk_bounds("", [], 20, 5), [])
+
+@override_settings(SOURCE_CHUNK_TOKENS=20, SOURCE_CHUNK_OVERLAP=5)
+class TokenCountsTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="בראשית", content=words(100))
+
+    def test_counts_are_stored(self):
+        row = chunking.token_counts([self.source], "fallback")[self.source.pk]
+        self.assertEqual(row.token_count, count_tokens(self.source.content, "fallback"))
+        self.assertEqual(SourceChunk.objects.filter(source_token_count=row).count(), len(row.chunks.all()))
+        chunks = list(row.chunks.all())
+        self.assertEqual(chunks[-1].end, len(self.source.content))
+
+    def test_recomputed_only_when_source_changes(self):
+        chunking.token_counts([self.source], "fallback")
+        # The sources (without their text), the stored counts and their chunks.
+        with self.assertNumQueries(3):
+            row = chunking.token_counts(Source.objects.filter(pk=self.source.pk), "fallback")[self.source.pk]
+        self.assertEqual(row.token_count, 100)
+        self.source.content = words(10)
+        self.source.save()
+        row = chunking.token_counts(Source.objects.filter(pk=self.source.pk), "fallback")[self.source.pk]
+        self.assertEqual(row.token_count, 10)
+        self.assertEqual(SourceTokenCount.objects.filter(source=self.source).count(), 1)
+
+    def test_counts_per_tokenizer_type(self):
+        chunking.token_counts([self.source], "fallback")
+        chunking.token_counts([self.source], "other")
+        self.assertEqual(SourceTokenCount.objects.filter(source=self.source).count(), 2)
+
+    def test_chunk_settings_change_recomputes(self):
+        chunking.token_counts([self.source], "fallback")
+        with override_settings(SOURCE_CHUNK_TOKENS=50):
+            row = chunking.token_counts([self.source], "fallback")[self.source.pk]
+        self.assertEqual(row.chunk_tokens, 50)
+
+@override_settings(SOURCE_CHUNK_TOKENS=20, SOURCE_CHUNK_OVERLAP=5)
+class PackTest(TestCase):
+    def setUp(self):
+        self.sources = [Source.objects.create(name=f"מקור {i}", content=words(50)) for i in range(3)]
+        counts = chunking.token_counts(self.sources, "fallback")
+        self.rows = [counts[source.pk] for source in self.sources]
+        self.separator = chunking.separator_tokens("fallback")
+
+    def test_total_matches_formatted_sources(self):
+        self.assertEqual(chunking.total_tokens(self.rows, self.separator),
+                         count_tokens(format_sources(self.sources), "fallback"))
+
+    def test_everything_fits(self):
+        selection, used, truncated = chunking.pack(self.rows, 10000, self.separator)
+        self.assertFalse(truncated)
+        self.assertEqual(used, chunking.total_tokens(self.rows, self.separator))
+        self.assertEqual(chunking.assemble(selection, {source.pk: source for source in self.sources}),
+                         format_sources(self.sources))
+
+    def test_cut_at_chunk_end(self):
+        budget = self.rows[0].name_tokens + self.rows[0].token_count + self.rows[1].name_tokens + 30
+        selection, used, truncated = chunking.pack(self.rows, budget, self.separator)
+        self.assertTrue(truncated)
+        self.assertEqual(len(selection), 2)
+        self.assertLessEqual(used, budget)
+        text = chunking.assemble(selection, {source.pk: source for source in self.sources})
+        self.assertEqual(count_tokens(text, "fallback"), used)
+        self.assertIn(self.sources[1].name, text)
+        self.assertNotIn(self.sources[2].name, text)
+
+@override_settings(SOURCE_CHUNK_TOKENS=20, SOURCE_CHUNK_OVERLAP=5, RUN_MAX_OUTPUT_TOKENS=50)
+class FitPromptTest(TestCase):
+    def setUp(self):
+        self.test = Test.objects.create(name="מבחן", description="הסבר", questions=["מי?"])
+        self.sources = [Source.objects.create(name=f"מקור {i}", content=words(200)) for i in range(3)]
+        self.test.sources.set(self.sources)
+
+    def test_prompt_fits_context_window(self):
+        language_model = create_language_model(context_window=400)
+        test_run = TestRun.objects.create(test=self.test, language_model=language_model)
+        prompt = build_prompts(test_run)[0]
+        self.assertLessEqual(count_tokens(prompt, "fallback") + 50, 400)
+        self.assertIn(self.sources[0].content, prompt)
+        self.assertNotIn(self.sources[2].name, prompt)
+
+    def test_no_context_window_keeps_all_sources(self):
+        language_model = create_language_model()
+        test_run = TestRun.objects.create(test=self.test, language_model=language_model)
+        self.assertIn(format_sources(self.sources), build_prompts(test_run)[0])
+
+    def test_estimate_matches_prompt(self):
+        language_model = create_language_model(context_window=400)
+        test_run = TestRun.objects.create(test=self.test, language_model=language_model)
+        prompt = build_prompts(test_run)[0]
+        row = estimate_runs([self.test], [language_model], [[]], max_output_tokens=50)[0]
+        self.assertEqual(row['input_tokens'], count_tokens(prompt, "fallback"))
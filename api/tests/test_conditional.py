@@ -0,0 +1,132 @@
+from datetime import timedelta
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api.models import Source, Test, Introduction
+
+class ConditionalDetailTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.source = Source.objects.create(name="בראשית", content="בראשית ברא")
+        self.url = reverse('source-detail', args=[self.source.pk])
+
+    def test_sets_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+    def test_not_modified_without_serializing(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(queries), 1)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_update_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.source.name = "שמות"
+        self.source.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_field_selection_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, {'fields': 'id,name'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_object(self):
+        self.assertEqual(self.client.get(reverse('source-detail', args=[self.source.pk + 1])).status_code, 404)
+
+class ConditionalListTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('introduction-list')
+        self.introductions = [Introduction.objects.create(content=f"הקדמה {i}") for i in range(3)]
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+    def test_create_update_and_delete_change_etag(self):
+        for change in (
+            lambda: Introduction.objects.create(content="חדשה"),
+            lambda: self.introductions[0].save(),
+            lambda: self.introductions[1].delete(),
+        ):
+            etag = self.client.get(self.url)['ETag']
+            change()
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_empty_list(self):
+        Introduction.objects.all().delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+class IncrementalSyncTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('source-list')
+        self.sources = [Source.objects.create(name=f"מקור {i}", content=f"תוכן {i}") for i in range(4)]
+
+    def ids(self, response):
+        data = response.data
+        return sorted(item['id'] for item in (data['results'] if isinstance(data, dict) else data))
+
+    def test_ids(self):
+        wanted = [self.sources[0].pk, self.sources[2].pk]
+        response = self.client.get(self.url, {'ids': ','.join(map(str, wanted))})
+        self.assertEqual(self.ids(response), wanted)
+        self.assertEqual(self.client.get(self.url, {'ids': 'a,b'}).status_code, 400)
+
+    def test_updated_since(self):
+        moment = timezone.now()
+        Source.objects.filter(pk=self.sources[1].pk).update(updated_at=moment + timedelta(seconds=1))
+        response = self.client.get(self.url, {'updated_since': moment.isoformat()})
+        self.assertEqual(self.ids(response), [self.sources[1].pk])
+        self.assertEqual(self.client.get(self.url, {'updated_since': 'yesterday'}).status_code, 400)
+
+    def test_bulk_fetch_not_modified(self):
+        params = {'ids': ','.join(str(source.pk) for source in self.sources[:2])}
+        etag = self.client.get(self.url, params)['ETag']
+        self.sources[3].save()
+        self.assertEqual(self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.sources[0].save()
+        self.assertEqual(self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+class TestSourcesChangeTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.source = Source.objects.create(name="בראשית", content="בראשית ברא")
+        self.test = Test.objects.create(name="מבחן", description="")
+        self.url = reverse('test-detail', args=[self.test.pk])
+
+    def assertChanged(self, change):
+        etag = self.client.get(self.url)['ETag']
+        change()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_adding_and_removing_sources(self):
+        self.assertChanged(lambda: self.test.sources.add(self.source))
+        self.assertChanged(lambda: self.source.tests.clear())
+        self.assertChanged(lambda: self.source.tests.add(self.test))
+        self.assertChanged(lambda: self.test.sources.clear())
+
+    def test_deleting_a_source(self):
+        self.test.sources.add(self.source)
+        self.assertChanged(self.source.delete)
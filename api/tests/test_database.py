@@ -0,0 +1,51 @@
+import threading
+from unittest import skipUnless
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from api.models import Source
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite profile")
+class SqliteProfileTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), settings.SQLITE_BUSY_TIMEOUT_MS)
+
+    def test_persistent_connections(self):
+        self.assertGreater(connection.settings_dict['CONN_MAX_AGE'], 0)
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite profile")
+class ConcurrentWritersTest(TransactionTestCase):
+    writers = 8
+    transactions = 25
+
+    def test_writers_finish_without_lock_errors(self):
+        errors = []
+
+        def writer(number):
+            try:
+                for index in range(self.transactions):
+                    # Read, then write, in one transaction: under a deferred
+                    # BEGIN this upgrade is what fails with "database is locked".
+                    with transaction.atomic():
+                        Source.objects.filter(name__startswith=f"writer {number} ").count()
+                        Source.objects.create(name=f"writer {number} {index}", content="תוכן")
+            except OperationalError as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(number,)) for number in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Source.objects.count(), self.writers * self.transactions)
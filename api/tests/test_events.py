@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from api import events, views
+from api.models import Test, LanguageModel, TestRun, QuestionResult
+
+class EventBrokerTest(TestCase):
+    def test_events_published_from_threads_reach_subscribers(self):
+        async def consume():
+            subscription = events.subscribe(1)
+            other = events.subscribe(2)
+            thread = threading.Thread(target=events.publish, args=(1, {'event': 'question', 'index': 0}))
+            thread.start()
+            event = await subscription.get(timeout=5)
+            thread.join()
+            events.unsubscribe(subscription)
+            events.unsubscribe(other)
+            return event, other.queue.qsize()
+
+        event, other_events = asyncio.run(consume())
+        self.assertEqual(event, {'event': 'question', 'index': 0})
+        self.assertEqual(other_events, 0)
+
+    def test_is_terminal(self):
+        self.assertTrue(events.is_terminal({'event': 'status', 'status': 'failed'}))
+        self.assertFalse(events.is_terminal({'event': 'status', 'status': 'in_progress'}))
+        self.assertFalse(events.is_terminal({'event': 'question', 'status': 'completed'}))
+
+class TestRunEventsViewTest(TestCase):
+    def setUp(self):
+        test = Test.objects.create(name="מבחן", description="תיאור", questions=["שאלה א", "שאלה ב"])
+        language_model = LanguageModel.objects.create(
+            name="Fake",
+            api_key="test_api_key",
+            prompt_template="תבנית",
+            library="fake",
+            tokenizer_type="gpt2",
+            input_cost_per_1k_tokens=Decimal("0.0200"),
+            output_cost_per_1k_tokens=Decimal("0.0400")
+        )
+        self.test_run = TestRun.objects.create(test=test, language_model=language_model)
+        self.url = reverse('testrun-events', kwargs={'pk': self.test_run.pk})
+
+    async def read_ndjson(self, response):
+        received = []
+        async for chunk in response.streaming_content:
+            event = json.loads(chunk)
+            received.append(event)
+            if event['event'] == 'snapshot' and event['status'] == 'pending':
+                events.publish(self.test_run.pk, {'event': 'question', 'index': 0, 'answer': "תשובה", 'cost': "0.01"})
+                events.publish(self.test_run.pk, {'event': 'status', 'status': 'completed', 'cost': "0.01"})
+        return received
+
+    async def test_ndjson_stream_until_completion(self):
+        response = await self.async_client.get(self.url, headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        received = await self.read_ndjson(response)
+        self.assertEqual([event['event'] for event in received], ['snapshot', 'question', 'status'])
+        self.assertEqual(received[1]['answer'], "תשובה")
+        self.assertEqual(received[2]['status'], 'completed')
+
+    async def test_finished_run_returns_snapshot_only(self):
+        await TestRun.objects.filter(pk=self.test_run.pk).aupdate(status='completed', cost=Decimal("0.5"))
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith("event: snapshot\ndata: "))
+        self.assertEqual(json.loads(body.split("data: ", 1)[1])['status'], 'completed')
+
+    @override_settings(RUN_EVENTS_HEARTBEAT=0.05, RUN_EVENTS_POLL_SECONDS=0.05)
+    async def test_falls_back_to_database_status(self):
+        response = await self.async_client.get(self.url, headers={'Accept': 'application/x-ndjson'})
+        received = []
+        async for chunk in response.streaming_content:
+            received.append(json.loads(chunk))
+            if len(received) == 2:
+                await TestRun.objects.filter(pk=self.test_run.pk).aupdate(status='failed')
+        self.assertEqual(received[1]['event'], 'heartbeat')
+        self.assertEqual(received[-1]['status'], 'failed')
+
+    @override_settings(RUN_EVENTS_POLL_SECONDS=0.05)
+    async def test_follows_runs_of_other_processes_in_the_database(self):
+        response = await self.async_client.get(self.url, headers={'Accept': 'application/x-ndjson'})
+        received = []
+        async for chunk in response.streaming_content:
+            received.append(json.loads(chunk))
+            if len(received) == 1:
+                await QuestionResult.objects.acreate(test_run=self.test_run, index=1, prompt_hash="b", answer="תשובה",
+                                                     cost=Decimal("0.01"))
+                await TestRun.objects.filter(pk=self.test_run.pk).aupdate(status='completed', cost=Decimal("0.01"))
+        self.assertEqual([event['event'] for event in received], ['snapshot', 'question', 'status'])
+        self.assertEqual((received[1]['index'], received[1]['question'], received[1]['answer']), (1, "שאלה ב", "תשובה"))
+        self.assertEqual(Decimal(received[1]['cost']), Decimal("0.01"))
+        self.assertEqual(received[2]['status'], 'completed')
+
+    @override_settings(RUN_EVENTS_POLL_SECONDS=0.05)
+    async def test_questions_are_sent_once(self):
+        response = await self.async_client.get(self.url, headers={'Accept': 'application/x-ndjson'})
+        received = []
+        async for chunk in response.streaming_content:
+            received.append(json.loads(chunk))
+            if len(received) == 1:
+                await QuestionResult.objects.acreate(test_run=self.test_run, index=0, prompt_hash="a", answer="תשובה")
+            elif len(received) == 2:
+                events.publish(self.test_run.pk, {'event': 'question', 'index': 0, 'answer': "תשובה", 'cost': "0"})
+                events.publish(self.test_run.pk, {'event': 'status', 'status': 'completed', 'cost': "0"})
+        self.assertEqual([event['event'] for event in received], ['snapshot', 'question', 'status'])
+
+    @override_settings(RUN_EVENTS_POLL_SECONDS=0.02, RUN_EVENTS_HEARTBEAT=5)
+    async def test_runs_publishing_here_are_not_polled(self):
+        polls = []
+        database_events = views._database_events
+
+        async def counted(*args):
+            polls.append(args)
+            return await database_events(*args)
+
+        received = []
+        with mock.patch.object(views, '_database_events', counted):
+            response = await self.async_client.get(self.url, headers={'Accept': 'application/x-ndjson'})
+            async for chunk in response.streaming_content:
+                received.append(json.loads(chunk))
+                if len(received) == 1:
+                    events.publish(self.test_run.pk, {'event': 'question', 'index': 0, 'answer': "תשובה", 'cost': "0"})
+                    threading.Timer(0.3, events.publish, args=(self.test_run.pk, {'event': 'status', 'status': 'completed'})).start()
+        self.assertEqual([event['event'] for event in received], ['snapshot', 'question', 'status'])
+        self.assertEqual(polls, [])
+
+    async def test_unknown_run(self):
+        response = await self.async_client.get(reverse('testrun-events', kwargs={'pk': 30000}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+import zipfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from xml.etree import ElementTree
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api import exports
+from api.models import Test, TestRun, Evaluation
+from api.tests.test_runner import create_language_model
+
+SHEET = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+def read_xlsx(content):
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        root = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        assert archive.testzip() is None
+    rows = []
+    for row in root.iter(f'{SHEET}row'):
+        values = []
+        for cell in row:
+            text = cell.find(f'{SHEET}is/{SHEET}t')
+            number = cell.find(f'{SHEET}v')
+            values.append(text.text if text is not None else number.text if number is not None else None)
+        rows.append(values)
+    return rows
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.model = create_language_model(name="GPT")
+        self.other_model = create_language_model(name="Other")
+        self.test = Test.objects.create(name="בראשית", description="שאלות")
+        self.other_test = Test.objects.create(name="שמות", description="שאלות")
+        now = timezone.now()
+        self.runs = [
+            TestRun.objects.create(test=self.test, language_model=self.model, status='completed', cost=Decimal('0.5'),
+                                   started_at=now, completed_at=now, result='[{"answer": "א, ב\\n\\"ג\\""}]'),
+            TestRun.objects.create(test=self.other_test, language_model=self.other_model, status='pending'),
+        ]
+        self.evaluations = [
+            Evaluation.objects.create(test_run=self.runs[0], score=7.5, comments="טוב\x01"),
+            Evaluation.objects.create(test_run=self.runs[1], score=3),
+        ]
+        Evaluation.objects.filter(pk=self.evaluations[1].pk).update(created_at=now - timedelta(days=10))
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(f'{name}-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export('testrun')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="test-runs.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(rows[0], [name for name, _ in exports.RUN_COLUMNS])
+        self.assertEqual(len(rows), 3)
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first['test_name'], "בראשית")
+        self.assertEqual(first['result'], self.runs[0].result)
+        self.assertEqual(Decimal(first['cost']), Decimal('0.5'))
+
+    def test_jsonl(self):
+        response, content = self.export('evaluation', export_format='jsonl')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [evaluation.pk for evaluation in self.evaluations])
+        self.assertEqual(rows[0]['language_model_name'], "GPT")
+        self.assertEqual(rows[0]['score'], 7.5)
+
+    def test_xlsx(self):
+        response, content = self.export('evaluation', export_format='xlsx')
+        self.assertEqual(response['Content-Type'], exports.FORMATS['xlsx'][1])
+        rows = read_xlsx(content)
+        self.assertEqual(rows[0], [name for name, _ in exports.EVALUATION_COLUMNS])
+        self.assertEqual(rows[1][3], "בראשית")
+        self.assertEqual(float(rows[1][6]), 7.5)
+        self.assertEqual(rows[1][7], "טוב")
+
+    def test_filters(self):
+        _, content = self.export('evaluation', export_format='jsonl', language_model=self.model.pk)
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [self.evaluations[0].pk])
+        _, content = self.export('testrun', export_format='jsonl', test=self.other_test.pk)
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [self.runs[1].pk])
+        today = timezone.localdate().isoformat()
+        _, content = self.export('evaluation', export_format='jsonl', **{'from': today, 'to': today})
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [self.evaluations[0].pk])
+        week_ago = (timezone.now() - timedelta(days=7)).isoformat()
+        _, content = self.export('evaluation', export_format='jsonl', to=week_ago)
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [self.evaluations[1].pk])
+
+    def test_invalid_parameters(self):
+        for params in ({'export_format': 'pdf'}, {'test': 'x'}, {'from': 'yesterday'}):
+            response = self.client.get(reverse('evaluation-export'), params)
+            self.assertEqual(response.status_code, 400, params)
+
+class StreamingWriterTest(TestCase):
+    def test_xlsx_is_emitted_incrementally(self):
+        rows = ((i, f"שורה {i}", datetime(2024, 1, 1)) for i in range(3 * exports.CHUNK_SIZE))
+        chunks = list(exports.write_xlsx(['id', 'name', 'at'], rows))
+        self.assertGreater(len(chunks), 3)
+        parsed = read_xlsx(b"".join(chunks))
+        self.assertEqual(len(parsed), 3 * exports.CHUNK_SIZE + 1)
+        self.assertEqual(parsed[-1], [str(3 * exports.CHUNK_SIZE - 1), f"שורה {3 * exports.CHUNK_SIZE - 1}", "2024-01-01T00:00:00"])
+
+    def test_formulas_are_quoted(self):
+        rows = [(-1, "=HYPERLINK(\"http://x\")", "+1", "-2", "@SUM(A1)", "\t=1", "\r=1", "a=b", None)]
+        headers = list("abcdefghi")
+        parsed = list(csv.reader(io.StringIO(b"".join(exports.write_csv(headers, rows)).decode('utf-8-sig'), newline='')))
+        self.assertEqual(parsed[1], ["-1", "'=HYPERLINK(\"http://x\")", "'+1", "'-2", "'@SUM(A1)", "'\t=1", "'\r=1", "a=b", ""])
+        parsed = read_xlsx(b"".join(exports.write_xlsx(headers, rows)))
+        self.assertEqual(parsed[1], ["-1", "'=HYPERLINK(\"http://x\")", "'+1", "'-2", "'@SUM(A1)", "'\t=1", "'\r=1", "a=b", None])
+
+    def test_xlsx_non_finite_numbers_are_text(self):
+        parsed = read_xlsx(b"".join(exports.write_xlsx(['a', 'b', 'c', 'd'], [(float('nan'), float('inf'), Decimal('-Infinity'), 0.5)])))
+        self.assertEqual(parsed[1], ["nan", "inf", "-Infinity", "0.5"])
+
+    def test_xlsx_cells_are_cut_to_excels_limit(self):
+        parsed = read_xlsx(b"".join(exports.write_xlsx(['long'], [("א" * 40000,)])))
+        self.assertEqual(parsed[1], ["א" * exports.XLSX_MAX_CELL_LENGTH])
+
+    def test_writers_consume_rows_lazily(self):
+        consumed = []
+
+        def rows():
+            for i in range(5 * exports.CHUNK_SIZE):
+                consumed.append(i)
+                yield (i, "x")
+
+        for writer in (exports.write_csv, exports.write_jsonl, exports.write_xlsx):
+            consumed.clear()
+            output = writer(['id', 'name'], rows())
+            next(output)
+            next(output)
+            self.assertLessEqual(len(consumed), 2 * exports.CHUNK_SIZE + 1, writer.__name__)
@@ -0,0 +1,210 @@
+import json
+from decimal import Decimal
+from unittest import mock
+from django.db import IntegrityError
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import grading, runner
+from api.models import Test, LanguageModel, TestRun, Evaluation, AnswerMetrics, ModelTestStats, QuestionResult
+
+def create_language_model(prompt_template="{question}"):
+    return LanguageModel.objects.create(
+        name="Fake",
+        api_key="test_api_key",
+        prompt_template=prompt_template,
+        library="fake",
+        tokenizer_type="fallback",
+        input_cost_per_1k_tokens=Decimal("0.0200"),
+        output_cost_per_1k_tokens=Decimal("0.0400"),
+    )
+
+def completed_run(test, language_model, answers):
+    return TestRun.objects.create(
+        test=test, language_model=language_model, status='completed',
+        result=json.dumps([{'index': index, 'answer': answer} for index, answer in enumerate(answers)], ensure_ascii=False))
+
+class NormalizeAnswerTest(TestCase):
+    def test_niqqud_punctuation_and_final_letters(self):
+        self.assertEqual(grading.normalize_answer(" בְּרֵאשִׁית, שָׁלוֹם! "), grading.normalize_answer("בראשית שלומ"))
+
+    def test_abbreviations(self):
+        self.assertEqual(grading.normalize_answer('רמב"ם'), grading.normalize_answer("רמבם"))
+
+    def test_choice_label(self):
+        choices = {"א", "ב", "ג", "ד"}
+        self.assertEqual(grading.choice_label("התשובה היא (ב).", choices), "ב")
+        self.assertEqual(grading.choice_label("ג) ולא א", choices), "ג")
+        self.assertEqual(grading.choice_label("לא א אלא ד", choices), "ד")
+        self.assertEqual(grading.choice_label("I think it's B", {"a", "b", "c", "d"}), "b")
+        self.assertIsNone(grading.choice_label("אין תשובה", choices))
+
+class GradeRunsTest(TestCase):
+    def setUp(self):
+        self.language_model = create_language_model()
+        self.multiple_choice = Test.objects.create(
+            name="בחירה", description="בחר", test_type='multiple_choice',
+            questions=[{"question": "א", "answer": "ב"}, {"question": "ב", "answer": "ג"}, {"question": "ג", "answer": "א"}])
+        self.short_answer = Test.objects.create(
+            name="קצר", description="ענה", test_type='short_answer',
+            questions=[{"question": "מי?", "answer": ["משה", "משה רבנו"]}, {"question": "מה?", "answer": "תורה"}])
+
+    def test_scores_multiple_choice(self):
+        run = completed_run(self.multiple_choice, self.language_model, ["התשובה היא ב.", "ד", "א"])
+        self.assertEqual(grading.grade_runs([run.pk]), 1)
+        evaluation = Evaluation.objects.get(test_run=run)
+        self.assertTrue(evaluation.is_automatic)
+        self.assertAlmostEqual(evaluation.score, 2 / 3)
+        self.assertEqual(evaluation.comments, "2/3 correct")
+
+    def test_scores_short_answers(self):
+        run = completed_run(self.short_answer, self.language_model, ["מֹשֶׁה רַבֵּנוּ", "תורה שבעל פה"])
+        grading.grade_runs([run.pk])
+        self.assertAlmostEqual(Evaluation.objects.get(test_run=run).score, 0.5)
+
+    def test_scores_question_results(self):
+        run = TestRun.objects.create(test=self.short_answer, language_model=self.language_model, status='completed')
+        QuestionResult.objects.create(test_run=run, index=0, prompt_hash="a", answer="משה")
+        QuestionResult.objects.create(test_run=run, index=1, prompt_hash="b", error="provider unavailable")
+        grading.grade_runs([run.pk])
+        self.assertAlmostEqual(Evaluation.objects.get(test_run=run).score, 0.5)
+
+    def test_missing_answers_are_wrong(self):
+        run = completed_run(self.short_answer, self.language_model, ["משה"])
+        grading.grade_runs([run.pk])
+        self.assertAlmostEqual(Evaluation.objects.get(test_run=run).score, 0.5)
+
+    def test_many_runs_at_once(self):
+        runs = [completed_run(self.multiple_choice, self.language_model, ["ב", "ג", "א"][:i % 4]) for i in range(20)]
+        runs += [completed_run(self.short_answer, self.language_model, ["משה", "תורה"]) for _ in range(5)]
+        self.assertEqual(grading.grade_runs([run.pk for run in runs]), 25)
+        scores = dict(Evaluation.objects.values_list('test_run_id', 'score'))
+        self.assertEqual([scores[run.pk] for run in runs[:4]], [0, 1 / 3, 2 / 3, 1])
+        self.assertEqual(scores[runs[-1].pk], 1)
+        stats = ModelTestStats.objects.get(language_model=self.language_model, test=self.short_answer)
+        self.assertEqual(stats.evaluation_count, 5)
+
+    def test_skips_open_unfinished_and_graded_runs(self):
+        open_test = Test.objects.create(name="פתוח", description="ספר", questions=["למה?"])
+        graded = completed_run(self.short_answer, self.language_model, ["משה", "תורה"])
+        grading.grade_runs([graded.pk])
+        pending = TestRun.objects.create(test=self.short_answer, language_model=self.language_model)
+        open_run = completed_run(open_test, self.language_model, ["כי"])
+        self.assertEqual(grading.grade_runs([graded.pk, pending.pk, open_run.pk]), 0)
+        self.assertEqual(grading.grade_runs(), 0)
+        self.assertEqual(Evaluation.objects.count(), 1)
+
+    def test_runs_graded_meanwhile_are_skipped(self):
+        runs = [completed_run(self.short_answer, self.language_model, ["משה", "תורה"]) for _ in range(3)]
+        score_runs = grading.score_runs
+
+        def score_runs_while_graded_elsewhere(batch):
+            # The runner's grading of a finished run lands between selection and insert.
+            Evaluation.objects.create(test_run=runs[1], score=1, comments="2/2 correct", is_automatic=True)
+            return score_runs(batch)
+
+        with mock.patch.object(grading, 'score_runs', score_runs_while_graded_elsewhere):
+            self.assertEqual(grading.grade_runs([run.pk for run in runs]), 2)
+        self.assertEqual(Evaluation.objects.filter(is_automatic=True).count(), 3)
+        stats = ModelTestStats.objects.get(language_model=self.language_model, test=self.short_answer)
+        self.assertEqual((stats.evaluation_count, stats.score_sum), (3, 3))
+
+    def test_one_automatic_evaluation_per_run(self):
+        run = completed_run(self.short_answer, self.language_model, ["משה", "תורה"])
+        Evaluation.objects.create(test_run=run, score=1, is_automatic=True)
+        Evaluation.objects.create(test_run=run, score=0.5)
+        with self.assertRaises(IntegrityError):
+            Evaluation.objects.create(test_run=run, score=1, is_automatic=True)
+
+class AutomaticGradingTest(TestCase):
+    def test_run_is_graded_when_it_completes(self):
+        test = Test.objects.create(
+            name="בחירה", description="בחר", test_type='multiple_choice',
+            questions=[{"question": "איזו?\nב", "answer": "ב"}, {"question": "איזו?\nג", "answer": "א"}])
+        test_run = TestRun.objects.create(test=test, language_model=create_language_model())
+        with self.captureOnCommitCallbacks(execute=True):
+            runner.execute_test_run(test_run.pk)
+        evaluation = Evaluation.objects.get(test_run=test_run)
+        self.assertTrue(evaluation.is_automatic)
+        self.assertEqual(evaluation.score, 0.5)
+
+class GradeViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.language_model = create_language_model()
+        self.test = Test.objects.create(
+            name="קצר", description="ענה", test_type='short_answer', questions=[{"question": "מי?", "answer": "משה"}])
+
+    def test_grades_pending_runs(self):
+        runs = [completed_run(self.test, self.language_model, [answer]) for answer in ("משה", "אהרן")]
+        response = self.client.post(reverse('evaluation-grade'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['graded'], 2)
+        response = self.client.get(reverse('evaluation-list'))
+        scores = {row['test_run']: (row['score'], row['is_automatic']) for row in response.data['results']}
+        self.assertEqual(scores, {runs[0].pk: (1.0, True), runs[1].pk: (0.0, True)})
+
+    def test_closed_test_needs_answer_keys(self):
+        data = {"name": "קצר", "description": "ענה", "test_type": "short_answer", "questions": ["מי?"]}
+        response = self.client.post(reverse('test-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data['questions'] = [{"question": "מי?", "answer": ["משה", "מֹשֶׁה"]}]
+        response = self.client.post(reverse('test-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['test_type'], 'short_answer')
+
+class MeasureRunsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.language_model = create_language_model()
+        self.test = Test.objects.create(
+            name="פתוח", description="ענה", questions=[
+                {"question": "מי נתן את התורה?", "answer": ["משה רבנו", "משה"]},
+                "למה?",
+                {"question": "מה נברא ראשון?", "answer": "האור"}])
+
+    def test_stores_best_reference_scores(self):
+        run = completed_run(self.test, self.language_model, ["מֹשֶׁה", "כי", "השמים והארץ"])
+        self.assertEqual(grading.measure_runs([run.pk]), 1)
+        metrics = AnswerMetrics.objects.get(test_run=run)
+        self.assertEqual(metrics.questions[0], {'chrf': 1.0, 'rouge_l': 1.0, 'token_f1': 1.0})
+        self.assertIsNone(metrics.questions[1])
+        self.assertEqual(metrics.questions[2]['token_f1'], 0.0)
+        self.assertAlmostEqual(metrics.token_f1, 0.5)
+        self.assertEqual(grading.measure_runs([run.pk]), 0)
+
+    def test_skips_tests_without_references(self):
+        plain = Test.objects.create(name="פתוח", description="ענה", questions=["למה?"])
+        completed_run(plain, self.language_model, ["כי"])
+        self.assertEqual(grading.measure_runs(), 0)
+        self.assertFalse(AnswerMetrics.objects.exists())
+
+    def test_run_is_measured_when_it_completes(self):
+        test_run = TestRun.objects.create(test=self.test, language_model=create_language_model())
+        with self.captureOnCommitCallbacks(execute=True):
+            runner.execute_test_run(test_run.pk)
+        self.assertTrue(AnswerMetrics.objects.filter(test_run=test_run).exists())
+        self.assertFalse(Evaluation.objects.filter(test_run=test_run).exists())
+
+    def test_compute_and_triage(self):
+        runs = [completed_run(self.test, self.language_model, answers)
+                for answers in (["משה", "", "האור"], ["אהרן", "", "החושך"], ["משה", "", "החושך"])]
+        response = self.client.post(reverse('answermetrics-compute'), {}, format='json')
+        self.assertEqual(response.data['measured'], 3)
+        response = self.client.get(reverse('answermetrics-list'), {'ordering': 'token_f1', 'test': self.test.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['test_run'] for row in response.data['results']], [runs[1].pk, runs[2].pk, runs[0].pk])
+        self.assertNotIn('questions', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['language_model'], self.language_model.pk)
+
+    def test_tied_scores_page_without_gaps(self):
+        runs = [completed_run(self.test, self.language_model, ["משה", "", "האור"]) for _ in range(7)]
+        grading.measure_runs()
+        seen = []
+        url = reverse('answermetrics-list') + '?ordering=-chrf&limit=3'
+        while url:
+            response = self.client.get(url)
+            seen += [row['test_run'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, sorted(test_run.pk for test_run in runs))
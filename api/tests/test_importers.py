@@ -0,0 +1,117 @@
+import io
+from io import StringIO
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from api import importers, search
+from api.models import Source, content_hash
+
+class ReaderTest(TestCase):
+    def test_json_records_span_reads(self):
+        items = [{'name': f"מקור {i}", 'content': "בראשית " * i + "\"ציטוט\" ]}"} for i in range(1, 30)]
+        stream = io.StringIO(json.dumps(items, ensure_ascii=False, indent=2))
+        records = list(importers.read_json(stream, read_size=7))
+        self.assertEqual(records, [(item['name'], item['content']) for item in items])
+
+    def test_json_must_be_array(self):
+        with self.assertRaises(importers.DumpError):
+            list(importers.read_json(io.StringIO('{"name": "x"}')))
+
+    def test_truncated_json(self):
+        with self.assertRaises(importers.DumpError):
+            list(importers.read_json(io.StringIO('[{"name": "x", "content": "y"}, {"name": ')))
+
+    def test_sections_and_parts(self):
+        text = "הקדמה\nפרק א\nבראשית ברא\nאלהים\nפרק ב\nויכלו השמים\n"
+        sections = list(importers.split_sections("בראשית", io.StringIO(text), importers.re.compile(r"^פרק ")))
+        self.assertEqual(sections, [
+            ("בראשית", "הקדמה"),
+            ("בראשית פרק א", "בראשית ברא\nאלהים"),
+            ("בראשית פרק ב", "ויכלו השמים"),
+        ])
+        parts = list(importers.split_sections("ספר", "א\n" * 10, max_chars=8))
+        self.assertEqual([name for name, _ in parts], ["ספר", "ספר (2)", "ספר (3)"])
+        self.assertEqual("".join(content for _, content in parts).replace("\n", ""), "א" * 10)
+
+class ImportSourcesCommandTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+    def run_command(self, *args, **options):
+        out = StringIO()
+        call_command('import_sources', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_jsonl_import_is_indexed_and_deduplicated(self):
+        lines = [json.dumps({'title': f"מקור {i}", 'text': f"תוכן מספר {i}"}, ensure_ascii=False) for i in range(25)]
+        path = self.write('dump.jsonl', "\n".join(lines + lines[:5]) + "\n")
+        output = self.run_command(path, name_field='title', content_field='text', batch_size=10)
+        self.assertIn("30 records: 25 created, 5 already present", output)
+        self.assertEqual(Source.objects.count(), 25)
+        source = Source.objects.get(name="מקור 3")
+        self.assertEqual(source.content_hash, content_hash("תוכן מספר 3"))
+        self.assertEqual(len(search.search('source', "מספר 3")), 1)
+        self.assertIn("30 records: 0 created, 30 already present", self.run_command(path, name_field='title', content_field='text'))
+        self.assertFalse(os.path.exists(path + '.checkpoint.json'))
+
+    def test_csv_and_json(self):
+        csv_path = self.write('dump.csv', 'name,content\nמשנה,"שורה, עם פסיק\nושורה שנייה"\n')
+        self.run_command(csv_path)
+        self.assertEqual(Source.objects.get(name="משנה").content, "שורה, עם פסיק\nושורה שנייה")
+        json_path = self.write('dump.json', json.dumps([{'name': "גמרא", 'content': "תנן"}], ensure_ascii=False))
+        self.run_command(json_path)
+        self.assertTrue(Source.objects.filter(name="גמרא").exists())
+
+    def test_text_sections(self):
+        path = self.write('genesis.txt', "פרק א\nבראשית ברא\nפרק ב\nויכלו\n")
+        self.run_command(path, section_pattern=r"^פרק ", name="בראשית")
+        self.assertEqual(list(Source.objects.order_by('id').values_list('name', 'content')),
+                         [("בראשית פרק א", "בראשית ברא"), ("בראשית פרק ב", "ויכלו")])
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write('dump.jsonl', "".join(
+            json.dumps({'name': f"מקור {i}", 'content': f"תוכן {i}"}, ensure_ascii=False) + "\n" for i in range(30)))
+        calls = []
+
+        def fail_on_third_batch(records):
+            calls.append(len(records))
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return importers.new_sources(records)
+
+        with mock.patch('api.management.commands.import_sources.new_sources', fail_on_third_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_command(path, batch_size=10)
+        with open(path + '.checkpoint.json') as file:
+            self.assertEqual(json.load(file)['records'], 20)
+        self.assertEqual(Source.objects.count(), 20)
+
+        with mock.patch('api.management.commands.import_sources.new_sources', wraps=importers.new_sources) as spy:
+            output = self.run_command(path, batch_size=10)
+        self.assertIn("Resuming after 20 records", output)
+        self.assertEqual([len(call.args[0]) for call in spy.call_args_list], [10])
+        self.assertIn("30 records: 30 created", output)
+        self.assertEqual(Source.objects.count(), 30)
+
+    def test_checkpoint_with_other_options_is_refused(self):
+        path = self.write('dump.txt', "פרק א\nטקסט\n")
+        importers.Checkpoint(path + '.checkpoint.json', path, {'format': 'txt'}).save()
+        with self.assertRaises(CommandError):
+            self.run_command(path)
+        self.run_command(path, restart=True)
+        self.assertEqual(Source.objects.count(), 1)
+
+    def test_unknown_format(self):
+        with self.assertRaises(CommandError):
+            self.run_command(self.write('dump.xml', "<x/>"))
@@ -0,0 +1,152 @@
+import threading
+from decimal import Decimal
+from unittest import mock
+from django.db import close_old_connections
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api import estimates, ledger
+from api.serializers import BudgetSerializer
+from api.models import Test, LanguageModel, TestRun, Budget
+
+def create_test_run():
+    test = Test.objects.create(name="מבחן", description="תיאור")
+    language_model = LanguageModel.objects.create(
+        name="Fake",
+        api_key="test_api_key",
+        prompt_template="תבנית",
+        library="fake",
+        tokenizer_type="gpt2",
+        input_cost_per_1k_tokens=Decimal("1.0000"),
+        output_cost_per_1k_tokens=Decimal("2.0000")
+    )
+    return TestRun.objects.create(test=test, language_model=language_model)
+
+class LedgerTest(TestCase):
+    def setUp(self):
+        self.budget = Budget.objects.create(date=timezone.now().date(), daily_limit=Decimal("10.00"))
+        self.test_run = create_test_run()
+
+    def test_reserve_within_limit(self):
+        ledger.reserve_for_runs([self.test_run], [Decimal("4")])
+        self.budget.refresh_from_db()
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.budget.reserved, Decimal("4"))
+        self.assertEqual(self.test_run.reserved_cost, Decimal("4"))
+        self.assertEqual(self.test_run.budget, self.budget)
+
+    def test_run_is_reserved_once(self):
+        ledger.reserve_for_runs([self.test_run], [Decimal("4")])
+        with self.assertRaises(ledger.AlreadyReserved):
+            ledger.reserve_for_runs([self.test_run], [Decimal("4")])
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.reserved, Decimal("4"))
+
+    def test_reserve_over_limit(self):
+        ledger.reserve(Decimal("8"))
+        with self.assertRaises(ledger.BudgetExceeded):
+            ledger.reserve_for_runs([self.test_run], [Decimal("3")])
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.reserved, Decimal("8"))
+
+    def test_reserve_without_budget(self):
+        self.budget.delete()
+        with self.assertRaises(ledger.BudgetExceeded):
+            ledger.reserve(Decimal("1"))
+
+    def test_settle_replaces_reservation_with_actual_cost(self):
+        ledger.reserve_for_runs([self.test_run], [Decimal("4")])
+        ledger.settle(self.test_run, Decimal("1.5"))
+        ledger.settle(self.test_run, Decimal("0"))
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.reserved, Decimal("0"))
+        self.assertEqual(self.budget.current_usage, Decimal("1.5"))
+
+    def test_estimate_cost_covers_max_output(self):
+        with self.settings(RUN_MAX_OUTPUT_TOKENS=1000):
+            estimate = estimates.estimate_cost(self.test_run.test, self.test_run.language_model)
+        self.assertGreater(estimate, Decimal("2"))
+
+    def test_failed_run_releases_reservation(self):
+        self.test_run.language_model.library = 'no-such-library'
+        self.test_run.language_model.save()
+        ledger.reserve_for_runs([self.test_run], [Decimal("4")])
+        from api.runner import execute_test_run
+        execute_test_run(self.test_run.pk)
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.reserved, Decimal("0"))
+        self.assertEqual(self.budget.current_usage, Decimal("0"))
+
+    def test_update_usage_view(self):
+        client = APIClient()
+        url = reverse('budget-update-usage')
+        client.post(url, {"usage": "1.25"}, format='json')
+        response = client.post(url, {"usage": 0.5}, format='json')
+        self.assertEqual(Decimal(response.data['current_usage']), Decimal("1.75"))
+        response = client.post(url, {"usage": "lots"}, format='json')
+        self.assertEqual(response.status_code, 400)
+        for usage in ["NaN", "Infinity", "-1"]:
+            response = client.post(url, {"usage": usage}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.current_usage, Decimal("1.75"))
+
+    def test_budget_edits_keep_concurrent_ledger_updates(self):
+        is_valid = BudgetSerializer.is_valid
+
+        def is_valid_while_ledger_moves(serializer, **kwargs):
+            # The view holds the loaded budget while a run reserves and usage is reported.
+            ledger.reserve(Decimal("6"))
+            ledger.add_usage(Decimal("1"))
+            return is_valid(serializer, **kwargs)
+
+        url = reverse('budget-detail', kwargs={'pk': self.budget.pk})
+        with mock.patch.object(BudgetSerializer, 'is_valid', is_valid_while_ledger_moves):
+            response = APIClient().patch(url, {"daily_limit": "20.00", "current_usage": "0", "reserved": "0"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((Decimal(response.data['current_usage']), Decimal(response.data['reserved'])), (Decimal("1"), Decimal("6")))
+        self.budget.refresh_from_db()
+        self.assertEqual((self.budget.daily_limit, self.budget.current_usage, self.budget.reserved),
+                         (Decimal("20.00"), Decimal("1"), Decimal("6")))
+
+    def test_run_stops_at_its_reservation(self):
+        self.test_run.test.questions = ["א", "ב", "ג"]
+        self.test_run.test.save()
+        # Less than a question's worst case: 100 output tokens at 2.00 per 1k.
+        with self.settings(RUN_MAX_OUTPUT_TOKENS=100):
+            ledger.reserve_for_runs([self.test_run], [Decimal("0.15")])
+            from api.runner import execute_test_run
+            execute_test_run(self.test_run.pk)
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'failed')
+        self.assertIn("reservation", self.test_run.result)
+        self.assertFalse(self.test_run.question_results.filter(error__isnull=True).exists())
+        self.budget.refresh_from_db()
+        self.assertEqual((self.budget.reserved, self.budget.current_usage), (Decimal("0"), Decimal("0")))
+
+class ConcurrentReservationTest(TransactionTestCase):
+    def test_parallel_reservations_never_exceed_limit(self):
+        budget = Budget.objects.create(date=timezone.now().date(), daily_limit=Decimal("10.00"))
+        successes = []
+
+        def worker():
+            try:
+                for _ in range(5):
+                    try:
+                        ledger.reserve(Decimal("1"))
+                        successes.append(1)
+                    except ledger.BudgetExceeded:
+                        pass
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        budget.refresh_from_db()
+        self.assertEqual(len(successes), 10)
+        self.assertEqual(budget.reserved, Decimal("10"))
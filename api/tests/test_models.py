@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase
+from api import models
 from api.models import Source, Test, Introduction, LanguageModel, TestRun, Evaluation, Budget
 from django.utils import timezone
 from decimal import Decimal
@@ -130,4 +132,57 @@ class BudgetModelTest(TestCase):
         self.assertEqual(self.budget.daily_limit, Decimal("100.00"))
         self.assertEqual(self.budget.current_usage, Decimal("50.00"))
         self.assertTrue(isinstance(self.budget, Budget))
-        self.assertEqual(str(self.budget), f"Budget for {self.budget.date}")
\ No newline at end of file
+        self.assertEqual(str(self.budget), f"Budget for {self.budget.date}")
+
+class CompressedTextTest(TestCase):
+    text = "בְּרֵאשִׁית בָּרָא אֱלֹהִים אֵת הַשָּׁמַיִם וְאֵת הָאָרֶץ. " * 50
+
+    def stored(self, source):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT content FROM api_source WHERE id = %s", [source.pk])
+            return bytes(cursor.fetchone()[0])
+
+    def test_round_trip(self):
+        source = Source.objects.create(name="בראשית", content=self.text)
+        self.assertEqual(Source.objects.with_text().get(pk=source.pk).content, self.text)
+        stored = self.stored(source)
+        self.assertEqual(stored[:1], models.ZLIB)
+        self.assertLess(len(stored), len(self.text.encode()) / 4)
+
+    def test_short_text_is_stored_plain(self):
+        source = Source.objects.create(name="קצר", content="שלום")
+        self.assertEqual(self.stored(source), models.RAW + "שלום".encode())
+        self.assertEqual(Source.objects.with_text().get(pk=source.pk).content, "שלום")
+
+    def test_text_is_deferred_by_default(self):
+        source = Source.objects.create(name="בראשית", content=self.text)
+        loaded = Source.objects.get(pk=source.pk)
+        self.assertEqual(loaded.get_deferred_fields(), {'content'})
+        with self.assertNumQueries(1):
+            self.assertEqual(loaded.content, self.text)
+        self.assertEqual(Source.objects.with_text().get(pk=source.pk).get_deferred_fields(), set())
+        self.assertEqual(Introduction.objects.all().query.deferred_loading, ({'content'}, True))
+        self.assertEqual(Source.objects.defer('name').with_text().query.deferred_loading, ({'name'}, True))
+
+    def test_saving_without_text_keeps_it(self):
+        source = Source.objects.create(name="בראשית", content=self.text)
+        loaded = Source.objects.get(pk=source.pk)
+        loaded.name = "שם חדש"
+        loaded.save()
+        reloaded = Source.objects.with_text().get(pk=source.pk)
+        self.assertEqual((reloaded.name, reloaded.content, reloaded.content_hash), ("שם חדש", self.text, source.content_hash))
+
+    def test_values_are_decompressed(self):
+        Source.objects.create(name="בראשית", content=self.text)
+        self.assertEqual(list(Source.objects.values_list('content', flat=True)), [self.text])
+
+    def test_null_result(self):
+        test = Test.objects.create(name="מבחן", description="")
+        language_model = LanguageModel.objects.create(
+            name="Fake", api_key="k", prompt_template="", library="fake", tokenizer_type="gpt2",
+            input_cost_per_1k_tokens=Decimal("0.01"), output_cost_per_1k_tokens=Decimal("0.02"))
+        test_run = TestRun.objects.create(test=test, language_model=language_model)
+        self.assertIsNone(TestRun.objects.with_text().get(pk=test_run.pk).result)
+        test_run.result = self.text
+        test_run.save(update_fields=['result'])
+        self.assertEqual(TestRun.objects.with_text().get(pk=test_run.pk).result, self.text)
@@ -0,0 +1,69 @@
+from decimal import Decimal
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import Source, LanguageModel
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        Source.objects.bulk_create([Source(name=f"מקור {i}", content="תוכן " * 100) for i in range(120)])
+
+    def test_pages_follow_cursor_without_overlap(self):
+        seen = []
+        url = reverse('source-list')
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_page_size_parameter(self):
+        response = self.client.get(reverse('source-list'), {'page_size': 10})
+        self.assertEqual(len(response.data['results']), 10)
+
+class LeanListTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.source = Source.objects.create(name="מקור", content="תוכן ארוך")
+
+    def test_list_omits_heavy_fields(self):
+        response = self.client.get(reverse('source-list'))
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'created_at', 'updated_at'})
+
+    def test_list_does_not_load_heavy_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('source-list'))
+        self.assertNotIn('"content"', queries[-1]['sql'])
+
+    def test_expand_includes_heavy_fields(self):
+        response = self.client.get(reverse('source-list'), {'expand': 'content'})
+        self.assertEqual(response.data['results'][0]['content'], "תוכן ארוך")
+
+    def test_fields_selects_fields(self):
+        response = self.client.get(reverse('source-list'), {'fields': 'id,name,unknown'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+        response = self.client.get(reverse('source-detail', kwargs={'pk': self.source.pk}), {'fields': 'content'})
+        self.assertEqual(response.data, {'content': "תוכן ארוך"})
+
+    def test_detail_includes_heavy_fields(self):
+        response = self.client.get(reverse('source-detail', kwargs={'pk': self.source.pk}))
+        self.assertEqual(response.data['content'], "תוכן ארוך")
+
+    def test_language_model_list_omits_prompt_template(self):
+        LanguageModel.objects.create(
+            name="Fake",
+            api_key="test_api_key",
+            prompt_template="תבנית",
+            library="fake",
+            tokenizer_type="gpt2",
+            input_cost_per_1k_tokens=Decimal("0.0200"),
+            output_cost_per_1k_tokens=Decimal("0.0400")
+        )
+        response = self.client.get(reverse('languagemodel-list'))
+        self.assertNotIn('prompt_template', response.data['results'][0])
+        self.assertNotIn('api_key', response.data['results'][0])
@@ -0,0 +1,73 @@
+from decimal import Decimal
+from django.test import TestCase
+from api.models import Source, Test, Introduction, LanguageModel, TestRun
+from api.prompts import TemplateError, build_prompts, compile_template, get_template
+
+def create_language_model(prompt_template):
+    return LanguageModel.objects.create(
+        name="Fake",
+        api_key="test_api_key",
+        prompt_template=prompt_template,
+        library="fake",
+        tokenizer_type="gpt2",
+        input_cost_per_1k_tokens=Decimal("0.0200"),
+        output_cost_per_1k_tokens=Decimal("0.0400")
+    )
+
+class CompileTemplateTest(TestCase):
+    def test_render_placeholders(self):
+        template = compile_template("{test_name}: {sources}\nשאלה: {question} {{json}}")
+        context = {'test_name': "מבחן", 'test_description': "", 'introductions': "", 'sources': "מקור"}
+        self.assertEqual(template.render_batch(context, ["א", "ב"]), ["מבחן: מקור\nשאלה: א {json}", "מבחן: מקור\nשאלה: ב {json}"])
+
+    def test_unknown_placeholder(self):
+        with self.assertRaises(TemplateError):
+            compile_template("{answer}")
+
+    def test_positional_placeholder(self):
+        with self.assertRaises(TemplateError):
+            compile_template("{}")
+
+    def test_format_spec(self):
+        with self.assertRaises(TemplateError):
+            compile_template("{question:>10}")
+
+    def test_unbalanced_brace(self):
+        with self.assertRaises(TemplateError):
+            compile_template("{question")
+
+    def test_field_counts(self):
+        template = compile_template("{question} {sources} {question}")
+        self.assertEqual(template.field_counts()['question'], 2)
+        self.assertEqual(template.literal_text, "  ")
+
+class TemplateCacheTest(TestCase):
+    def test_compiled_once_per_version(self):
+        language_model = create_language_model("{question}")
+        compiled = get_template(language_model)
+        self.assertIs(get_template(LanguageModel.objects.get(pk=language_model.pk)), compiled)
+        language_model.prompt_template = "שאלה: {question}"
+        language_model.save()
+        self.assertIsNot(get_template(language_model), compiled)
+        self.assertEqual(get_template(language_model).template, "שאלה: {question}")
+
+class BuildPromptsTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="בראשית א", content="בראשית ברא אלהים")
+        self.test = Test.objects.create(name="מבחן", description="תיאור", questions=["מי ברא?", "מה ברא?"])
+        self.test.sources.add(self.source)
+        self.introduction = Introduction.objects.create(content="הקדמה")
+
+    def test_template_without_placeholders_uses_default_layout(self):
+        test_run = TestRun.objects.create(test=self.test, language_model=create_language_model("ענה בקצרה"))
+        test_run.introductions.add(self.introduction)
+        self.assertEqual(build_prompts(test_run)[0], "ענה בקצרה\n\nהקדמה\n\nבראשית א\nבראשית ברא אלהים\n\nתיאור\n\nמי ברא?")
+
+    def test_template_with_placeholders(self):
+        language_model = create_language_model("{sources}\n{introductions}\nQ: {question}")
+        test_run = TestRun.objects.create(test=self.test, language_model=language_model)
+        test_run.introductions.add(self.introduction)
+        self.assertEqual(build_prompts(test_run), [
+            "בראשית א\nבראשית ברא אלהים\nהקדמה\nQ: מי ברא?",
+            "בראשית א\nבראשית ברא אלהים\nהקדמה\nQ: מה ברא?",
+        ])
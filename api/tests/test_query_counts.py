@@ -0,0 +1,86 @@
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import Test, Introduction, TestRunBatch, TestRun, Evaluation
+from api.tests.test_runner import create_language_model
+
+# Query budgets for list pages. Every check runs with 10, 1,000 and 10,000
+# rows in the table: the number of queries must not grow with the rows listed.
+SIZES = (10, 1000, 10000)
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.language_models = [create_language_model(name=f"Model {i}") for i in range(3)]
+        self.tests = [Test.objects.create(name=f"מבחן {i}", description="שאלות") for i in range(3)]
+        self.batch = TestRunBatch.objects.create(test=self.tests[0])
+        self.introduction = Introduction.objects.create(content="הקדמה")
+        self.runs = 0
+        self.evaluations = 0
+
+    def grow_runs(self, size):
+        runs = TestRun.objects.bulk_create([
+            TestRun(test=self.tests[i % 3], language_model=self.language_models[i % 3], batch=self.batch,
+                    status='completed', cost=Decimal('0.01'))
+            for i in range(self.runs, size)])
+        TestRun.introductions.through.objects.bulk_create([
+            TestRun.introductions.through(testrun_id=run.pk, introduction_id=self.introduction.pk) for run in runs])
+        self.runs = size
+
+    def grow_evaluations(self, size):
+        self.grow_runs(size)
+        run_ids = list(TestRun.objects.order_by('id').values_list('id', flat=True)[self.evaluations:size])
+        Evaluation.objects.bulk_create([Evaluation(test_run_id=run_id, score=5) for run_id in run_ids])
+        self.evaluations = size
+
+    def assertQueryBudget(self, budget, grow, request):
+        counts = []
+        for size in SIZES:
+            grow(size)
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts, [budget] * len(SIZES), f"queries for {SIZES} rows")
+        return response
+
+    def test_test_run_list(self):
+        self.assertQueryBudget(2, self.grow_runs,
+                               lambda: self.client.get(reverse('testrun-list'), {'page_size': 1000}))
+
+    def test_test_run_list_expanded(self):
+        response = self.assertQueryBudget(2, self.grow_runs, lambda: self.client.get(
+            reverse('testrun-list'), {'page_size': 1000, 'expand': 'test,language_model,result'}))
+        run = response.data['results'][0]
+        self.assertEqual(set(run['test']), {'id', 'name', 'description'})
+        self.assertEqual(run['language_model']['name'], TestRun.objects.get(pk=run['id']).language_model.name)
+
+    def test_evaluation_list_expanded(self):
+        response = self.assertQueryBudget(1, self.grow_evaluations, lambda: self.client.get(
+            reverse('evaluation-list'), {'page_size': 1000, 'expand': 'test_run.test,test_run.language_model'}))
+        test_run = response.data['results'][0]['test_run']
+        self.assertIn('name', test_run['test'])
+        self.assertIn('name', test_run['language_model'])
+
+    def test_batch_list(self):
+        def grow(size):
+            self.grow_runs(size)
+            TestRunBatch.objects.bulk_create([TestRunBatch(test=self.tests[0]) for _ in range(size // 100)])
+        response = self.assertQueryBudget(1, grow, lambda: self.client.get(reverse('testrunbatch-list'), {'page_size': 1000}))
+        batch = next(item for item in response.data['results'] if item['id'] == self.batch.pk)
+        self.assertEqual(batch['progress']['completed'], SIZES[-1])
+
+    def test_browsable_api_evaluation_list(self):
+        # The form's test run <select> stops at DRF's 1,000 option cutoff.
+        self.assertQueryBudget(2, self.grow_evaluations, lambda: self.client.get(
+            reverse('evaluation-list'), {'page_size': 50}, HTTP_ACCEPT='text/html'))
+
+    def test_admin_changelists(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        for model, grow in (('testrun', self.grow_runs), ('evaluation', self.grow_evaluations)):
+            with self.subTest(model):
+                self.assertQueryBudget(5, grow, lambda: self.client.get(reverse(f'admin:api_{model}_changelist')))
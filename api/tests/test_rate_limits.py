@@ -0,0 +1,93 @@
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+from django.db import close_old_connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from api import rate_limits, runner
+from api.models import Test, LanguageModel, TestRun, RateLimitBucket
+
+def create_language_model(**kwargs):
+    attributes = {
+        'name': 'Fake',
+        'api_key': 'test_api_key',
+        'prompt_template': '{question}',
+        'library': 'fake',
+        'tokenizer_type': 'fallback',
+        'input_cost_per_1k_tokens': Decimal('0.0200'),
+        'output_cost_per_1k_tokens': Decimal('0.0400'),
+    }
+    attributes.update(kwargs)
+    return LanguageModel.objects.create(**attributes)
+
+@override_settings(RATE_LIMIT_BURST_SECONDS=10)
+class ReserveTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch('api.rate_limits.time')
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock.time.return_value = 1000.0
+
+    def test_unlimited_models_do_not_wait(self):
+        language_model = create_language_model()
+        with self.assertNumQueries(0):
+            self.assertEqual(rate_limits.reserve(language_model, 1000), 0)
+
+    def test_requests_wait_in_turn_after_the_burst(self):
+        language_model = create_language_model(requests_per_minute=60)
+        waits = [rate_limits.reserve(language_model, 0) for _ in range(12)]
+        self.assertEqual(waits, [0] * 10 + [1, 2])
+        self.clock.time.return_value = 1005.0
+        waits = [rate_limits.reserve(language_model, 0) for _ in range(4)]
+        self.assertEqual(waits, [0, 0, 0, 1])
+
+    def test_tokens_per_minute(self):
+        language_model = create_language_model(tokens_per_minute=600)
+        # 10 tokens per second, 100 in the bucket; larger calls wait for a full bucket.
+        self.assertEqual(rate_limits.reserve(language_model, 150), 0)
+        self.assertAlmostEqual(rate_limits.reserve(language_model, 50), 5)
+        rate_limits.release(language_model, 30)
+        self.assertAlmostEqual(rate_limits.reserve(language_model, 10), 3)
+
+    def test_buckets_are_shared_by_library_and_name(self):
+        first = create_language_model(requests_per_minute=6)
+        same = create_language_model(requests_per_minute=6, prompt_template='אחר {question}')
+        other = create_language_model(name='Other', requests_per_minute=6)
+        self.assertEqual(rate_limits.reserve(first, 0), 0)
+        self.assertAlmostEqual(rate_limits.reserve(same, 0), 10)
+        self.assertEqual(rate_limits.reserve(other, 0), 0)
+        self.assertEqual(RateLimitBucket.objects.count(), 2)
+
+    @override_settings(RATE_LIMIT_BURST_SECONDS=0)
+    def test_runs_are_paced(self):
+        test = Test.objects.create(name="מבחן", description="תיאור", questions=["א", "ב", "ג"])
+        language_model = create_language_model(requests_per_minute=6, tokens_per_minute=100000)
+        test_run = TestRun.objects.create(test=test, language_model=language_model, use_cache=False)
+        runner.execute_test_run(test_run.pk)
+        self.assertEqual([call.args[0] for call in self.clock.sleep.call_args_list], [10, 20])
+        test_run.refresh_from_db()
+        self.assertEqual(test_run.status, 'completed')
+
+@override_settings(RATE_LIMIT_BURST_SECONDS=0)
+class SharedBucketTest(TransactionTestCase):
+    def test_threads_share_the_rate(self):
+        language_model = create_language_model(requests_per_minute=6000)
+        served = []
+
+        def call():
+            try:
+                for _ in range(5):
+                    rate_limits.acquire(language_model, "", 0)
+                    served.append(time.monotonic())
+            finally:
+                close_old_connections()
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 20 calls at 100 per second, the first without waiting.
+        self.assertEqual(len(served), 20)
+        self.assertGreaterEqual(max(served) - started, 0.18)
@@ -0,0 +1,145 @@
+from decimal import Decimal
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api import ledger
+from api.models import Source, Test, Budget
+from api.read_cache import read_cache
+from api.tests.test_runner import create_language_model
+
+class ReadCacheTestCase(TestCase):
+    def setUp(self):
+        caches[read_cache.alias].clear()
+        read_cache.reset_stats()
+        self.client = APIClient()
+
+    def get(self, url, *args, **kwargs):
+        # Entries are stored when the request's transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url, *args, **kwargs)
+
+    def assertCached(self, url, *args, **kwargs):
+        first = self.get(url, *args, **kwargs)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get(url, *args, **kwargs)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(second.data, first.data)
+        return second
+
+class CachedListTest(ReadCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sources = [Source.objects.create(name=f"מקור {i}", content=f"תוכן {i}") for i in range(3)]
+        self.url = reverse('source-list')
+
+    def names(self, response):
+        return sorted(item['name'] for item in response.data['results'])
+
+    def test_hit_costs_no_queries(self):
+        self.assertCached(self.url)
+        self.assertCached(self.url, {'fields': 'id,name'})
+        self.assertCached(reverse('languagemodel-list'))
+        self.assertCached(reverse('test-list'))
+
+    def test_query_string_is_part_of_the_key(self):
+        full = self.get(self.url)
+        selected = self.get(self.url, {'fields': 'id'})
+        self.assertIn('name', full.data['results'][0])
+        self.assertNotIn('name', selected.data['results'][0])
+
+    def test_save_and_delete_invalidate(self):
+        self.get(self.url)
+        self.sources[0].name = "שונה"
+        self.sources[0].save()
+        self.assertIn("שונה", self.names(self.get(self.url)))
+        self.sources[1].delete()
+        self.assertEqual(len(self.get(self.url).data['results']), 2)
+        Source.objects.create(name="חדש", content="תוכן")
+        self.assertIn("חדש", self.names(self.get(self.url)))
+
+    def test_bulk_write_invalidates(self):
+        self.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('source-bulk'), [{'id': self.sources[0].pk, 'name': "בתפזורת"}], format='json')
+        self.assertIn("בתפזורת", self.names(self.get(self.url)))
+
+    def test_not_modified_from_cache(self):
+        etag = self.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(queries), 0)
+
+    def test_uncommitted_reads_are_not_stored(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertGreater(len(queries), 0)
+
+class CachedDetailTest(ReadCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = Source.objects.create(name="בראשית", content="בראשית ברא")
+        self.other = Source.objects.create(name="שמות", content="ואלה שמות")
+
+    def test_save_invalidates_only_that_object(self):
+        url = reverse('source-detail', args=[self.source.pk])
+        other_url = reverse('source-detail', args=[self.other.pk])
+        self.get(url)
+        self.get(other_url)
+        self.source.name = "שונה"
+        self.source.save()
+        self.assertEqual(self.get(url).data['name'], "שונה")
+        with CaptureQueriesContext(connection) as queries:
+            self.get(other_url)
+        self.assertEqual(len(queries), 0)
+
+    def test_changing_sources_invalidates_test(self):
+        test = Test.objects.create(name="מבחן", description="")
+        url = reverse('test-detail', args=[test.pk])
+        self.assertEqual(self.get(url).data['sources'], [])
+        self.source.tests.add(test)
+        self.assertEqual(self.get(url).data['sources'], [self.source.pk])
+        self.source.delete()
+        self.assertEqual(self.get(url).data['sources'], [])
+
+    def test_language_model_update_invalidates(self):
+        language_model = create_language_model()
+        url = reverse('languagemodel-detail', args=[language_model.pk])
+        self.get(url)
+        language_model.name = "אחר"
+        language_model.save()
+        self.assertEqual(self.get(url).data['name'], "אחר")
+
+class CachedBudgetTest(ReadCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.budget = Budget.objects.create(date=timezone.now().date(), daily_limit=Decimal("10.00"))
+        self.url = reverse('budget-today')
+
+    def test_today_is_cached(self):
+        self.assertCached(self.url)
+
+    def test_ledger_writes_invalidate(self):
+        self.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.reserve(Decimal("2.50"))
+        self.assertEqual(Decimal(self.get(self.url).data['reserved']), Decimal("2.50"))
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.add_usage(Decimal("1.00"))
+        self.assertEqual(Decimal(self.get(self.url).data['current_usage']), Decimal("1.00"))
+
+class CacheStatsTest(ReadCacheTestCase):
+    def test_counts_hits_and_misses(self):
+        url = reverse('source-list')
+        for _ in range(3):
+            self.get(url)
+        stats = self.client.get(reverse('cache-stats')).data['read_cache']
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(stats['models']['api.source']['hits'], 2)
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 3)
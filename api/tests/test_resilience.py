@@ -0,0 +1,337 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import ledger, resilience, runner
+from api.models import Test, LanguageModel, TestRun, QuestionResult, Budget, CircuitBreaker
+from api.providers import (
+    BaseProvider, Completion, FakeProvider, ProviderError, ProviderTimeout, TransientProviderError, register
+)
+from api.tokenizers import count_tokens
+
+@register('scripted')
+class ScriptedProvider(BaseProvider):
+    """Plays `outcomes` in order: an exception is raised, a number is a delay
+    before answering, None answers at once. Answers once they run out."""
+    outcomes = []
+    calls = 0
+
+    def complete(self, prompt, **params):
+        ScriptedProvider.calls += 1
+        outcome = ScriptedProvider.outcomes.pop(0) if ScriptedProvider.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome:
+            time.sleep(outcome)
+        return Completion(text=f"answer {ScriptedProvider.calls}", input_tokens=10, output_tokens=5)
+
+def create_language_model(**kwargs):
+    attributes = {
+        'name': 'Scripted',
+        'api_key': 'test_api_key',
+        'prompt_template': '{question}',
+        'library': 'scripted',
+        'tokenizer_type': 'fallback',
+        'input_cost_per_1k_tokens': Decimal('0.0200'),
+        'output_cost_per_1k_tokens': Decimal('0.0400'),
+    }
+    attributes.update(kwargs)
+    return LanguageModel.objects.create(**attributes)
+
+class ResilienceTestCase(TestCase):
+    def setUp(self):
+        ScriptedProvider.outcomes = []
+        ScriptedProvider.calls = 0
+        patcher = mock.patch('api.resilience.backoff', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.language_model = create_language_model()
+        self.provider = ScriptedProvider(self.language_model)
+
+    def complete(self, calls=None):
+        return resilience.complete(self.language_model, self.provider, "שאלה", {'max_tokens': 10}, calls)
+
+    def breaker(self):
+        return CircuitBreaker.objects.get(language_model=self.language_model)
+
+@override_settings(PROVIDER_MAX_ATTEMPTS=3, PROVIDER_BREAKER_THRESHOLD=5)
+class RetryTest(ResilienceTestCase):
+    def test_transient_failures_are_retried(self):
+        ScriptedProvider.outcomes = [TransientProviderError("overloaded"), ConnectionError("reset")]
+        self.assertEqual(self.complete().text, "answer 3")
+        breaker = self.breaker()
+        self.assertEqual((breaker.state, breaker.consecutive_failures), ('closed', 0))
+        self.assertEqual((breaker.successes, breaker.failures, breaker.retries), (1, 2, 2))
+
+    def test_other_failures_are_not_retried(self):
+        ScriptedProvider.outcomes = [ProviderError("bad request")]
+        with self.assertRaises(ProviderError):
+            self.complete()
+        self.assertEqual(ScriptedProvider.calls, 1)
+        self.assertEqual((self.breaker().failures, self.breaker().consecutive_failures), (1, 0))
+
+    def test_last_failure_is_raised(self):
+        ScriptedProvider.outcomes = [TransientProviderError(str(i)) for i in range(3)]
+        with self.assertRaisesMessage(TransientProviderError, "2"):
+            self.complete()
+        self.assertEqual(ScriptedProvider.calls, 3)
+
+    def test_retries_respect_the_call_limit(self):
+        ScriptedProvider.outcomes = [TransientProviderError("overloaded")]
+        with self.assertRaises(ledger.ReservationExhausted):
+            self.complete(resilience.Calls(limit=1))
+        self.assertEqual(ScriptedProvider.calls, 1)
+
+class BackoffTest(TestCase):
+    @override_settings(PROVIDER_BACKOFF_BASE=0.5, PROVIDER_BACKOFF_MAX=3)
+    def test_full_jitter_is_capped(self):
+        error = TransientProviderError("overloaded")
+        for attempt, ceiling in [(0, 0.5), (1, 1), (2, 2), (3, 3), (10, 3)]:
+            delays = [resilience.backoff(attempt, error) for _ in range(50)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays))
+            self.assertGreater(len(set(delays)), 1)
+
+    def test_retry_after_is_respected(self):
+        self.assertGreaterEqual(resilience.backoff(0, TransientProviderError("slow down", retry_after=7)), 7)
+
+@override_settings(PROVIDER_MAX_ATTEMPTS=1, PROVIDER_BREAKER_THRESHOLD=2, PROVIDER_BREAKER_COOLDOWN=30)
+class CircuitBreakerTest(ResilienceTestCase):
+    def open_circuit(self):
+        ScriptedProvider.outcomes = [TransientProviderError("down"), TransientProviderError("down")]
+        with self.assertRaises(TransientProviderError):
+            self.complete()
+        with self.assertRaises(resilience.CircuitOpen):
+            self.complete()
+
+    def test_consecutive_failures_open_the_circuit(self):
+        self.open_circuit()
+        self.assertEqual(self.breaker().state, 'open')
+        with self.assertRaises(resilience.CircuitOpen) as raised:
+            self.complete()
+        self.assertEqual(ScriptedProvider.calls, 2)
+        self.assertAlmostEqual(raised.exception.retry_after, 30, delta=1)
+        self.assertEqual(self.breaker().rejections, 1)
+
+    def test_successful_probe_closes_the_circuit(self):
+        self.open_circuit()
+        CircuitBreaker.objects.update(opened_at=timezone.now() - timedelta(seconds=31))
+        self.assertEqual(self.complete().text, "answer 3")
+        self.assertEqual((self.breaker().state, self.breaker().consecutive_failures), ('closed', 0))
+
+    def test_failed_probe_reopens_the_circuit(self):
+        self.open_circuit()
+        CircuitBreaker.objects.update(opened_at=timezone.now() - timedelta(seconds=31))
+        ScriptedProvider.outcomes = [TransientProviderError("still down")]
+        with self.assertRaises(resilience.CircuitOpen):
+            self.complete()
+        breaker = self.breaker()
+        self.assertEqual(breaker.state, 'open')
+        self.assertAlmostEqual(resilience.retry_after(breaker), 30, delta=1)
+
+    def test_only_one_probe_at_a_time(self):
+        self.open_circuit()
+        CircuitBreaker.objects.update(opened_at=timezone.now() - timedelta(seconds=31))
+        self.assertEqual(resilience.admit(self.language_model).state, 'half_open')
+        with self.assertRaises(resilience.CircuitOpen):
+            resilience.admit(self.language_model)
+
+    def test_other_models_are_not_affected(self):
+        self.open_circuit()
+        other = create_language_model(name='Other')
+        self.assertEqual(resilience.complete(other, ScriptedProvider(other), "שאלה", {}).text, "answer 3")
+
+    def test_api(self):
+        self.open_circuit()
+        client = APIClient()
+        url = reverse('languagemodel-circuit', args=[self.language_model.pk])
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], 'open')
+        self.assertEqual((response.data['failures'], response.data['consecutive_failures']), (2, 2))
+        self.assertGreater(response.data['retry_after'], 0)
+        response = client.post(reverse('languagemodel-reset-circuit', args=[self.language_model.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['state'], response.data['retry_after'], response.data['failures']), ('closed', 0, 2))
+        self.assertEqual(self.complete().text, "answer 3")
+
+    def test_api_for_a_model_without_calls(self):
+        other = create_language_model(name='Other')
+        response = APIClient().get(reverse('languagemodel-circuit', args=[other.pk]))
+        self.assertEqual((response.data['state'], response.data['successes']), ('closed', 0))
+
+@override_settings(PROVIDER_MAX_ATTEMPTS=1)
+class TimeoutTest(ResilienceTestCase):
+    @override_settings(PROVIDER_TIMEOUT=0.1)
+    def test_slow_calls_time_out(self):
+        ScriptedProvider.outcomes = [0.5]
+        calls = resilience.Calls()
+        started = time.monotonic()
+        with self.assertRaises(ProviderTimeout):
+            self.complete(calls)
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual((self.breaker().timeouts, self.breaker().failures), (1, 1))
+        self.assertEqual((calls.sent, calls.dropped), (1, 1))
+
+    @override_settings(PROVIDER_TIMEOUT=0.1, PROVIDER_MODEL_CALL_THREADS=2)
+    def test_hanging_model_holds_only_its_own_slots(self):
+        ScriptedProvider.outcomes = [0.5, 0.5]
+        for _ in range(2):
+            with self.assertRaises(ProviderTimeout):
+                self.complete()
+        # Both slots are held by abandoned calls: the next call is not sent.
+        with self.assertRaisesMessage(ProviderTimeout, "No call slot"):
+            self.complete()
+        self.assertEqual(ScriptedProvider.calls, 2)
+        other = create_language_model(name='Other')
+        self.assertEqual(resilience.complete(other, ScriptedProvider(other), "שאלה", {}).text, "answer 3")
+        # The slots come back as the abandoned calls end.
+        slots = resilience.get_slots(self.language_model)
+        self.assertTrue(all(slots.acquire(timeout=5) for _ in range(2)))
+        slots.release()
+        slots.release()
+        self.assertEqual(self.complete().text, "answer 4")
+
+    @override_settings(PROVIDER_TIMEOUT=2, PROVIDER_HEDGE_DELAY=0.05)
+    def test_slow_calls_are_hedged(self):
+        ScriptedProvider.outcomes = [0.5]
+        calls = resilience.Calls()
+        started = time.monotonic()
+        self.assertEqual(self.complete(calls).text, "answer 2")
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual((self.breaker().hedges, self.breaker().successes), (1, 1))
+        self.assertEqual((calls.sent, calls.dropped), (2, 1))
+
+    @override_settings(PROVIDER_TIMEOUT=2, PROVIDER_HEDGE_DELAY=0.05)
+    def test_hedges_respect_the_call_limit(self):
+        ScriptedProvider.outcomes = [0.2]
+        calls = resilience.Calls(limit=1)
+        self.assertEqual(self.complete(calls).text, "answer 1")
+        self.assertEqual((calls.sent, calls.dropped), (1, 0))
+
+    @override_settings(PROVIDER_TIMEOUT=2, PROVIDER_HEDGE_DELAY=0.05, RUN_EAGER=True, RUN_MAX_OUTPUT_TOKENS=100)
+    def test_runs_are_charged_for_lost_hedges(self):
+        test = Test.objects.create(name="מבחן", description="תיאור", questions=["שאלה א", "שאלה ב"])
+        test_run = TestRun.objects.create(test=test, language_model=self.language_model, use_cache=False)
+        ScriptedProvider.outcomes = [0.3]
+        runner.execute_test_run(test_run.pk)
+        test_run.refresh_from_db()
+        answer_cost = self.language_model.calculate_cost(10, 5)
+        ceiling = self.language_model.calculate_cost(count_tokens("שאלה א", 'fallback'), 100)
+        self.assertEqual(test_run.cost, 2 * answer_cost + ceiling)
+        self.assertEqual(QuestionResult.objects.get(test_run=test_run, index=0).cost, answer_cost + ceiling)
+
+    @override_settings(PROVIDER_TIMEOUT=2, PROVIDER_HEDGE_DELAY=0.05)
+    def test_fast_calls_are_not_hedged(self):
+        self.complete()
+        self.assertEqual((ScriptedProvider.calls, self.breaker().hedges), (1, 0))
+
+    @override_settings(PROVIDER_TIMEOUT=2, PROVIDER_HEDGE_DELAY=0.05, RATE_LIMIT_BURST_SECONDS=0)
+    def test_hedges_respect_rate_limits(self):
+        language_model = create_language_model(name='Limited', requests_per_minute=60)
+        ScriptedProvider.outcomes = [0.2]
+        resilience.complete(language_model, ScriptedProvider(language_model), "שאלה", {})
+        self.assertEqual(ScriptedProvider.calls, 1)
+
+@override_settings(PROVIDER_MAX_ATTEMPTS=3, FAKE_PROVIDER_ERROR_RATE=0.5)
+class FakeProviderFailureTest(ResilienceTestCase):
+
+    def test_injected_failures_are_retried(self):
+        language_model = create_language_model(name='Fake', library='fake')
+        with mock.patch('api.providers.random.random', side_effect=[0.1, 0.2, 0.9, 0.9]):
+            completion = resilience.complete(language_model, FakeProvider(language_model), "שאלה", {})
+        self.assertTrue(completion.text)
+        breaker = CircuitBreaker.objects.get(language_model=language_model)
+        self.assertEqual((breaker.failures, breaker.successes), (2, 1))
+
+    @override_settings(FAKE_PROVIDER_ERROR_RATE=1)
+    def test_failure_rate(self):
+        with self.assertRaisesMessage(TransientProviderError, "Injected failure"):
+            FakeProvider(self.language_model).complete("שאלה")
+
+@override_settings(RUN_EAGER=True, PROVIDER_MAX_ATTEMPTS=3, PROVIDER_BREAKER_THRESHOLD=1, PROVIDER_BREAKER_COOLDOWN=30)
+class PausedRunTest(ResilienceTestCase):
+    def setUp(self):
+        super().setUp()
+        test = Test.objects.create(name="מבחן", description="תיאור", questions=["שאלה א", "שאלה ב", "שאלה ג"])
+        self.test_run = TestRun.objects.create(test=test, language_model=self.language_model, use_cache=False)
+        Budget.objects.create(date=timezone.now().date(), daily_limit=Decimal("10.00"))
+        ledger.reserve_for_runs([self.test_run], [Decimal("0.10")])
+
+    def pause(self):
+        ScriptedProvider.outcomes = [None, TransientProviderError("down")]
+        with mock.patch('api.runner.schedule') as schedule, self.captureOnCommitCallbacks(execute=True):
+            runner.execute_test_run(self.test_run.pk)
+        schedule.assert_called_once_with(30)
+        self.test_run.refresh_from_db()
+
+    def test_open_circuit_pauses_the_run(self):
+        self.pause()
+        self.assertEqual(self.test_run.status, 'paused')
+        self.assertAlmostEqual((self.test_run.resume_at - timezone.now()).total_seconds(), 30, delta=2)
+        self.assertEqual(self.test_run.cost, Decimal("0.0004"))
+        self.assertEqual(self.test_run.reserved_cost, Decimal("0.0996"))
+        self.assertEqual(list(QuestionResult.objects.filter(test_run=self.test_run).order_by('index').values_list('index', 'error')),
+                         [(0, None), (1, "Circuit breaker of Scripted is open; retrying in 30s")])
+        budget = Budget.objects.get()
+        self.assertEqual((budget.current_usage, budget.reserved), (Decimal("0.0004"), Decimal("0.0996")))
+
+        # Not before its resume_at.
+        self.assertEqual(runner.requeue_paused(), 0)
+
+        # Once the circuit lets calls through again the run continues where it stopped.
+        CircuitBreaker.objects.update(opened_at=timezone.now() - timedelta(seconds=31))
+        TestRun.objects.filter(pk=self.test_run.pk).update(resume_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(runner.requeue_paused(), 1)
+        self.test_run.refresh_from_db()
+        self.assertEqual((self.test_run.status, self.test_run.resume_at), ('completed', None))
+        self.assertEqual(ScriptedProvider.calls, 4)
+        self.assertEqual(self.test_run.cost, Decimal("0.0012"))
+        budget.refresh_from_db()
+        self.assertEqual((budget.current_usage, budget.reserved), (Decimal("0.0012"), Decimal("0")))
+
+    def test_resume_endpoint_wakes_a_paused_run(self):
+        self.pause()
+        CircuitBreaker.objects.update(state='closed', opened_at=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post(reverse('testrun-resume', args=[self.test_run.pk]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'completed')
+
+@override_settings(RUN_EAGER=True, PROVIDER_MAX_ATTEMPTS=1, PROVIDER_BREAKER_THRESHOLD=1, PROVIDER_BREAKER_COOLDOWN=0.2)
+class PausedRunRequeueTest(TransactionTestCase):
+    def setUp(self):
+        ScriptedProvider.outcomes = []
+        ScriptedProvider.calls = 0
+        self.language_model = create_language_model()
+        test = Test.objects.create(name="מבחן", description="תיאור", questions=["שאלה א", "שאלה ב"])
+        self.test_run = TestRun.objects.create(test=test, language_model=self.language_model, use_cache=False)
+
+    def wait_for_completion(self):
+        for _ in range(100):
+            self.test_run.refresh_from_db()
+            if self.test_run.status == 'completed':
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.test_run.status, 'completed')
+        self.assertEqual(ScriptedProvider.calls, 3)
+
+    def test_paused_run_is_submitted_again(self):
+        ScriptedProvider.outcomes = [None, TransientProviderError("down")]
+        runner.execute_test_run(self.test_run.pk)
+        self.assertEqual(TestRun.objects.get(pk=self.test_run.pk).status, 'paused')
+        self.wait_for_completion()
+
+    def test_sweep_picks_up_runs_paused_elsewhere(self):
+        # As left by a process that paused the run and was then restarted.
+        TestRun.objects.filter(pk=self.test_run.pk).update(status='paused', resume_at=timezone.now())
+        ScriptedProvider.calls = 1
+        # What start_sweeper runs at startup and then periodically.
+        runner._sweep()
+        self.wait_for_completion()
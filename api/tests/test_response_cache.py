@@ -0,0 +1,136 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api import runner
+from api.models import Test, LanguageModel, TestRun, CachedResponse
+from api.providers import Completion
+from api.response_cache import MemoryTier, PersistentTier, ResponseCache, cache_key, response_cache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class MemoryTierTest(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        tier = MemoryTier(max_entries=2, ttl=60)
+        tier.set('a', Completion('A', 1, 1))
+        tier.set('b', Completion('B', 1, 1))
+        tier.get('a')
+        tier.set('c', Completion('C', 1, 1))
+        self.assertIsNotNone(tier.get('a'))
+        self.assertIsNone(tier.get('b'))
+        self.assertEqual(len(tier), 2)
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        tier = MemoryTier(max_entries=10, ttl=60, clock=clock)
+        tier.set('a', Completion('A', 1, 1))
+        clock.now = 61
+        self.assertIsNone(tier.get('a'))
+
+class PersistentTierTest(TestCase):
+    def setUp(self):
+        self.tier = PersistentTier(ttl=60, max_entries=3, max_bytes=1000, evict_every=1000)
+
+    def test_round_trip(self):
+        self.tier.set('a', Completion('תשובה', 3, 4))
+        self.assertEqual(self.tier.get('a'), Completion('תשובה', 3, 4))
+
+    def test_expired_entries_are_dropped(self):
+        self.tier.set('a', Completion('A', 1, 1))
+        CachedResponse.objects.update(created_at=timezone.now() - timedelta(seconds=120))
+        self.assertIsNone(self.tier.get('a'))
+        self.assertFalse(CachedResponse.objects.exists())
+
+    def test_evict_by_count_and_size(self):
+        now = timezone.now()
+        for i in range(5):
+            self.tier.set(str(i), Completion('x' * 100, 1, 1))
+            CachedResponse.objects.filter(key=str(i)).update(last_used_at=now + timedelta(seconds=i))
+        self.tier.evict()
+        self.assertEqual(set(CachedResponse.objects.values_list('key', flat=True)), {'2', '3', '4'})
+
+        self.tier.max_bytes = 150
+        self.tier.evict()
+        self.assertEqual(set(CachedResponse.objects.values_list('key', flat=True)), {'4'})
+
+class ResponseCacheTest(TestCase):
+    def test_key_depends_on_model_prompt_and_params(self):
+        language_model = LanguageModel(name="m", library="fake")
+        other = LanguageModel(name="m", library="other")
+        key = cache_key(language_model, "prompt", {'max_tokens': 10})
+        self.assertEqual(key, cache_key(language_model, "prompt", {'max_tokens': 10}))
+        self.assertNotEqual(key, cache_key(other, "prompt", {'max_tokens': 10}))
+        self.assertNotEqual(key, cache_key(language_model, "prompt", {'max_tokens': 11}))
+
+    def test_persistent_hit_warms_memory(self):
+        cache = ResponseCache(MemoryTier(10, 60), PersistentTier(60, 10, 1000, 100))
+        cache.set('a', Completion('A', 1, 1))
+        cache.memory.clear()
+        self.assertEqual(cache.get('a').text, 'A')
+        self.assertEqual(cache.get('a').text, 'A')
+        self.assertIsNone(cache.get('b'))
+        stats = cache.stats()
+        self.assertEqual((stats['memory_hits'], stats['persistent_hits'], stats['misses']), (1, 1, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 3)
+
+    def test_promoted_entry_keeps_its_remaining_ttl(self):
+        clock = FakeClock()
+        cache = ResponseCache(MemoryTier(10, 60, clock=clock), PersistentTier(60, 10, 1000, 100))
+        cache.persistent.set('a', Completion('A', 1, 1))
+        CachedResponse.objects.update(created_at=timezone.now() - timedelta(seconds=50))
+        self.assertEqual(cache.get('a').text, 'A')
+        clock.now = 9
+        self.assertEqual(cache.memory.get('a').text, 'A')
+        clock.now = 11
+        self.assertIsNone(cache.memory.get('a'))
+
+class CachedRunTest(TestCase):
+    def setUp(self):
+        response_cache.memory.clear()
+        self.test = Test.objects.create(name="מבחן", description="תיאור", questions=["שאלה א", "שאלה ב"])
+        self.language_model = LanguageModel.objects.create(
+            name="Fake",
+            api_key="test_api_key",
+            prompt_template="תבנית",
+            library="fake",
+            tokenizer_type="gpt2",
+            input_cost_per_1k_tokens=Decimal("1.0000"),
+            output_cost_per_1k_tokens=Decimal("2.0000")
+        )
+
+    def run_once(self, **kwargs):
+        test_run = TestRun.objects.create(test=self.test, language_model=self.language_model, **kwargs)
+        runner.execute_test_run(test_run.pk)
+        test_run.refresh_from_db()
+        return test_run
+
+    def test_repeated_run_is_served_from_cache_at_no_cost(self):
+        first = self.run_once()
+        second = self.run_once()
+        self.assertGreater(first.cost, 0)
+        self.assertEqual(first.cache_hits, 0)
+        self.assertEqual(second.cost, 0)
+        self.assertEqual(second.cache_hits, 2)
+        self.assertTrue(all(answer['cached'] for answer in json.loads(second.result)))
+        self.assertEqual([a['answer'] for a in json.loads(first.result)], [a['answer'] for a in json.loads(second.result)])
+
+    def test_run_can_opt_out(self):
+        self.run_once()
+        opted_out = self.run_once(use_cache=False)
+        self.assertEqual(opted_out.cache_hits, 0)
+        self.assertGreater(opted_out.cost, 0)
+
+    def test_cache_stats_endpoint(self):
+        self.run_once()
+        response = APIClient().get(reverse('testrun-cache-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hit_rate', response.data)
+        self.assertEqual(response.data['persistent_entries'], 2)
@@ -0,0 +1,124 @@
+import numpy as np
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import retrieval
+from api.models import Source, Test, Introduction
+
+INTRODUCTIONS = [
+    "הלכות שבת: אסור לבשל ולהדליק אש ביום השבת",
+    "הלכות פסח: מצוה לאכול מצה ואסור לאכול חמץ",
+    "הלכות ברכות: מברכים על הפת המוציא לחם מן הארץ",
+]
+
+class VectorizeTest(TestCase):
+    def test_hashes_are_stable_and_normalized(self):
+        features, counts = retrieval.vectorize("שָׁלוֹם עֲלֵיכֶם")
+        expected_features, expected_counts = retrieval.vectorize("שלום עליכמ")
+        np.testing.assert_array_equal(features, expected_features)
+        np.testing.assert_array_equal(counts, expected_counts)
+        self.assertEqual(features.dtype, np.uint32)
+
+    def test_short_text(self):
+        features, _ = retrieval.vectorize("א")
+        self.assertEqual(len(features), 1)
+
+class RetrievalTest(TestCase):
+    def setUp(self):
+        self.introductions = [Introduction.objects.create(content=content) for content in INTRODUCTIONS]
+
+    def test_top_k_ranks_by_similarity(self):
+        results = retrieval.top_k('introduction', ["מה אסור לאכול בפסח? חמץ", "ברכת המוציא על הלחם"], k=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0][0][0], self.introductions[1].pk)
+        self.assertEqual(results[1][0][0], self.introductions[2].pk)
+        self.assertLessEqual(len(results[0]), 2)
+        self.assertGreater(results[0][0][1], results[0][1][1])
+        self.assertLessEqual(results[0][0][1], 1.0 + 1e-6)
+
+    def test_documents_added_to_an_empty_table(self):
+        Introduction.objects.all().delete()
+        retrieval._indexes.pop('introduction', None)
+        self.assertEqual(retrieval.top_k('introduction', ["שבת"], k=3), [[]])
+        added = Introduction.objects.create(content=INTRODUCTIONS[0])
+        self.assertEqual(retrieval.top_k('introduction', ["שבת"], k=3)[0][0][0], added.pk)
+
+    def test_query_without_matches(self):
+        self.assertEqual(retrieval.top_k('introduction', ["xyz qqq"], k=3), [[]])
+
+    def test_saves_are_applied_incrementally(self):
+        retrieval.top_k('introduction', ["שבת"], k=1)
+        index = retrieval.get_index('introduction')
+        main, delta_ids = index.main, list(index.delta_ids)
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Introduction.objects.create(content="הלכות סוכה: ישיבה בסוכה שבעת ימי החג")
+        self.assertEqual(retrieval.top_k('introduction', ["ישיבה בסוכה בחג"], k=1)[0][0][0], added.pk)
+        self.assertIs(index.main, main)
+        self.assertEqual(index.delta_ids, delta_ids + [added.pk])
+
+    def test_saves_before_the_first_query_are_not_vectorized(self):
+        retrieval._indexes.pop('introduction', None)
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Introduction.objects.create(content="הלכות סוכה: ישיבה בסוכה שבעת ימי החג")
+        index = retrieval.get_index('introduction')
+        self.assertEqual(index.vectors, {})
+        self.assertEqual(retrieval.top_k('introduction', ["ישיבה בסוכה בחג"], k=1)[0][0][0], added.pk)
+
+    def test_update_and_delete(self):
+        retrieval.top_k('introduction', ["שבת"], k=1)
+        shabbat = self.introductions[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            shabbat.content = "הלכות יום כיפור: תענית וחמשה עינויים"
+            shabbat.save()
+        self.assertEqual(retrieval.top_k('introduction', ["תענית יום כיפור"], k=1)[0][0][0], shabbat.pk)
+        self.assertNotIn(shabbat.pk, [pk for pk, _ in retrieval.top_k('introduction', ["להדליק אש בשבת"], k=3)[0]])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.introductions[1].delete()
+        self.assertNotIn(self.introductions[1].pk, [pk for pk, _ in retrieval.top_k('introduction', ["חמץ בפסח"], k=3)[0]])
+
+    def test_writes_without_signals_are_synced(self):
+        retrieval.top_k('introduction', ["שבת"], k=1)
+        Introduction.objects.filter(pk=self.introductions[2].pk).update(
+            content="הלכות ציצית: ארבע כנפות", updated_at=timezone.now())
+        self.assertEqual(retrieval.top_k('introduction', ["ציצית בארבע כנפות"], k=1)[0][0][0], self.introductions[2].pk)
+        Introduction.objects.filter(pk=self.introductions[0].pk).delete()
+        self.assertNotIn(self.introductions[0].pk, [pk for pk, _ in retrieval.top_k('introduction', ["שבת"], k=3)[0]])
+
+    def test_merge_rebuilds_the_index(self):
+        retrieval.top_k('introduction', ["שבת"], k=1)
+        Introduction.objects.bulk_create([
+            Introduction(content=f"הקדמה מספר {i}") for i in range(retrieval.MERGE_MIN_DOCUMENTS + 1)])
+        retrieval.top_k('introduction', ["שבת"], k=1)
+        index = retrieval.get_index('introduction')
+        self.assertEqual(index.delta_ids, [])
+        self.assertEqual(len(index.main_ids), Introduction.objects.count())
+
+class RelatedViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('test-related')
+        self.introductions = [Introduction.objects.create(content=content) for content in INTRODUCTIONS]
+        self.sources = [Source.objects.create(name="שמות", content="זכור את יום השבת לקדשו")]
+        self.tests = [
+            Test.objects.create(name="חמץ", description="דיני חמץ ומצה", questions=["מה אסור לאכול בפסח?"]),
+            Test.objects.create(name="שבת", description="מלאכות שבת", questions=[{"question": "האם מותר לבשל בשבת?"}]),
+        ]
+
+    def test_related_introductions_per_test(self):
+        response = self.client.post(self.url, {"tests": [test.id for test in self.tests], "k": 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([result['test'] for result in results], [test.id for test in self.tests])
+        self.assertEqual(results[0]['matches'][0]['id'], self.introductions[1].id)
+        self.assertEqual(results[1]['matches'][0]['id'], self.introductions[0].id)
+        self.assertLessEqual(len(results[0]['matches']), 2)
+
+    def test_related_sources(self):
+        response = self.client.post(self.url, {"tests": [self.tests[1].id], "kind": "source"}, format='json')
+        self.assertEqual(response.data['results'][0]['matches'][0]['id'], self.sources[0].id)
+
+    def test_unknown_test(self):
+        response = self.client.post(self.url, {"tests": [999999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,242 @@
+import json
+import threading
+import time
+from decimal import Decimal
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from api import ledger, runner
+from api.models import Test, LanguageModel, TestRun, QuestionResult, Budget, ModelStats
+from api.response_cache import response_cache
+from api.providers import BaseProvider, Completion, FakeProvider, ProviderNotFound, get_provider, register
+
+def create_language_model(**kwargs):
+    attributes = {
+        'name': 'Fake',
+        'api_key': 'test_api_key',
+        'prompt_template': 'ענה על השאלה',
+        'library': 'fake',
+        'tokenizer_type': 'gpt2',
+        'input_cost_per_1k_tokens': Decimal('0.0200'),
+        'output_cost_per_1k_tokens': Decimal('0.0400'),
+    }
+    attributes.update(kwargs)
+    return LanguageModel.objects.create(**attributes)
+
+class ProviderRegistryTest(TestCase):
+    def test_fake_provider_is_registered(self):
+        provider = get_provider(create_language_model())
+        self.assertIsInstance(provider, FakeProvider)
+        self.assertIsInstance(provider, BaseProvider)
+
+    def test_unknown_library(self):
+        with self.assertRaises(ProviderNotFound):
+            get_provider(create_language_model(library='no-such-library'))
+
+    def test_fake_provider_reports_usage(self):
+        completion = get_provider(create_language_model()).complete("מה שמך?")
+        self.assertEqual(completion.text, "Answer: מה שמך?")
+        self.assertEqual(completion.input_tokens, 2)
+        self.assertEqual(completion.output_tokens, 3)
+
+class ExecuteTestRunTest(TestCase):
+    def setUp(self):
+        response_cache.memory.clear()
+        self.test = Test.objects.create(name="מבחן", description="תיאור", questions=["שאלה א", {"question": "שאלה ב"}])
+        self.language_model = create_language_model()
+        self.test_run = TestRun.objects.create(test=self.test, language_model=self.language_model)
+
+    def test_completes_run(self):
+        runner.execute_test_run(self.test_run.pk)
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'completed')
+        self.assertIsNotNone(self.test_run.started_at)
+        self.assertIsNotNone(self.test_run.completed_at)
+        answers = json.loads(self.test_run.result)
+        self.assertEqual([answer['question'] for answer in answers], ["שאלה א", "שאלה ב"])
+        self.assertEqual(answers[1]['answer'], "Answer: שאלה ב")
+        self.assertGreater(self.test_run.cost, 0)
+
+    def test_uses_description_when_test_has_no_questions(self):
+        self.test.questions = []
+        self.test.save()
+        runner.execute_test_run(self.test_run.pk)
+        self.test_run.refresh_from_db()
+        self.assertEqual(json.loads(self.test_run.result)[0]['question'], "תיאור")
+
+    def test_unknown_provider_fails_run(self):
+        self.test_run.language_model = create_language_model(library='no-such-library')
+        self.test_run.save()
+        runner.execute_test_run(self.test_run.pk)
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'failed')
+        self.assertIn('no-such-library', self.test_run.result)
+        self.assertIsNotNone(self.test_run.completed_at)
+
+    def test_only_pending_runs_are_executed(self):
+        TestRun.objects.filter(pk=self.test_run.pk).update(status='completed')
+        self.assertIsNone(runner.execute_test_run(self.test_run.pk))
+
+@override_settings(RUN_EAGER=False)
+class BackgroundExecutionTest(TransactionTestCase):
+    def test_run_executes_on_worker_thread(self):
+        test = Test.objects.create(name="מבחן", description="תיאור")
+        test_run = TestRun.objects.create(test=test, language_model=create_language_model())
+        future = runner.submit(test_run.pk, 'fake')
+        future.result(timeout=10)
+        test_run.refresh_from_db()
+        self.assertEqual(test_run.status, 'completed')
+
+class OverlapProvider(BaseProvider):
+    """Counts the calls in flight at once. While `barrier` is set, a call waits
+    there for the others, and fails if they do not come."""
+    lock = threading.Lock()
+    active = 0
+    most = 0
+    barrier = None
+
+    def complete(self, prompt, **params):
+        with OverlapProvider.lock:
+            OverlapProvider.active += 1
+            OverlapProvider.most = max(OverlapProvider.most, OverlapProvider.active)
+        try:
+            if OverlapProvider.barrier is not None:
+                OverlapProvider.barrier.wait(timeout=10)
+            else:
+                time.sleep(0.05)
+        finally:
+            with OverlapProvider.lock:
+                OverlapProvider.active -= 1
+        return Completion(text="ok", input_tokens=1, output_tokens=1)
+
+@register('overlap-parallel')
+class ParallelProvider(OverlapProvider):
+    pass
+
+@register('overlap-serial')
+class SerialProvider(OverlapProvider):
+    pass
+
+@override_settings(RUN_EAGER=False, RUN_CONCURRENCY={'overlap-parallel': 8, 'overlap-serial': 1})
+class ConcurrentExecutionTest(TransactionTestCase):
+    def setUp(self):
+        self.test = Test.objects.create(name="מבחן", description="תיאור")
+        OverlapProvider.most = 0
+
+    def tearDown(self):
+        OverlapProvider.barrier = None
+
+    def run_all(self, library, count):
+        test_runs = [
+            TestRun.objects.create(test=self.test, language_model=create_language_model(name=f"Model {i}", library=library))
+            for i in range(count)
+        ]
+        for future in [runner.submit(test_run.pk, library) for test_run in test_runs]:
+            future.result(timeout=30)
+
+    def test_models_of_one_library_run_in_parallel(self):
+        # Every call waits for all four, so the runs only complete if they overlap.
+        OverlapProvider.barrier = threading.Barrier(4)
+        self.run_all('overlap-parallel', 4)
+        self.assertEqual(TestRun.objects.filter(status='completed').count(), 4)
+        self.assertEqual(OverlapProvider.most, 4)
+
+    def test_concurrency_limit_per_library(self):
+        self.run_all('overlap-serial', 3)
+        self.assertEqual(TestRun.objects.filter(status='completed').count(), 3)
+        self.assertEqual(OverlapProvider.most, 1)
+
+@register('flaky')
+class FlakyProvider(BaseProvider):
+    """Fails on prompts containing `failing` while it is set; counts its calls."""
+    failing = None
+    calls = 0
+
+    def complete(self, prompt, **params):
+        FlakyProvider.calls += 1
+        if FlakyProvider.failing and FlakyProvider.failing in prompt:
+            raise RuntimeError("provider unavailable")
+        return Completion(text=f"ok {FlakyProvider.calls}", input_tokens=10, output_tokens=5)
+
+@override_settings(RUN_EAGER=True, RUN_RESULT_BATCH_SIZE=2)
+class QuestionResultsTest(TestCase):
+    def setUp(self):
+        response_cache.memory.clear()
+        FlakyProvider.failing = "שאלה ג"
+        FlakyProvider.calls = 0
+        self.test = Test.objects.create(name="מבחן", description="תיאור", questions=["שאלה א", "שאלה ב", "שאלה ג", "שאלה ד"])
+        self.language_model = create_language_model(library='flaky', prompt_template='{question}')
+        self.test_run = TestRun.objects.create(test=self.test, language_model=self.language_model)
+        Budget.objects.create(date=timezone.now().date(), daily_limit=Decimal("10.00"))
+
+    def tearDown(self):
+        FlakyProvider.failing = None
+
+    def test_failed_run_keeps_answered_questions(self):
+        runner.execute_test_run(self.test_run.pk)
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'failed')
+        rows = list(QuestionResult.objects.with_text().filter(test_run=self.test_run).order_by('index'))
+        self.assertEqual([(row.index, row.error) for row in rows], [(0, None), (1, None), (2, "provider unavailable")])
+        self.assertEqual(rows[0].answer, "ok 1")
+        self.assertEqual(rows[0].input_tokens, 10)
+        self.assertEqual(len(rows[0].prompt_hash), 64)
+        self.assertEqual(sum(row.cost for row in rows), self.test_run.cost)
+
+    def test_resume_continues_after_last_answer(self):
+        runner.execute_test_run(self.test_run.pk)
+        self.test_run.refresh_from_db()
+        first_cost = self.test_run.cost
+        FlakyProvider.failing = None
+        with self.captureOnCommitCallbacks(execute=True):
+            runner.resume(self.test_run, Decimal("0.10"))
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'completed')
+        self.assertEqual(FlakyProvider.calls, 5)
+        answers = json.loads(self.test_run.result)
+        self.assertEqual([answer['answer'] for answer in answers], ["ok 1", "ok 2", "ok 4", "ok 5"])
+        self.assertEqual(self.test_run.cost, first_cost * 2)
+        self.assertEqual(sum(row.cost for row in QuestionResult.objects.filter(test_run=self.test_run)), self.test_run.cost)
+        self.assertFalse(QuestionResult.objects.filter(test_run=self.test_run, error__isnull=False).exists())
+        self.assertEqual(QuestionResult.objects.filter(test_run=self.test_run).count(), 4)
+        self.assertEqual(ModelStats.objects.get(language_model=self.language_model).run_count, 1)
+
+    def test_changed_questions_are_asked_again(self):
+        runner.execute_test_run(self.test_run.pk)
+        FlakyProvider.failing = None
+        self.test.questions = ["שאלה א", "שאלה ב חדשה", "שאלה ג", "שאלה ד"]
+        self.test.save()
+        self.test_run.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            runner.resume(self.test_run, Decimal("0.10"))
+        self.test_run.refresh_from_db()
+        self.assertEqual([answer['answer'] for answer in json.loads(self.test_run.result)], ["ok 1", "ok 4", "ok 5", "ok 6"])
+
+    def test_changed_questions_remain(self):
+        runner.execute_test_run(self.test_run.pk)
+        self.test_run.refresh_from_db()
+        self.assertEqual(runner.remaining_questions(self.test_run), 2)
+        self.test.questions = ["שאלה א", "שאלה ב חדשה", "שאלה ג", "שאלה ד"]
+        self.test.save()
+        self.test_run.refresh_from_db()
+        self.assertEqual(runner.remaining_questions(self.test_run), 3)
+
+    def test_only_failed_runs_are_resumed(self):
+        with self.assertRaises(ledger.AlreadyReserved):
+            runner.resume(self.test_run, Decimal("0.10"))
+
+    def test_resume_and_questions_endpoints(self):
+        client = APIClient()
+        runner.execute_test_run(self.test_run.pk)
+        FlakyProvider.failing = None
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('testrun-resume', kwargs={'pk': self.test_run.pk}))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        response = client.post(reverse('testrun-resume', kwargs={'pk': self.test_run.pk}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = client.get(reverse('testrun-questions', kwargs={'pk': self.test_run.pk}))
+        self.assertEqual([row['index'] for row in response.data], [0, 1, 2, 3])
+        self.assertEqual(response.data[2]['answer'], "ok 4")
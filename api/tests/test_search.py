@@ -0,0 +1,101 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api import search
+from api.hebrew import normalize
+from api.models import Source, Introduction
+
+class NormalizeTest(TestCase):
+    def test_strips_niqqud_and_cantillation(self):
+        self.assertEqual(normalize("בְּרֵאשִׁ֖ית בָּרָ֣א"), "בראשית ברא")
+
+    def test_folds_final_letters(self):
+        self.assertEqual(normalize("שלום ארץ"), "שלומ ארצ")
+
+    def test_maqaf_separates_words(self):
+        self.assertEqual(normalize("אֶת־הָאָרֶץ").split(), ["את", "הארצ"])
+
+    def test_drops_gershayim(self):
+        self.assertEqual(normalize("רש\"י"), normalize("רש״י"))
+        self.assertEqual(normalize("רש״י"), "רשי")
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.genesis = Source.objects.create(name="בראשית", content="בְּרֵאשִׁ֖ית בָּרָ֣א אֱלֹהִ֑ים אֵ֥ת הַשָּׁמַ֖יִם וְאֵ֥ת הָאָֽרֶץ")
+        self.exodus = Source.objects.create(name="שמות", content="וְאֵלֶּה שְׁמוֹת בְּנֵי יִשְׂרָאֵל")
+
+    def test_matches_pointed_text_with_plain_query(self):
+        hits = search.search('source', "השמים הארץ")
+        self.assertEqual([object_id for object_id, _, _ in hits], [self.genesis.pk])
+
+    def test_snippet_highlights_match(self):
+        [(_, snippet, _)] = search.search('source', "הארץ")
+        self.assertIn("<mark>", snippet)
+
+    def test_name_matches_rank_higher(self):
+        Source.objects.create(name="אחר", content="שמות רבים שמות")
+        hits = search.search('source', "שמות")
+        self.assertEqual(hits[0][0], self.exodus.pk)
+        self.assertEqual(len(hits), 2)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.genesis.content = "לך לך"
+        self.genesis.save()
+        self.assertEqual(search.search('source', "השמים"), [])
+        self.assertEqual(len(search.search('source', "לך")), 1)
+        self.exodus.delete()
+        self.assertEqual(search.search('source', "ישראל"), [])
+
+    def test_kinds_are_separate(self):
+        introduction = Introduction.objects.create(content="הקדמה על בני ישראל")
+        self.assertEqual([hit[0] for hit in search.search('introduction', "ישראל")], [introduction.pk])
+        self.assertEqual([hit[0] for hit in search.search('source', "ישראל")], [self.exodus.pk])
+
+    def test_rebuild_command(self):
+        search.rebuild('source', Source.objects.none())
+        self.assertEqual(search.search('source', "ישראל"), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn("Indexed 2 sources", out.getvalue())
+        self.assertEqual(len(search.search('source', "ישראל")), 1)
+
+    def test_query_without_words(self):
+        self.assertEqual(search.search('source', "?!"), [])
+
+class SearchViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.source = Source.objects.create(name="בראשית", content="בְּרֵאשִׁ֖ית בָּרָ֣א אֱלֹהִ֑ים")
+        for i in range(30):
+            Source.objects.create(name=f"מקור {i}", content="אלהים " * (i + 1))
+
+    def test_source_search(self):
+        response = self.client.get(reverse('source-list'), {'q': "בראשית"})
+        self.assertEqual(response.status_code, 200)
+        [result] = response.data['results']
+        self.assertEqual(result['id'], self.source.pk)
+        self.assertEqual(result['name'], "בראשית")
+        self.assertIn("<mark>", result['snippet'])
+        self.assertEqual(set(result), {'id', 'name', 'snippet', 'rank'})
+
+    def test_limit(self):
+        response = self.client.get(reverse('source-list'), {'q': "אלהים", 'limit': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        ranks = [result['rank'] for result in response.data['results']]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    def test_invalid_limit(self):
+        response = self.client.get(reverse('source-list'), {'q': "אלהים", 'limit': 'many'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_introduction_search(self):
+        introduction = Introduction.objects.create(content="הקדמה לספר בראשית")
+        response = self.client.get(reverse('introduction-list'), {'q': "הקדמה"})
+        self.assertEqual(response.data['results'][0]['id'], introduction.pk)
+        self.assertNotIn('name', response.data['results'][0])
+
+    def test_without_query_lists_normally(self):
+        response = self.client.get(reverse('source-list'))
+        self.assertIn('next', response.data)
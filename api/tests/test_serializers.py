@@ -36,7 +36,7 @@ class TestSerializerTest(TestCase):
 
     def test_contains_expected_fields(self):
         data = self.serializer.data
-        self.assertEqual(set(data.keys()), set(['id', 'name', 'description', 'created_at', 'updated_at']))
+        self.assertEqual(set(data.keys()), set(['id', 'name', 'description', 'test_type', 'questions', 'sources', 'created_at', 'updated_at']))
 
     def test_name_field_content(self):
         data = self.serializer.data
@@ -58,7 +58,7 @@ class LanguageModelSerializerTest(TestCase):
 
     def test_contains_expected_fields(self):
         data = self.serializer.data
-        expected_fields = set(['id', 'name', 'prompt_template', 'library', 'tokenizer_type', 'input_cost_per_1k_tokens', 'output_cost_per_1k_tokens'])
+        expected_fields = set(['id', 'name', 'prompt_template', 'library', 'tokenizer_type', 'input_cost_per_1k_tokens', 'output_cost_per_1k_tokens', 'context_window', 'requests_per_minute', 'tokens_per_minute'])
         self.assertEqual(set(data.keys()), expected_fields)
 
     def test_name_field_content(self):
@@ -111,7 +111,7 @@ class TestRunSerializerTest(TestCase):
 
     def test_contains_expected_fields(self):
         data = self.serializer.data
-        expected_fields = set(['id', 'test', 'language_model', 'status', 'started_at', 'completed_at', 'result', 'cost'])
+        expected_fields = set(['id', 'test', 'language_model', 'introductions', 'batch', 'status', 'started_at', 'completed_at', 'resume_at', 'result', 'cost', 'use_cache', 'cache_hits'])
         self.assertEqual(set(data.keys()), expected_fields)
 
     def test_status_field_content(self):
@@ -148,7 +148,7 @@ class EvaluationSerializerTest(TestCase):
 
     def test_contains_expected_fields(self):
         data = self.serializer.data
-        expected_fields = set(['id', 'test_run', 'score', 'comments', 'created_at'])
+        expected_fields = set(['id', 'test_run', 'score', 'comments', 'is_automatic', 'created_at'])
         self.assertEqual(set(data.keys()), expected_fields)
 
     def test_score_field_content(self):
@@ -174,7 +174,7 @@ class BudgetSerializerTest(TestCase):
 
     def test_contains_expected_fields(self):
         data = self.serializer.data
-        expected_fields = set(['id', 'date', 'daily_limit', 'current_usage'])
+        expected_fields = set(['id', 'date', 'daily_limit', 'current_usage', 'reserved'])
         self.assertEqual(set(data.keys()), expected_fields)
 
     def test_daily_limit_field_content(self):
@@ -225,6 +225,12 @@ class TestSerializerValidationTest(TestCase):
         with self.assertRaises(ValidationError):
             serializer.is_valid(raise_exception=True)
 
+    def test_invalid_questions(self):
+        invalid_data = {'name': 'שם תקין', 'description': 'תיאור תקין', 'questions': ['שאלה', {'answer': 'א'}]}
+        serializer = TestSerializer(data=invalid_data)
+        with self.assertRaises(ValidationError):
+            serializer.is_valid(raise_exception=True)
+
 class LanguageModelSerializerValidationTest(TestCase):
     def test_negative_input_cost(self):
         invalid_data = {
@@ -256,4 +262,20 @@ class LanguageModelSerializerValidationTest(TestCase):
         with self.assertRaises(ValidationError) as context:
             serializer.is_valid(raise_exception=True)
         
-        self.assertIn('output_cost_per_1k_tokens', str(context.exception))
\ No newline at end of file
+        self.assertIn('output_cost_per_1k_tokens', str(context.exception))
+
+    def test_unknown_template_placeholder(self):
+        invalid_data = {
+            'name': 'מודל שפה',
+            'api_key': 'api_key_123',
+            'prompt_template': 'ענה על {question} לפי {commentary}',
+            'library': 'ספריה',
+            'tokenizer_type': 'סוג טוקנייזר',
+            'input_cost_per_1k_tokens': Decimal('0.0001'),
+            'output_cost_per_1k_tokens': Decimal('0.0002')
+        }
+        serializer = LanguageModelSerializer(data=invalid_data)
+        with self.assertRaises(ValidationError) as context:
+            serializer.is_valid(raise_exception=True)
+
+        self.assertIn('prompt_template', str(context.exception))
\ No newline at end of file
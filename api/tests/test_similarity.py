@@ -0,0 +1,36 @@
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase
+from api import similarity
+
+class ScorePairsTest(SimpleTestCase):
+    def test_identical_and_disjoint(self):
+        scores = similarity.score_pairs([("בְּרֵאשִׁית בָּרָא", "בראשית ברא."), ("אב", "גד"), ("", "משה")])
+        np.testing.assert_allclose(scores, [[1, 1, 1], [0, 0, 0], [0, 0, 0]])
+
+    def test_token_f1_counts_repeats_once_per_match(self):
+        token_f1 = similarity.score_pairs([("משה משה אהרן", "משה מרים")])[0, 2]
+        self.assertAlmostEqual(token_f1, 2 * (1 / 3) * (1 / 2) / (1 / 3 + 1 / 2))
+
+    def test_rouge_l_follows_order(self):
+        in_order, reversed_order = similarity.score_pairs([("משה אהרן מרים", "משה אהרן מרים יוכבד"),
+                                                           ("מרים אהרן משה", "משה אהרן מרים יוכבד")])[:, 1]
+        self.assertAlmostEqual(in_order, 2 * 1 * 0.75 / 1.75)
+        self.assertAlmostEqual(reversed_order, 2 * (1 / 3) * 0.25 / (1 / 3 + 0.25))
+
+    def test_chrf_weights_recall(self):
+        short, long = similarity.score_pairs([("משה", "משה רבנו"), ("משה רבנו", "משה")])[:, 0]
+        self.assertGreater(long, short)
+        self.assertGreater(short, 0)
+
+    def test_lcs_length(self):
+        self.assertEqual(similarity.lcs_length("ABCBDAB", "BDCABA"), 4)
+        self.assertEqual(similarity.lcs_length([1, 2, 3], []), 0)
+
+class ScoreManyTest(SimpleTestCase):
+    def test_pool_matches_in_process(self):
+        pairs = [(f"משה {i} אהרן", f"משה אהרן {i % 3}") for i in range(50)]
+        with mock.patch.object(similarity, 'CHUNK_SIZE', 10):
+            with similarity.pool(2) as executor:
+                pooled = similarity.score_many(pairs, executor)
+        np.testing.assert_allclose(pooled, similarity.score_pairs(pairs))
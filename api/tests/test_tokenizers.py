@@ -0,0 +1,88 @@
+import time
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from api.models import Test, Introduction, LanguageModel
+from api.tokenizers import FallbackTokenizer, count_tokens, get_tokenizer
+
+class FallbackTokenizerTest(TestCase):
+    def test_count_matches_spans(self):
+        tokenizer = FallbackTokenizer()
+        text = "בראשית ברא אלהים, את השמים ואת הארץ."
+        self.assertEqual(tokenizer.count(text), len(tokenizer.spans(text)))
+
+    def test_long_words_are_split(self):
+        tokenizer = FallbackTokenizer(piece_length=4)
+        self.assertEqual(tokenizer.spans("abcdefghij!"), [(0, 4), (4, 8), (8, 10), (10, 11)])
+
+    def test_empty_text(self):
+        self.assertEqual(count_tokens("", "unknown-tokenizer"), 0)
+
+class TokenizerRegistryTest(TestCase):
+    def test_tokenizer_is_loaded_once(self):
+        self.assertIs(get_tokenizer("some-tokenizer"), get_tokenizer("some-tokenizer"))
+
+    def test_unknown_type_uses_fallback(self):
+        self.assertIsInstance(get_tokenizer("סוג טוקנייזר"), FallbackTokenizer)
+
+class EstimateViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('testrun-estimate')
+        self.tests = [
+            Test.objects.create(name=f"מבחן {i}", description="הסבר את הפסוק", questions=["מי?", "מה?"])
+            for i in range(10)
+        ]
+        self.language_models = [
+            LanguageModel.objects.create(
+                name=f"Model {i}",
+                api_key="test_api_key",
+                prompt_template="ענה בקצרה",
+                library="fake",
+                tokenizer_type="fallback",
+                input_cost_per_1k_tokens=Decimal("1.0000"),
+                output_cost_per_1k_tokens=Decimal("2.0000")
+            )
+            for i in range(10)
+        ]
+        self.introductions = [Introduction.objects.create(content="הקדמה " * 200) for i in range(5)]
+
+    def test_single_estimate(self):
+        data = {
+            "tests": [self.tests[0].id],
+            "language_models": [self.language_models[0].id],
+            "introductions": [[self.introductions[0].id]],
+            "max_output_tokens": 100,
+        }
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        run = response.data['runs'][0]
+        template_tokens = count_tokens("ענה בקצרה", "fallback")
+        introduction_tokens = count_tokens(self.introductions[0].content, "fallback")
+        description_tokens = count_tokens("הסבר את הפסוק", "fallback")
+        question_tokens = count_tokens("מי?", "fallback") + count_tokens("מה?", "fallback")
+        expected_input = 2 * (template_tokens + introduction_tokens + description_tokens) + question_tokens
+        self.assertEqual(run['prompts'], 2)
+        self.assertEqual(run['input_tokens'], expected_input)
+        self.assertEqual(run['output_tokens'], 200)
+        self.assertEqual(Decimal(run['cost']), (Decimal(expected_input) + Decimal(400)) / 1000)
+
+    def test_matrix_estimate_is_fast(self):
+        data = {
+            "tests": [test.id for test in self.tests],
+            "language_models": [language_model.id for language_model in self.language_models],
+            "introductions": [[introduction.id] for introduction in self.introductions],
+        }
+        started = time.monotonic()
+        response = self.client.post(self.url, data, format='json')
+        elapsed = time.monotonic() - started
+        self.assertEqual(response.data['total']['runs'], 500)
+        self.assertLess(elapsed, 0.5)
+
+    def test_unknown_ids(self):
+        data = {"tests": [30000], "language_models": [self.language_models[0].id]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tests', response.data)
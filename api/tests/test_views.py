@@ -1,8 +1,9 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
-from api.models import Source, Test, LanguageModel, TestRun
+from api.models import Source, Test, Introduction, LanguageModel, TestRun, Budget
 from decimal import Decimal
 
 class SourceViewTest(TestCase):
@@ -81,4 +82,91 @@ class TestRunViewTest(TestCase):
             "status": "pending"
         }
         response = self.client.post(self.list_url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+@override_settings(RUN_EAGER=True)
+class RunTestViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.test = Test.objects.create(name="Sample Test", description="Test description", questions=["מה?"])
+        self.language_model = LanguageModel.objects.create(
+            name="Fake",
+            api_key="test_api_key",
+            prompt_template="Test template",
+            library="fake",
+            tokenizer_type="gpt2",
+            input_cost_per_1k_tokens=Decimal("0.0200"),
+            output_cost_per_1k_tokens=Decimal("0.0400")
+        )
+        self.test_run = TestRun.objects.create(test=self.test, language_model=self.language_model)
+        self.url = reverse('testrun-run-test', kwargs={'pk': self.test_run.pk})
+        Budget.objects.create(date=timezone.now().date(), daily_limit=Decimal("10.00"))
+
+    def test_run_test_is_accepted_and_executed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'completed')
+
+    def test_run_test_rejects_started_run(self):
+        TestRun.objects.filter(pk=self.test_run.pk).update(status='in_progress')
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_run_test_without_budget(self):
+        Budget.objects.all().delete()
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+@override_settings(RUN_EAGER=True)
+class RunAllModelsViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.test = Test.objects.create(name="Sample Test", description="Test description")
+        self.language_models = [
+            LanguageModel.objects.create(
+                name=f"Fake {i}",
+                api_key="test_api_key",
+                prompt_template="Test template",
+                library="fake",
+                tokenizer_type="gpt2",
+                input_cost_per_1k_tokens=Decimal("0.0200"),
+                output_cost_per_1k_tokens=Decimal("0.0400")
+            )
+            for i in range(3)
+        ]
+        self.url = reverse('test-run-all-models', kwargs={'pk': self.test.pk})
+        Budget.objects.create(date=timezone.now().date(), daily_limit=Decimal("10.00"))
+
+    def test_run_all_models_creates_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['progress']['total'], 3)
+        self.assertEqual(TestRun.objects.filter(batch_id=response.data['id']).count(), 3)
+
+        response = self.client.get(reverse('testrunbatch-detail', kwargs={'pk': response.data['id']}))
+        self.assertEqual(response.data['progress']['completed'], 3)
+        self.assertTrue(response.data['progress']['done'])
+
+    def test_run_all_models_with_introductions(self):
+        introduction = Introduction.objects.create(content="הקדמה")
+        response = self.client.post(self.url, {"introductions": [introduction.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        for test_run in TestRun.objects.filter(batch_id=response.data['id']):
+            self.assertEqual(list(test_run.introductions.all()), [introduction])
+
+    def test_run_all_models_rejects_bad_ids(self):
+        for data in ({"language_models": [30000]}, {"language_models": "all"}, {"introductions": ["x"]}):
+            response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+        self.assertFalse(TestRun.objects.exists())
+
+    def test_run_selected_models(self):
+        data = {"language_models": [self.language_models[0].id]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['progress']['total'], 1)
+        self.assertEqual(response.data['progress']['pending'], 1)
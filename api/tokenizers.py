@@ -0,0 +1,81 @@
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokenizer types served by tiktoken when it is installed; anything else (or a
+# tiktoken encoding that cannot be loaded offline) uses FallbackTokenizer.
+TIKTOKEN_ENCODINGS = {
+    'gpt2': 'gpt2',
+    'r50k_base': 'r50k_base',
+    'p50k_base': 'p50k_base',
+    'cl100k_base': 'cl100k_base',
+    'o200k_base': 'o200k_base',
+}
+
+class FallbackTokenizer:
+    """Pure-Python approximation of a BPE tokenizer.
+
+    Words are split into pieces of at most `piece_length` characters and every
+    punctuation mark is its own token, which tracks BPE counts closely enough
+    for budgeting and context-window checks on both Hebrew and English text.
+    """
+
+    name = 'fallback'
+    pattern = re.compile(r"\w+|[^\w\s]")
+
+    def __init__(self, piece_length=4):
+        self.piece_length = piece_length
+
+    def spans(self, text):
+        spans = []
+        for match in self.pattern.finditer(text):
+            start, end = match.span()
+            for piece_start in range(start, end, self.piece_length):
+                spans.append((piece_start, min(piece_start + self.piece_length, end)))
+        return spans
+
+    def count(self, text):
+        piece_length = self.piece_length
+        return sum((len(word) + piece_length - 1) // piece_length for word in self.pattern.findall(text))
+
+class TiktokenTokenizer:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.name = encoding.name
+
+    def spans(self, text):
+        tokens = self.encoding.encode(text, disallowed_special=())
+        _, offsets = self.encoding.decode_with_offsets(tokens)
+        return list(zip(offsets, offsets[1:] + [len(text)]))
+
+    def count(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+def _load_tokenizer(tokenizer_type):
+    encoding_name = TIKTOKEN_ENCODINGS.get(tokenizer_type)
+    if tiktoken is not None and encoding_name:
+        try:
+            return TiktokenTokenizer(tiktoken.get_encoding(encoding_name))
+        except Exception:
+            pass
+    return FallbackTokenizer()
+
+def get_tokenizer(tokenizer_type):
+    """Return the process-wide tokenizer for `tokenizer_type`, loading it on first use."""
+    tokenizer = _tokenizers.get(tokenizer_type)
+    if tokenizer is None:
+        with _tokenizers_lock:
+            tokenizer = _tokenizers.get(tokenizer_type)
+            if tokenizer is None:
+                tokenizer = _tokenizers[tokenizer_type] = _load_tokenizer(tokenizer_type)
+    return tokenizer
+
+def count_tokens(text, tokenizer_type):
+    return get_tokenizer(tokenizer_type).count(text)
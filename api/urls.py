@@ -6,8 +6,13 @@ from .views import (
     IntroductionViewSet,
     LanguageModelViewSet,
     TestRunViewSet,
+    TestRunBatchViewSet,
     EvaluationViewSet,
-    BudgetViewSet
+    AnswerMetricsViewSet,
+    BudgetViewSet,
+    AnalyticsViewSet,
+    CacheViewSet,
+    test_run_events
 )
 
 router = DefaultRouter()
@@ -16,9 +21,14 @@ router.register(r'tests', TestViewSet)
 router.register(r'introductions', IntroductionViewSet)
 router.register(r'language-models', LanguageModelViewSet)
 router.register(r'test-runs', TestRunViewSet)
+router.register(r'test-run-batches', TestRunBatchViewSet)
 router.register(r'evaluations', EvaluationViewSet)
+router.register(r'answer-metrics', AnswerMetricsViewSet)
 router.register(r'budgets', BudgetViewSet)
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
+router.register(r'cache', CacheViewSet, basename='cache')
 
 urlpatterns = [
+    path('test-runs/<int:pk>/events/', test_run_events, name='testrun-events'),
     path('', include(router.urls)),
 ]
@@ -1,87 +1,826 @@
+import asyncio
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
-from .models import Source, Test, Introduction, LanguageModel, TestRun, Evaluation, Budget
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.dateparse import parse_date, parse_datetime
+from . import analytics, estimates, events, exports, grading, ledger, resilience, retrieval, runner, search
+from .models import Source, Test, Introduction, LanguageModel, CircuitBreaker, TestRunBatch, TestRun, QuestionResult, Evaluation, AnswerMetrics, Budget, ModelStats, ModelTestStats, TextQuerySet
+from .prompts import get_introductions, get_questions
+from .pagination import OffsetPagination
+from .read_cache import read_cache
+from .response_cache import response_cache
 from .serializers import (
+    BATCH_PROGRESS_ANNOTATIONS,
+    PreloadedPrimaryKeyRelatedField,
     SourceSerializer, 
     TestSerializer, 
     IntroductionSerializer, 
     LanguageModelSerializer, 
+    CircuitBreakerSerializer,
+    TestRunBatchSerializer,
     TestRunSerializer, 
+    QuestionResultSerializer,
+    RunEstimateSerializer,
+    RunAllModelsSerializer,
+    RelatedDocumentsSerializer,
+    GradeSerializer,
+    UsageSerializer,
     EvaluationSerializer, 
-    BudgetSerializer
+    AnswerMetricsSerializer,
+    BudgetSerializer,
+    ModelStatsSerializer,
+    ModelTestStatsSerializer
 )
 
-class SourceViewSet(viewsets.ModelViewSet):
+class FieldSelectionMixin:
+    """Lean read representations.
+
+    List responses leave out `heavy_fields` (and the query defers them) unless
+    they are named in `?expand=`. `?fields=id,name` keeps only the given fields
+    on both list and detail responses. `?expand=` also nests the relations a
+    serializer lists in `expandable_fields`, e.g. `?expand=test,language_model`.
+    """
+
+    heavy_fields = ()
+
+    def _query_param_list(self, name):
+        value = self.request.query_params.get(name, '')
+        return {field.strip() for field in value.split(',') if field.strip()}
+
+    def get_selected_fields(self):
+        if self.request.method not in ('GET', 'HEAD'):
+            return None
+        available = self.get_serializer_class().Meta.fields
+        requested = self._query_param_list('fields')
+        expand = self._query_param_list('expand')
+        if requested:
+            return [field for field in available if field in requested or field in expand]
+        if self.action == 'list':
+            return [field for field in available if field not in self.heavy_fields or field in expand]
+        return None
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_selected_fields())
+        if self.request.method in ('GET', 'HEAD'):
+            kwargs.setdefault('expand', self._query_param_list('expand'))
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if isinstance(queryset, TextQuerySet):
+            # The model manager defers compressed text fields; load those the response shows.
+            queryset = queryset.with_text()
+        selected = self.get_selected_fields()
+        if selected is not None:
+            deferred = [field for field in self.heavy_fields if field not in selected]
+            if deferred:
+                queryset = queryset.defer(*deferred)
+        return queryset
+
+class BulkMixin:
+    """`POST <list>/bulk/` with a list of objects creates those without an `id`
+    and partially updates those with one.
+
+    Items are validated in one serializer pass, with related ids loaded in one
+    query per relation. If any item is invalid nothing is written and the 400
+    response lists each item's errors (`{}` for valid items); otherwise all rows
+    are written with bulk_create/bulk_update in chunks inside one transaction.
+    bulk_create and bulk_update send no model signals: `after_bulk_write`
+    does their work.
+    """
+
+    bulk_batch_size = 500
+    max_bulk_items = 10000
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_bulk_items:
+            return Response({'error': f'At most {self.max_bulk_items} items per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.queryset.model
+        errors = [{} for _ in items]
+        creates, updates = [], []
+        for index, item in enumerate(items):
+            pk = item.get('id') if isinstance(item, dict) else None
+            if pk is None:
+                creates.append(index)
+            elif isinstance(pk, int) and not isinstance(pk, bool):
+                updates.append(index)
+            else:
+                errors[index] = {'id': ['A valid integer is required.']}
+        # Full rows: derived fields and after_bulk_write (search indexing) read the text fields.
+        existing = model.objects.defer(None).in_bulk([items[index]['id'] for index in updates])
+        for index in updates:
+            if items[index]['id'] not in existing:
+                errors[index] = {'id': ['No object with this id.']}
+        updates = [index for index in updates if not errors[index]]
+
+        context = self.get_serializer_context()
+        context['preloaded'] = self.preload_related(items)
+        validated = {}
+        for indexes, partial in ((creates, False), (updates, True)):
+            serializer = self.get_serializer_class()(
+                data=[items[index] for index in indexes], many=True, partial=partial, context=context)
+            if serializer.is_valid():
+                validated.update(zip(indexes, serializer.validated_data))
+            else:
+                for index, item_errors in zip(indexes, serializer.errors):
+                    errors[index] = item_errors
+        if any(errors):
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            previous = {pk: self.bulk_snapshot(obj) for pk, obj in existing.items()}
+            created = self.bulk_create_rows([validated[index] for index in creates])
+            updated = self.bulk_update_rows([(existing[items[index]['id']], validated[index]) for index in updates])
+            self.after_bulk_write(created, updated, previous)
+            read_cache.invalidate(model, [obj.pk for obj in created + updated])
+        return Response({'created': [obj.pk for obj in created], 'updated': [obj.pk for obj in updated]},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    def preload_related(self, items):
+        serializer = self.get_serializer_class()()
+        preloaded = {}
+        for name, field in serializer.fields.items():
+            relation = getattr(field, 'child_relation', field)
+            if field.read_only or not isinstance(relation, PreloadedPrimaryKeyRelatedField):
+                continue
+            ids = set()
+            for item in items:
+                value = item.get(name) if isinstance(item, dict) else None
+                for pk in value if isinstance(value, list) else [value]:
+                    if isinstance(pk, int) and not isinstance(pk, bool):
+                        ids.add(pk)
+                    elif isinstance(pk, str) and pk.isdigit():
+                        ids.add(int(pk))
+            model = relation.get_queryset().model
+            preloaded.setdefault(model, {}).update(relation.get_queryset().in_bulk(ids))
+        return preloaded
+
+    def _split_many_to_many(self, data):
+        names = {field.name for field in self.queryset.model._meta.many_to_many}
+        return ({name: value for name, value in data.items() if name not in names},
+                {name: value for name, value in data.items() if name in names})
+
+    def _set_many_to_many(self, rows):
+        """Replace the many-to-many values of (obj, {field name: related objects}) rows."""
+        by_field = defaultdict(list)
+        for obj, values in rows:
+            for name, related in values.items():
+                by_field[name].append((obj, related))
+        for name, pairs in by_field.items():
+            field = self.queryset.model._meta.get_field(name)
+            through = field.remote_field.through
+            source, target = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+            through.objects.filter(**{f'{source}__in': [obj.pk for obj, _ in pairs]}).delete()
+            through.objects.bulk_create([through(**{source: obj.pk, target: item.pk})
+                                         for obj, related in pairs for item in related], batch_size=self.bulk_batch_size)
+
+    def bulk_create_rows(self, rows):
+        model = self.queryset.model
+        split = [self._split_many_to_many(data) for data in rows]
+        objs = model.objects.bulk_create([model(**fields) for fields, _ in split], batch_size=self.bulk_batch_size)
+        self._set_many_to_many([(obj, values) for obj, (_, values) in zip(objs, split) if values])
+        return objs
+
+    def bulk_update_rows(self, rows):
+        if not rows:
+            return []
+        # Fields save() would derive (auto_now timestamps, content hashes); bulk_update does not.
+        derived = [field for field in self.queryset.model._meta.concrete_fields
+                   if getattr(field, 'auto_now', False) or getattr(field, 'derived', False)]
+        changed = {field.name for field in derived}
+        many_to_many = []
+        for obj, data in rows:
+            fields, values = self._split_many_to_many(data)
+            for name, value in fields.items():
+                setattr(obj, name, value)
+            for field in derived:
+                setattr(obj, field.attname, field.pre_save(obj, False))
+            changed.update(fields)
+            if values:
+                many_to_many.append((obj, values))
+        objs = [obj for obj, _ in rows]
+        if changed:
+            self.queryset.model.objects.bulk_update(objs, sorted(changed), batch_size=self.bulk_batch_size)
+        self._set_many_to_many(many_to_many)
+        return objs
+
+    def bulk_snapshot(self, obj):
+        return None
+
+    def after_bulk_write(self, created, updated, previous):
+        pass
+
+class ExportMixin:
+    """`GET <list>/export/?export_format=csv|jsonl|xlsx` streams every matching row as a file.
+
+    Filters: `language_model` and `test` ids, and `from`/`to` dates or
+    datetimes on `export_date_field` (a `to` date includes that whole day).
+    """
+
+    export_columns = ()
+    export_date_field = None
+    # Lookup path from the exported model to `test` and `language_model`.
+    export_relation_prefix = ''
+
+    def _parse_bound(self, name, value):
+        """Return the filter lookup and moment for a `from` or `to` parameter."""
+        day = parse_date(value)
+        if day is not None:
+            if name == 'to':
+                return 'lt', timezone.make_aware(datetime.combine(day + timedelta(days=1), time()))
+            return 'gte', timezone.make_aware(datetime.combine(day, time()))
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(value)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return ('lte' if name == 'to' else 'gte'), moment
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in exports.FORMATS:
+            return Response({'error': f"export_format must be one of {', '.join(exports.FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        filters = {}
+        for name in ('language_model', 'test'):
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            if not value.isdigit():
+                return Response({'error': f'{name} must be an id'}, status=status.HTTP_400_BAD_REQUEST)
+            filters[f'{self.export_relation_prefix}{name}_id'] = int(value)
+        for name in ('from', 'to'):
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            try:
+                lookup, moment = self._parse_bound(name, value)
+            except ValueError:
+                return Response({'error': f'{name} must be an ISO date or datetime'}, status=status.HTTP_400_BAD_REQUEST)
+            filters[f'{self.export_date_field}__{lookup}'] = moment
+
+        queryset = self.queryset.model.objects.filter(**filters)
+        content, content_type, extension = exports.export(queryset, self.export_columns, export_format)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        filename = f"{self.queryset.model._meta.verbose_name_plural.replace(' ', '-')}.{extension}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class ConditionalGetMixin:
+    """ETag and Last-Modified validators derived from `updated_at`.
+
+    A detail GET reads only the row's `updated_at`, a list GET only the count
+    and latest `updated_at` of the filtered rows, before deciding; a matching
+    If-None-Match or If-Modified-Since gets a 304 without serializing
+    anything. Query parameters and the response format are part of the ETag.
+
+    Lists also take `?ids=1,2,3` and `?updated_since=<datetime>` so clients
+    can fetch exactly the rows they are missing.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        ids = self.request.query_params.get('ids')
+        if ids:
+            try:
+                queryset = queryset.filter(pk__in=[int(pk) for pk in ids.split(',') if pk.strip()])
+            except ValueError:
+                raise ValidationError({'ids': 'Expected a comma-separated list of ids.'})
+        updated_since = self.request.query_params.get('updated_since')
+        if updated_since:
+            try:
+                moment = parse_datetime(updated_since)
+            except ValueError:
+                moment = None
+            if moment is None:
+                raise ValidationError({'updated_since': 'Expected an ISO 8601 datetime.'})
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            queryset = queryset.filter(updated_at__gt=moment)
+        return queryset
+
+    def _etag(self, *parts):
+        variant = (self.request.accepted_renderer.format, sorted(self.request.query_params.lists()))
+        key = repr((self.queryset.model.__name__,) + parts + variant)
+        return '"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def _conditional(self, etag, last_modified, render):
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(self.request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        updated_at = self.filter_queryset(self.get_queryset()).filter(**lookup).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            raise Http404
+        etag = self._etag(lookup[self.lookup_field], updated_at.isoformat())
+        return self._conditional(etag, updated_at, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+    def list(self, request, *args, **kwargs):
+        state = self.filter_queryset(self.get_queryset()).aggregate(count=Count('pk'), latest=Max('updated_at'))
+        etag = self._etag(state['count'], state['latest'].isoformat() if state['latest'] else None)
+        return self._conditional(etag, state['latest'], lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+class CachedReadMixin:
+    """Serve list and detail GETs from the read cache (api.read_cache).
+
+    The serialized data is cached per query string and response format,
+    together with the ETag and Last-Modified of ConditionalGetMixin, so a hit
+    costs no query at all and can still answer 304.
+    """
+
+    def _cached(self, request, pk, render):
+        model = self.queryset.model
+        variant = (self.action, request.accepted_renderer.format, sorted(request.query_params.lists()))
+        key = read_cache.key(model, variant, pk)
+        entry = read_cache.get(model, key)
+        if entry is None:
+            response = render()
+            if response.status_code == 200:
+                read_cache.set(key, (response.data, {name: response[name] for name in ('ETag', 'Last-Modified') if name in response}))
+            return response
+        data, headers = entry
+        if 'ETag' in headers:
+            last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+            not_modified = get_conditional_response(request._request, etag=headers['ETag'], last_modified=last_modified)
+            if not_modified is not None:
+                for name, value in headers.items():
+                    not_modified[name] = value
+                return not_modified
+        return Response(data, headers=headers)
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(request, None, lambda: super(CachedReadMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        # Invalidation names objects by their integer pk; '05' must share the key of '5'.
+        pk = str(int(pk)) if str(pk).isdigit() else pk
+        return self._cached(request, pk, lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs))
+
+class SearchMixin:
+    """`?q=` on the list endpoint runs a ranked full-text search instead.
+
+    Results carry a highlighted snippet and are limited by `?limit=` (at most
+    `max_search_limit`) rather than paginated.
+    """
+
+    search_kind = None
+    search_fields = ('id',)
+    default_search_limit = 20
+    max_search_limit = 100
+
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(request.query_params.get('limit', self.default_search_limit))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, self.max_search_limit))
+        hits = search.search(self.search_kind, query, limit)
+        objects = self.queryset.model.objects.only(*self.search_fields).in_bulk([object_id for object_id, _, _ in hits])
+        results = []
+        for object_id, snippet, rank in hits:
+            obj = objects.get(object_id)
+            if obj is None:
+                continue
+            result = {field: getattr(obj, field) for field in self.search_fields}
+            result.update(snippet=snippet, rank=rank)
+            results.append(result)
+        return Response({'results': results})
+
+class SourceViewSet(BulkMixin, CachedReadMixin, ConditionalGetMixin, SearchMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = Source.objects.all()
     serializer_class = SourceSerializer
+    heavy_fields = ('content',)
+    search_kind = 'source'
+    search_fields = ('id', 'name')
 
-class TestViewSet(viewsets.ModelViewSet):
-    queryset = Test.objects.all()
+    def after_bulk_write(self, created, updated, previous):
+        search.index_objects('source', created + updated)
+        retrieval.index_objects('source', created + updated)
+
+class TestViewSet(BulkMixin, CachedReadMixin, ConditionalGetMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    queryset = Test.objects.prefetch_related('sources')
     serializer_class = TestSerializer
 
-class IntroductionViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'])
+    def run_all_models(self, request, pk=None):
+        test = self.get_object()
+        serializer = RunAllModelsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        language_models = serializer.validated_data.get('language_models')
+        if language_models is None:
+            language_models = LanguageModel.objects.all()
+        language_models = sorted(set(language_models), key=lambda language_model: language_model.pk)
+        if not language_models:
+            return Response({"error": "No language models to run"}, status=status.HTTP_400_BAD_REQUEST)
+        introductions = sorted(set(serializer.validated_data.get('introductions', [])), key=lambda introduction: introduction.pk)
+
+        with transaction.atomic():
+            batch = TestRunBatch.objects.create(test=test)
+            test_runs = TestRun.objects.bulk_create([
+                TestRun(test=test, language_model=language_model, batch=batch)
+                for language_model in language_models
+            ])
+            TestRun.introductions.through.objects.bulk_create([
+                TestRun.introductions.through(testrun=test_run, introduction=introduction)
+                for test_run in test_runs
+                for introduction in introductions
+            ])
+            try:
+                rows = estimates.estimate_runs([test], language_models, [introductions])
+                ledger.reserve_for_runs(test_runs, [row['cost'] for row in rows])
+            except ledger.BudgetExceeded as exc:
+                transaction.set_rollback(True)
+                return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            for test_run in test_runs:
+                runner.enqueue(test_run)
+
+        serializer = TestRunBatchSerializer(batch, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'])
+    def related(self, request):
+        """The `k` introductions (or sources) most similar to each of `tests`, best first."""
+        serializer = RelatedDocumentsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tests = serializer.validated_data['tests']
+        matches = retrieval.related(tests, serializer.validated_data['kind'], serializer.validated_data['k'])
+        return Response({'results': [
+            {'test': test.pk, 'matches': [{'id': pk, 'score': round(score, 6)} for pk, score in matches[test.pk]]}
+            for test in tests
+        ]})
+
+class IntroductionViewSet(ConditionalGetMixin, SearchMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = Introduction.objects.all()
     serializer_class = IntroductionSerializer
+    heavy_fields = ('content',)
+    search_kind = 'introduction'
 
-class LanguageModelViewSet(viewsets.ModelViewSet):
+class LanguageModelViewSet(CachedReadMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = LanguageModel.objects.all()
     serializer_class = LanguageModelSerializer
+    heavy_fields = ('prompt_template',)
+
+    @action(detail=True, methods=['get'])
+    def circuit(self, request, pk=None):
+        """State and call counters of the model's circuit breaker."""
+        return Response(CircuitBreakerSerializer(resilience.get_breaker(self.get_object())).data)
+
+    @action(detail=True, methods=['post'], url_path='circuit/reset')
+    def reset_circuit(self, request, pk=None):
+        """Close the model's circuit, e.g. once its provider is known to be back; counters are kept."""
+        breaker = resilience.get_breaker(self.get_object())
+        CircuitBreaker.objects.filter(pk=breaker.pk).update(state='closed', consecutive_failures=0, opened_at=None)
+        breaker.refresh_from_db()
+        return Response(CircuitBreakerSerializer(breaker).data)
 
-class TestRunViewSet(viewsets.ModelViewSet):
-    queryset = TestRun.objects.all()
+class TestRunViewSet(ExportMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    queryset = TestRun.objects.select_related('test', 'language_model').prefetch_related('introductions')
     serializer_class = TestRunSerializer
+    heavy_fields = ('result',)
+    export_columns = exports.RUN_COLUMNS
+    export_date_field = 'completed_at'
 
     @action(detail=True, methods=['post'])
     def run_test(self, request, pk=None):
         test_run = self.get_object()
-        today = timezone.now().date()
-        budget = Budget.objects.filter(date=today).first()
+        if test_run.status != 'pending':
+            return Response({"error": f"Test run is already {test_run.status}"}, status=status.HTTP_409_CONFLICT)
 
-        if not budget or budget.current_usage >= budget.daily_limit:
-            return Response({"error": "Daily budget exceeded"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ledger.reserve_for_runs([test_run], [estimates.estimate_cost(test_run.test, test_run.language_model, get_introductions(test_run))])
+        except ledger.BudgetExceeded as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except ledger.AlreadyReserved as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
 
-        # כאן תיישם את הלוגיקה להרצת המבחן
-        # זהו מקום להחלפה עם הלוגיקה האמיתית של הרצת המבחן
-        test_run.status = 'in_progress'
-        test_run.save()
+        runner.enqueue(test_run)
 
-        # עדכן חלק זה עם הלוגיקה האמיתית של הרצת המבחן
-        # לעת עתה, נסמן אותו פשוט כהושלם
-        test_run.status = 'completed'
-        test_run.completed_at = timezone.now()
-        test_run.save()
+        serializer = self.get_serializer(test_run)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
-        return Response({"status": "Test run started"}, status=status.HTTP_200_OK)
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """Continue a failed run from its first unanswered question, reserving budget for the rest,
+        or queue a paused run now instead of at its resume_at."""
+        test_run = self.get_object()
+        if test_run.status == 'paused' and runner.wake(test_run):
+            return Response(self.get_serializer(test_run).data, status=status.HTTP_202_ACCEPTED)
+        if test_run.status != 'failed':
+            return Response({"error": f"Only failed or paused test runs can be resumed; this one is {test_run.status}"},
+                            status=status.HTTP_409_CONFLICT)
+        questions = len(get_questions(test_run.test))
+        estimate = estimates.estimate_cost(test_run.test, test_run.language_model, get_introductions(test_run))
+        try:
+            runner.resume(test_run, estimate * runner.remaining_questions(test_run) / questions)
+        except ledger.BudgetExceeded as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except ledger.AlreadyReserved as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(test_run).data, status=status.HTTP_202_ACCEPTED)
 
-class EvaluationViewSet(viewsets.ModelViewSet):
-    queryset = Evaluation.objects.all()
+    @action(detail=True, methods=['get'])
+    def questions(self, request, pk=None):
+        """The run's per-question results, in question order."""
+        test_run = self.get_object()
+        rows = test_run.question_results.with_text().order_by('index')
+        return Response(QuestionResultSerializer(rows, many=True).data)
+
+    @action(detail=False, methods=['post'])
+    def estimate(self, request):
+        serializer = RunEstimateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rows = estimates.estimate_runs(
+            serializer.validated_data['tests'],
+            serializer.validated_data['language_models'],
+            serializer.validated_data['introductions'],
+            serializer.validated_data.get('max_output_tokens'),
+        )
+        total = estimates.summarize(rows)
+        for row in rows + [total]:
+            row['cost'] = str(row['cost'])
+        return Response({"runs": rows, "total": total})
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        return Response(response_cache.stats())
+
+class TestRunBatchViewSet(FieldSelectionMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = TestRunBatch.objects.annotate(**BATCH_PROGRESS_ANNOTATIONS)
+    serializer_class = TestRunBatchSerializer
+
+class EvaluationViewSet(BulkMixin, ExportMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    # Nested test runs never show their result, so it is not read (or decompressed).
+    queryset = Evaluation.objects.select_related('test_run__test', 'test_run__language_model').defer('test_run__result')
     serializer_class = EvaluationSerializer
+    export_columns = exports.EVALUATION_COLUMNS
+    export_date_field = 'created_at'
+    export_relation_prefix = 'test_run__'
+
+    @action(detail=False, methods=['post'])
+    def grade(self, request):
+        """Grade completed runs of closed tests against their answer keys: the given
+        `test_runs`, or every run without an automatic evaluation yet."""
+        serializer = GradeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        graded = grading.grade_runs(serializer.validated_data.get('test_runs'))
+        return Response({'graded': graded})
+
+    def bulk_snapshot(self, evaluation):
+        return evaluation.test_run_id
+
+    def after_bulk_write(self, created, updated, previous):
+        # New scores are added per (language model, test) group; groups touched
+        # by updates are recomputed, as a changed score may have been a bound.
+        scores = defaultdict(list)
+        for evaluation in created:
+            scores[(evaluation.test_run.language_model_id, evaluation.test_run.test_id)].append(evaluation.score)
+        for group, group_scores in scores.items():
+            analytics.add_scores(*group, group_scores)
+        if updated:
+            run_ids = {evaluation.test_run_id for evaluation in updated} | {previous[evaluation.pk] for evaluation in updated}
+            analytics.recompute_scores(TestRun.objects.filter(pk__in=run_ids).values_list('language_model_id', 'test_id'))
 
-class BudgetViewSet(viewsets.ModelViewSet):
+class TiebreakOrderingFilter(OrderingFilter):
+    """OrderingFilter that sorts rows with equal values by id."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or [])
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('id')
+        return ordering
+
+class AnswerMetricsViewSet(FieldSelectionMixin, viewsets.ReadOnlyModelViewSet):
+    """Similarity of open answers to reference answers, for triage: filter by
+    `?test=` and `?language_model=`, sort by `?ordering=chrf` (or `rouge_l`,
+    `token_f1`, descending with a leading `-`)."""
+    queryset = AnswerMetrics.objects.select_related('test_run').defer('test_run__result')
+    serializer_class = AnswerMetricsSerializer
+    heavy_fields = ('questions',)
+    # Scores tie often (many answers score 0), so pages are offsets into an
+    # ordering made total by the id.
+    pagination_class = OffsetPagination
+    filter_backends = [TiebreakOrderingFilter]
+    ordering_fields = ['id', 'chrf', 'rouge_l', 'token_f1']
+    ordering = ['-id']
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        for name in ('test', 'language_model'):
+            value = self.request.query_params.get(name)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({name: 'Expected an id.'})
+                queryset = queryset.filter(**{f'test_run__{name}_id': value})
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def compute(self, request):
+        """Measure completed runs of open tests against their reference answers: the
+        given `test_runs`, or every run without metrics yet."""
+        serializer = GradeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        measured = grading.measure_runs(serializer.validated_data.get('test_runs'))
+        return Response({'measured': measured})
+
+class BudgetViewSet(FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = Budget.objects.all()
     serializer_class = BudgetSerializer
 
+    def perform_update(self, serializer):
+        # Only the fields sent, so that ledger updates landing meanwhile are kept;
+        # the post_save signal invalidates the read cache.
+        budget = serializer.instance
+        for name, value in serializer.validated_data.items():
+            setattr(budget, name, value)
+        budget.save(update_fields=list(serializer.validated_data))
+        budget.refresh_from_db()
+
     @action(detail=False, methods=['get'])
     def today(self, request):
         today = timezone.now().date()
-        budget = Budget.objects.filter(date=today).first()
-        if not budget:
-            budget = Budget.objects.create(date=today, daily_limit=0, current_usage=0)
-        serializer = self.get_serializer(budget)
-        return Response(serializer.data)
+        # Polled by clients throughout a run; ledger writes invalidate it.
+        variant = ('today', today.isoformat(), request.accepted_renderer.format, sorted(request.query_params.lists()))
+        key = read_cache.key(Budget, variant)
+        data = read_cache.get(Budget, key)
+        if data is None:
+            budget, _ = Budget.objects.get_or_create(date=today, defaults={'daily_limit': 0})
+            data = self.get_serializer(budget).data
+            read_cache.set(key, data)
+        return Response(data)
 
     @action(detail=False, methods=['post'])
     def update_usage(self, request):
-        today = timezone.now().date()
-        budget = Budget.objects.filter(date=today).first()
-        if not budget:
-            budget = Budget.objects.create(date=today, daily_limit=0, current_usage=0)
-        
-        usage = request.data.get('usage', 0)
-        budget.current_usage += usage
-        budget.save()
-        
-        serializer = self.get_serializer(budget)
-        return Response(serializer.data)
\ No newline at end of file
+        usage = UsageSerializer(data=request.data)
+        usage.is_valid(raise_exception=True)
+        serializer = self.get_serializer(ledger.add_usage(usage.validated_data['usage']))
+        return Response(serializer.data)
+
+class CacheViewSet(viewsets.ViewSet):
+    @action(detail=False)
+    def stats(self, request):
+        """Hit and miss counts of the API read cache and of the completion cache."""
+        return Response({'read_cache': read_cache.stats(), 'response_cache': response_cache.stats()})
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    @action(detail=False)
+    def leaderboard(self, request):
+        """Language models ranked by mean score, overall or on one `?test=`."""
+        test_id = request.query_params.get('test')
+        if test_id:
+            if not test_id.isdigit():
+                return Response({'error': 'test must be an id'}, status=status.HTTP_400_BAD_REQUEST)
+            stats = ModelTestStats.objects.filter(test_id=test_id).select_related('language_model')
+            serializer_class = ModelTestStatsSerializer
+        else:
+            stats = ModelStats.objects.select_related('language_model')
+            serializer_class = ModelStatsSerializer
+        ranked = sorted(stats, key=lambda row: (row.mean_score is None, -(row.mean_score or 0), row.language_model_id))
+        return Response({'results': serializer_class(ranked, many=True).data})
+
+def _encode_sse(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+def _encode_ndjson(event):
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def _status_event(test_run, event='status'):
+    return {
+        'event': event,
+        'status': test_run.status,
+        'started_at': test_run.started_at.isoformat() if test_run.started_at else None,
+        'completed_at': test_run.completed_at.isoformat() if test_run.completed_at else None,
+        'cost': str(test_run.cost) if test_run.cost is not None else None,
+        'cache_hits': test_run.cache_hits,
+    }
+
+def _answered_rows(test_run_id):
+    return QuestionResult.objects.filter(test_run_id=test_run_id, error__isnull=True)
+
+async def _database_events(test_run, questions, last_index, run_status):
+    """Events of the progress a run's rows show past question `last_index` and its status beyond `run_status`.
+
+    Two lookups on indexes, which find nothing while the run is idle: the run
+    by its key, and its answered rows past `last_index`.
+    """
+    # The status first: a finished run flushed its rows before saving it.
+    current = await TestRun.objects.aget(pk=test_run.pk)
+    found = []
+    async for row in _answered_rows(test_run.pk).with_text().filter(index__gt=last_index).order_by('index'):
+        found.append({
+            'event': 'question',
+            'index': row.index,
+            'question': questions[row.index] if row.index < len(questions) else None,
+            'answer': row.answer,
+            'input_tokens': row.input_tokens,
+            'output_tokens': row.output_tokens,
+            'cached': row.cached,
+        })
+    if found:
+        cost = (await QuestionResult.objects.filter(test_run_id=test_run.pk).aaggregate(total=Sum('cost')))['total']
+        for event in found:
+            event['cost'] = str(cost)
+    if current.status != run_status:
+        found.append(_status_event(current))
+    return found
+
+async def _test_run_event_stream(subscription, test_run, encode, heartbeat):
+    try:
+        last_index = (await _answered_rows(test_run.pk).aaggregate(last=Max('index')))['last']
+        last_index = -1 if last_index is None else last_index
+        yield encode(_status_event(test_run, event='snapshot'))
+        if test_run.status in events.TERMINAL_STATUSES:
+            return
+        questions = get_questions(test_run.test)
+        run_status = test_run.status
+        sent = set()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.RUN_EVENTS_MAX_SECONDS
+        last_sent = last_poll = loop.time()
+        local_until = 0
+        while loop.time() < deadline:
+            # Runs executed by another process publish nowhere we can see, so their
+            # progress is read from the database; a run publishing here only needs
+            # an occasional check.
+            poll_every = settings.RUN_EVENTS_HEARTBEAT if loop.time() < local_until else settings.RUN_EVENTS_POLL_SECONDS
+            wake_at = min(last_poll + poll_every, last_sent + settings.RUN_EVENTS_HEARTBEAT)
+            try:
+                received = [await subscription.get(timeout=max(wake_at - loop.time(), 0))]
+                local_until = loop.time() + settings.RUN_EVENTS_HEARTBEAT
+            except asyncio.TimeoutError:
+                received = []
+                if loop.time() >= last_poll + poll_every:
+                    received = await _database_events(test_run, questions, last_index, run_status)
+                    last_poll = loop.time()
+            for event in received:
+                if event['event'] == 'question':
+                    if event['index'] in sent:
+                        # Seen in the database before its event came, or the other way round.
+                        continue
+                    sent.add(event['index'])
+                    last_index = max(last_index, event['index'])
+                elif event['event'] == 'status':
+                    run_status = event['status']
+                yield encode(event)
+                last_sent = loop.time()
+                if events.is_terminal(event):
+                    return
+            if loop.time() - last_sent >= settings.RUN_EVENTS_HEARTBEAT:
+                yield heartbeat
+                last_sent = loop.time()
+    finally:
+        events.unsubscribe(subscription)
+
+async def test_run_events(request, pk):
+    """Stream progress of a test run as Server-Sent Events, or NDJSON when the client accepts it.
+
+    Served as an async view so that, under ASGI, idle watchers do not hold a worker thread.
+    """
+    subscription = events.subscribe(pk)
+    try:
+        test_run = await TestRun.objects.select_related('test').aget(pk=pk)
+    except TestRun.DoesNotExist:
+        events.unsubscribe(subscription)
+        raise Http404("No TestRun matches the given query.")
+
+    if 'application/x-ndjson' in request.headers.get('Accept', ''):
+        stream = _test_run_event_stream(subscription, test_run, _encode_ndjson, _encode_ndjson({'event': 'heartbeat'}))
+        response = StreamingHttpResponse(stream, content_type='application/x-ndjson')
+    else:
+        stream = _test_run_event_stream(subscription, test_run, _encode_sse, ": heartbeat\n\n")
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
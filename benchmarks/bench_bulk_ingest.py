@@ -0,0 +1,50 @@
+"""Source ingestion rate: one POST per row versus POST /api/sources/bulk/.
+
+Runs against a throwaway test database through the Django test client, so
+the numbers include routing, validation, serialization and SQLite writes
+but no network.
+
+    python benchmarks/bench_bulk_ingest.py [ROWS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from rest_framework.test import APIClient
+
+def items(rows, prefix):
+    return [{'name': f"{prefix} {i}", 'content': "וַיְדַבֵּר יְהוָה אֶל־מֹשֶׁה לֵּאמֹר " * 20} for i in range(rows)]
+
+def main(rows):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        client = APIClient()
+        single_rows = min(rows, 1000)
+        started = time.perf_counter()
+        for item in items(single_rows, "single"):
+            client.post('/api/sources/', item, format='json')
+        single = single_rows / (time.perf_counter() - started)
+
+        payload = items(rows, "bulk")
+        started = time.perf_counter()
+        response = client.post('/api/sources/bulk/', payload, format='json')
+        bulk = rows / (time.perf_counter() - started)
+        assert response.status_code == 201, response.data
+
+        print(f"one POST per row: {single:8.0f} rows/s ({single_rows} rows)")
+        print(f"bulk endpoint:    {bulk:8.0f} rows/s ({rows} rows)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
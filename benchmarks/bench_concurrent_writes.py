@@ -0,0 +1,62 @@
+"""Throughput of concurrent writer threads under the configured database profile.
+
+Each writer runs transactions that read and then insert, the pattern that
+fails with "database is locked" under SQLite's default deferred transactions.
+Compare profiles through the environment, e.g.
+
+    python benchmarks/bench_concurrent_writes.py [WRITERS] [TRANSACTIONS]
+    SQLITE_JOURNAL_MODE=DELETE SQLITE_SYNCHRONOUS=FULL SQLITE_TRANSACTION_MODE=DEFERRED \\
+        python benchmarks/bench_concurrent_writes.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from django.db import OperationalError, connection, transaction
+from django.test.utils import setup_test_environment
+from api.models import Source
+
+def writer(number, transactions, errors):
+    try:
+        for index in range(transactions):
+            try:
+                with transaction.atomic():
+                    Source.objects.filter(name__startswith=f"writer {number} ").count()
+                    Source.objects.create(name=f"writer {number} {index}", content="בראשית ברא אלהים")
+            except OperationalError:
+                errors.append(1)
+    finally:
+        connection.close()
+
+def main(writers, transactions):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        options = connection.settings_dict.get('OPTIONS', {})
+        print(f"{connection.vendor}: {options.get('init_command', '')} "
+              f"transaction_mode={options.get('transaction_mode')}")
+        errors = []
+        threads = [threading.Thread(target=writer, args=(number, transactions, errors)) for number in range(writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        committed = Source.objects.count()
+        print(f"{writers} writers x {transactions} transactions: {committed / elapsed:8.0f} commits/s, "
+              f"{len(errors)} lock errors")
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16, int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,62 @@
+"""Memory and throughput of streaming evaluation exports.
+
+Fills a throwaway test database with ROWS evaluations, then consumes
+GET /api/evaluations/export/ in every format through the test client while
+tracemalloc records the peak Python allocation. The peak should not depend
+on ROWS.
+
+    python benchmarks/bench_export.py [ROWS]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from decimal import Decimal
+from django.db import connection
+from django.test.utils import setup_test_environment
+from rest_framework.test import APIClient
+from api.models import Evaluation, LanguageModel, Test, TestRun
+
+def populate(rows):
+    language_model = LanguageModel.objects.create(
+        name="Fake", api_key="key", prompt_template="", library="fake", tokenizer_type="gpt2",
+        input_cost_per_1k_tokens=Decimal('0.01'), output_cost_per_1k_tokens=Decimal('0.02'))
+    test = Test.objects.create(name="בראשית", description="שאלות")
+    run = TestRun.objects.create(test=test, language_model=language_model, status='completed')
+    batch = []
+    for i in range(rows):
+        batch.append(Evaluation(test_run=run, score=i % 10, comments="תשובה נכונה חלקית"))
+        if len(batch) == 10_000:
+            Evaluation.objects.bulk_create(batch)
+            batch = []
+    Evaluation.objects.bulk_create(batch)
+
+def main(rows):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        populate(rows)
+        client = APIClient()
+        for export_format in ('csv', 'jsonl', 'xlsx'):
+            tracemalloc.start()
+            started = time.perf_counter()
+            response = client.get('/api/evaluations/export/', {'export_format': export_format})
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{export_format:>5}: {rows} rows, {size / 1e6:7.1f} MB in {elapsed:5.1f}s, "
+                  f"{rows / elapsed:8.0f} rows/s, peak {peak / 1e6:5.1f} MB")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
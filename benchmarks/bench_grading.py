@@ -0,0 +1,80 @@
+"""Throughput of automatic grading of closed tests.
+
+Builds a throwaway test database with RUNS completed runs of ten-question
+multiple-choice and short-answer tests (100k answers by default), with
+answers in the varied forms models give (pointed, punctuated, in a
+sentence), and times one `grading.grade_runs()` call over all of them:
+reading and parsing results, normalizing and matching answers, and inserting
+the evaluations and rollups.
+
+    python benchmarks/bench_grading.py [RUNS]
+"""
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from api import grading
+from api.models import Test, LanguageModel, TestRun, Evaluation
+
+QUESTIONS = 10
+LABELS = "אבגד"
+WORDS = ["בְּרֵאשִׁית", "שְׁמוֹת", "וַיִּקְרָא", "בְּמִדְבַּר", "דְּבָרִים", "מֹשֶׁה", "אַהֲרֹן", "מִרְיָם"]
+
+def main(runs):
+    rng = random.Random(0)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        language_models = [LanguageModel.objects.create(
+            name=f"Model {i}", api_key="key", prompt_template="{question}", library="fake", tokenizer_type="fallback",
+            input_cost_per_1k_tokens=Decimal("0.01"), output_cost_per_1k_tokens=Decimal("0.02")) for i in range(5)]
+        tests = []
+        for i in range(20):
+            multiple_choice = i % 2 == 0
+            tests.append(Test.objects.create(
+                name=f"מבחן {i}", description="ענה", test_type='multiple_choice' if multiple_choice else 'short_answer',
+                questions=[{"question": f"שאלה {q}", "answer": rng.choice(LABELS) if multiple_choice else rng.choice(WORDS)}
+                           for q in range(QUESTIONS)]))
+
+        def answer(test, index):
+            if test.test_type == 'multiple_choice':
+                return rng.choice([f"התשובה היא {rng.choice(LABELS)}.", f"({rng.choice(LABELS)})", rng.choice(LABELS)])
+            word = rng.choice(WORDS)
+            return rng.choice([word, f"{word}.", f"{word} "])
+
+        for start in range(0, runs, 5000):
+            batch = []
+            for _ in range(min(5000, runs - start)):
+                test = rng.choice(tests)
+                result = [{'index': index, 'question': f"שאלה {index}", 'answer': answer(test, index)} for index in range(QUESTIONS)]
+                batch.append(TestRun(test=test, language_model=rng.choice(language_models), status='completed',
+                                     result=json.dumps(result, ensure_ascii=False)))
+            TestRun.objects.bulk_create(batch)
+
+        started = time.perf_counter()
+        graded = grading.grade_runs()
+        elapsed = time.perf_counter() - started
+        print(f"graded {graded} runs ({graded * QUESTIONS} answers) in {elapsed:.2f}s, "
+              f"{graded * QUESTIONS / elapsed:,.0f} answers/s")
+        run_ids = list(TestRun.objects.values_list('pk', flat=True)[:grading.BATCH_SIZE])
+        scored = list(TestRun.objects.with_text().select_related('test').filter(pk__in=run_ids))
+        started = time.perf_counter()
+        grading.score_runs(scored)
+        elapsed = time.perf_counter() - started
+        print(f"matching alone: {len(scored) * QUESTIONS / elapsed:,.0f} answers/s")
+        print(f"mean score {sum(Evaluation.objects.values_list('score', flat=True)) / graded:.3f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,57 @@
+"""Per-prompt render cost of compiled prompt templates.
+
+Renders one prompt per question for tests whose sources grow from 10 KB to
+1 MB. CompiledTemplate parses the template once and pre-joins everything but
+the question, so each prompt costs one join; the baseline re-parses the
+template through str.format for every prompt. Prompts are consumed one at a
+time, as the runner does.
+
+    python benchmarks/bench_prompt_render.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from api.prompts import compile_template
+
+TEMPLATE = "מבחן: {test_name}\n{test_description}\n\nמקורות:\n{sources}\n\nהקדמות:\n{introductions}\n\nשאלה: {question}\nתשובה:"
+QUESTIONS = 1000
+
+def bench(source_bytes):
+    source = ("בראשית ברא אלהים את השמים ואת הארץ. " * (source_bytes // 60 + 1))[:source_bytes // 2]
+    context = {
+        'test_name': "מבחן בראשית",
+        'test_description': "שאלות על פרק א",
+        'introductions': "הקדמה " * 200,
+        'sources': source,
+    }
+    questions = [f"שאלה מספר {i}?" for i in range(QUESTIONS)]
+
+    started = time.perf_counter()
+    for prompt in compile_template(TEMPLATE).iter_render(context, questions):
+        pass
+    compiled_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for question in questions:
+        prompt = TEMPLATE.format(question=question, **context)
+    format_time = time.perf_counter() - started
+
+    return compiled_time / QUESTIONS * 1e6, format_time / QUESTIONS * 1e6
+
+def main():
+    print(f"{QUESTIONS} prompts per test")
+    print(f"{'sources':>10} {'compiled us/prompt':>20} {'str.format us/prompt':>22}")
+    for source_bytes in (10_000, 100_000, 1_000_000):
+        compiled_us, format_us = bench(source_bytes)
+        print(f"{source_bytes // 1000:>8}KB {compiled_us:>20.1f} {format_us:>22.1f}")
+
+if __name__ == '__main__':
+    main()
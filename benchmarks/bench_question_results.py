@@ -0,0 +1,48 @@
+"""Overhead of writing per-question results while a run executes.
+
+Builds a throwaway test database with one QUESTIONS-question test and times
+`runner.execute_test_run` with the offline fake provider (no latency, no
+completion cache) for several RUN_RESULT_BATCH_SIZE values, so the time is
+almost all prompt rendering and result writing.
+
+    python benchmarks/bench_question_results.py [QUESTIONS]
+"""
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.test.utils import override_settings
+from api import runner
+from api.models import Test, LanguageModel, TestRun
+
+BATCH_SIZES = (1, 20, 100)
+
+def main(questions):
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        language_model = LanguageModel.objects.create(
+            name="Model", api_key="key", prompt_template="{question}", library="fake", tokenizer_type="fallback",
+            input_cost_per_1k_tokens=Decimal("0.01"), output_cost_per_1k_tokens=Decimal("0.02"))
+        test = Test.objects.create(name="מבחן", description="ענה", questions=[f"שאלה מספר {i}" for i in range(questions)])
+        for batch_size in BATCH_SIZES:
+            test_run = TestRun.objects.create(test=test, language_model=language_model, use_cache=False)
+            with override_settings(RUN_RESULT_BATCH_SIZE=batch_size, FAKE_PROVIDER_LATENCY=0):
+                started = time.perf_counter()
+                runner.execute_test_run(test_run.pk)
+                elapsed = time.perf_counter() - started
+            print(f"batches of {batch_size:>3}: {questions} questions in {elapsed:.2f}s, "
+                  f"{elapsed / questions * 1000:.2f} ms per question")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,95 @@
+"""Shared pacing of provider calls across threads and worker processes.
+
+Builds a throwaway test database with one language model limited to RPM
+requests per minute, then has PROCESSES worker processes of 8 threads each
+call `rate_limits.acquire` in a loop for SECONDS seconds, all against the
+same bucket row (with a one-second burst). Prints the calls made against
+the ceiling, the busiest second, and how evenly the calls were spread over
+the threads.
+
+    python benchmarks/bench_rate_limit.py [PROCESSES] [RPM] [SECONDS]
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from collections import Counter
+from django.conf import settings
+from django.db import close_old_connections, connection
+from api import rate_limits
+from api.models import LanguageModel
+
+THREADS = 8
+
+BURST_SECONDS = 1
+
+def worker(database_name, language_model_id, ready, seconds, results):
+    # Spawned processes start on the main database; point them at the test one.
+    settings.DATABASES['default']['NAME'] = database_name
+    settings.RATE_LIMIT_BURST_SECONDS = BURST_SECONDS
+    language_model = LanguageModel.objects.get(pk=language_model_id)
+    calls = []
+    ready.wait()
+    deadline = time.time() + seconds
+
+    def loop():
+        made = []
+        try:
+            while time.time() < deadline:
+                rate_limits.acquire(language_model, "", 0)
+                made.append(time.time())
+        finally:
+            close_old_connections()
+        calls.append(made)
+
+    threads = [threading.Thread(target=loop) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(calls)
+
+def main(processes, rpm, seconds):
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        language_model = LanguageModel.objects.create(
+            name="Model", api_key="key", prompt_template="{question}", library="fake", tokenizer_type="fallback",
+            input_cost_per_1k_tokens=Decimal("0.01"), output_cost_per_1k_tokens=Decimal("0.02"), requests_per_minute=rpm)
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        ready = context.Barrier(processes + 1)
+        workers = [context.Process(target=worker, args=(settings.DATABASES['default']['NAME'], language_model.pk, ready, seconds, results))
+                   for _ in range(processes)]
+        for process in workers:
+            process.start()
+        ready.wait()
+        started = time.time()
+        per_thread = [made for _ in workers for made in results.get()]
+        for process in workers:
+            process.join()
+        # A thread's last call may go out after the deadline it waited past.
+        per_thread = [[moment for moment in made if moment < started + seconds] for made in per_thread]
+        calls = [moment for made in per_thread for moment in made]
+        # The bucket starts full: BURST_SECONDS worth of calls go out at once.
+        ceiling = rpm / 60 * (seconds + BURST_SECONDS)
+        busiest = max(Counter(int(moment - started) for moment in calls).values())
+        counts = sorted(len(made) for made in per_thread)
+        print(f"{processes} processes x {THREADS} threads, limit {rpm} rpm: {len(calls)} calls in {seconds}s "
+              f"({len(calls) / ceiling:.1%} of the ceiling), busiest second {busiest} (limit {rpm / 60:.0f})")
+        print(f"calls per thread: min {counts[0]}, median {counts[len(counts) // 2]}, max {counts[-1]}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    arguments = [int(argument) for argument in sys.argv[1:4]]
+    main(*(arguments + [2, 6000, 5][len(arguments):]))
@@ -0,0 +1,90 @@
+"""Provider calls against a misbehaving provider, with and without api.resilience.
+
+Builds a throwaway test database with one model of the offline 'fake'
+provider set to answer in 20 ms, fail 10% of its calls with a transient
+error and take 1 s on 5% of them. Then makes CALLS calls from 4 threads
+under three settings: one bare attempt per call; up to four attempts with
+jittered backoff; and the same with hedging after 100 ms. Prints the share
+of calls answered and their median, p95 and p99 latency.
+
+    python benchmarks/bench_resilience.py [CALLS]
+"""
+import os
+import sys
+import threading
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+import numpy as np
+from django.db import close_old_connections, connection
+from django.test import override_settings
+from api import resilience
+from api.models import LanguageModel
+from api.providers import FakeProvider
+
+THREADS = 4
+
+PROVIDER = {
+    'FAKE_PROVIDER_LATENCY': 0.02,
+    'FAKE_PROVIDER_ERROR_RATE': 0.1,
+    'FAKE_PROVIDER_SLOW_RATE': 0.05,
+    'FAKE_PROVIDER_SLOW_LATENCY': 1.0,
+}
+
+CONFIGURATIONS = [
+    ("bare", {'PROVIDER_MAX_ATTEMPTS': 1, 'PROVIDER_TIMEOUT': 0, 'PROVIDER_HEDGE_DELAY': 0}),
+    ("retries", {'PROVIDER_MAX_ATTEMPTS': 4, 'PROVIDER_TIMEOUT': 5, 'PROVIDER_HEDGE_DELAY': 0}),
+    ("retries+hedging", {'PROVIDER_MAX_ATTEMPTS': 4, 'PROVIDER_TIMEOUT': 5, 'PROVIDER_HEDGE_DELAY': 0.1}),
+]
+
+def run(language_model, calls):
+    latencies = []
+    failures = []
+    provider = FakeProvider(language_model)
+
+    def call(count):
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                try:
+                    resilience.complete(language_model, provider, "שאלה", {'max_tokens': 10})
+                except Exception as exc:
+                    failures.append(exc)
+                else:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            close_old_connections()
+
+    threads = [threading.Thread(target=call, args=(calls // THREADS,)) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), len(failures)
+
+def main(calls):
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        for name, configuration in CONFIGURATIONS:
+            with override_settings(PROVIDER_BACKOFF_BASE=0.02, PROVIDER_BREAKER_THRESHOLD=1000, **PROVIDER, **configuration):
+                language_model = LanguageModel.objects.create(
+                    name=name, api_key="key", prompt_template="{question}", library="fake", tokenizer_type="fallback",
+                    input_cost_per_1k_tokens=Decimal("0.01"), output_cost_per_1k_tokens=Decimal("0.02"))
+                latencies, failed = run(language_model, calls)
+            answered = len(latencies) / (len(latencies) + failed)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            breaker = resilience.get_breaker(language_model)
+            print(f"{name:>16}: {answered:6.1%} answered, p50 {p50:5.0f} ms, p95 {p95:5.0f} ms, p99 {p99:5.0f} ms "
+                  f"({breaker.retries} retries, {breaker.hedges} hedges)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
@@ -0,0 +1,76 @@
+"""Latency of top-k similarity queries over a large Introduction corpus.
+
+Builds a throwaway test database with DOCUMENTS introductions of 30 words
+each, drawn from a Zipf-distributed vocabulary, then times the first query
+(which builds the in-memory index from the table), batches of test-sized
+queries, and a query right after a document is saved (an incremental update).
+
+    python benchmarks/bench_retrieval.py [DOCUMENTS]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from api import retrieval
+from api.models import Introduction
+
+LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+VOCABULARY = 20_000
+BATCHES = (1, 10, 100)
+
+def median_ms(function, repeats=20):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+def main(documents):
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choices(LETTERS, k=rng.randint(3, 7))) for _ in range(VOCABULARY)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY)]
+
+    def text(words):
+        return " ".join(rng.choices(vocabulary, weights, k=words))
+
+    queries = [text(15) for _ in range(max(BATCHES))]
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        for start in range(0, documents, 5000):
+            Introduction.objects.bulk_create([Introduction(content=text(30)) for _ in range(min(5000, documents - start))])
+
+        started = time.perf_counter()
+        retrieval.top_k('introduction', queries[:1], k=10)
+        index = retrieval.get_index('introduction')
+        postings = len(index.main.docs)
+        print(f"built index of {documents} documents ({postings} postings, "
+              f"{(index.main.docs.nbytes + index.main.weights.nbytes) / 2 ** 20:.0f} MB) "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        for batch in BATCHES:
+            elapsed = median_ms(lambda: retrieval.top_k('introduction', queries[:batch], k=10))
+            print(f"{batch:>4} queries: median {elapsed:.1f} ms ({elapsed / batch:.2f} ms per query)")
+        elapsed = median_ms(lambda: index.query(queries[:1], 10))
+        print(f"   1 query without the sync check: median {elapsed:.1f} ms")
+
+        def save_and_query():
+            introduction = Introduction.objects.create(content=text(30))
+            retrieval.top_k('introduction', [introduction.content], k=10)
+
+        print(f"save + query: median {median_ms(save_and_query):.1f} ms, {len(index.delta_ids)} documents in the delta")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,66 @@
+"""Latency of ranked full-text search over a large Source corpus.
+
+Builds a throwaway test database with SOURCES sources of 300 pointed words
+each, drawn from a Zipf-distributed vocabulary, indexes them in batches and
+times `search()` (ranking and snippets included) for words of decreasing
+frequency. Latency grows with the number of matching sources, since every
+match is ranked: a word found in nearly every source is the worst case.
+
+    python benchmarks/bench_search.py [SOURCES]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from api import search
+from api.models import Source
+
+LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+NIQQUD = "\u05b0\u05b4\u05b5\u05b6\u05b7\u05b8\u05b9\u05bc"
+VOCABULARY = 20_000
+QUERY_RANKS = (10, 100, 1000, 10_000)
+
+def pointed(word, rng):
+    return "".join(letter + rng.choice(NIQQUD) for letter in word)
+
+def main(sources):
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choices(LETTERS, k=rng.randint(3, 7))) for _ in range(VOCABULARY)]
+    pointed_vocabulary = [pointed(word, rng) for word in vocabulary]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY)]
+    queries = [vocabulary[rank] for rank in QUERY_RANKS] + [f"{vocabulary[100]} {vocabulary[1000]}", "מקור 77"]
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        started = time.perf_counter()
+        batch = []
+        for i in range(sources):
+            batch.append(Source(name=f"מקור {i}", content=" ".join(rng.choices(pointed_vocabulary, weights, k=300))))
+            if len(batch) == 5000:
+                search.index_objects('source', Source.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            search.index_objects('source', Source.objects.bulk_create(batch))
+        print(f"indexed {sources} sources in {time.perf_counter() - started:.1f}s")
+
+        for query in queries:
+            timings = []
+            for _ in range(20):
+                started = time.perf_counter()
+                hits = search.search('source', query)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            print(f"{query:>12}: {len(hits)} hits, median {timings[10] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
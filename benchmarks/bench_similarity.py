@@ -0,0 +1,81 @@
+"""Throughput of the similarity metrics of open answers, per core.
+
+Scores PAIRS (answer, reference) pairs of 20-60 word Hebrew texts with
+api.similarity in-process and on process pools of 2, 4, ... up to one
+worker per core, then builds a throwaway test database of completed runs of
+ten-question open tests with reference answers and times one
+`grading.measure_runs()` call, including reading the results and storing
+the metrics.
+
+    python benchmarks/bench_similarity.py [PAIRS]
+"""
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from api import grading, similarity
+from api.models import Test, LanguageModel, TestRun
+
+QUESTIONS = 10
+LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+
+def main(pairs_count):
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choices(LETTERS, k=rng.randint(2, 7))) for _ in range(3000)]
+
+    def text(low, high):
+        return " ".join(rng.choices(vocabulary[:300] if rng.random() < 0.5 else vocabulary, k=rng.randint(low, high)))
+
+    pairs = [(text(20, 60), text(20, 40)) for _ in range(pairs_count)]
+    cores = os.cpu_count() or 1
+    started = time.perf_counter()
+    similarity.score_many(pairs)
+    single = pairs_count / (time.perf_counter() - started)
+    print(f"in-process: {single:,.0f} pairs/s")
+    workers = 2
+    while workers <= cores:
+        with similarity.pool(workers) as executor:
+            similarity.score_many(pairs[:similarity.CHUNK_SIZE * workers], executor)  # start the workers
+            started = time.perf_counter()
+            similarity.score_many(pairs, executor)
+            rate = pairs_count / (time.perf_counter() - started)
+        print(f"{workers} workers: {rate:,.0f} pairs/s, {rate / workers:,.0f} per core")
+        workers *= 2
+    if cores == 1:
+        print("one core: no pool runs")
+
+    runs = pairs_count // QUESTIONS
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        language_model = LanguageModel.objects.create(
+            name="Model", api_key="key", prompt_template="{question}", library="fake", tokenizer_type="fallback",
+            input_cost_per_1k_tokens=Decimal("0.01"), output_cost_per_1k_tokens=Decimal("0.02"))
+        tests = [Test.objects.create(name=f"מבחן {i}", description="ענה", questions=[
+            {"question": f"שאלה {q}", "answer": text(20, 40)} for q in range(QUESTIONS)]) for i in range(20)]
+        for start in range(0, runs, 5000):
+            TestRun.objects.bulk_create([
+                TestRun(test=rng.choice(tests), language_model=language_model, status='completed',
+                        result=json.dumps([{'index': index, 'answer': text(20, 60)} for index in range(QUESTIONS)],
+                                          ensure_ascii=False))
+                for _ in range(min(5000, runs - start))])
+        started = time.perf_counter()
+        measured = grading.measure_runs(workers=cores)
+        elapsed = time.perf_counter() - started
+        print(f"measured {measured} runs ({measured * QUESTIONS} answers) on {cores} cores in {elapsed:.2f}s, "
+              f"{measured * QUESTIONS / elapsed:,.0f} answers/s")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,100 @@
+"""Storage and list-query cost of compressed, deferred source text.
+
+Fills a throwaway test database with long pointed Hebrew sources and compares
+them with the same texts in a plain TEXT table: bytes stored, reading every
+row with its text (plain, and compressed plus decompression), and the default
+list query, which defers the text.
+
+    python benchmarks/bench_text_storage.py [SOURCES] [CHARS_PER_SOURCE]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
+
+import django
+
+django.setup()
+
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import setup_test_environment
+from rest_framework.test import APIClient
+from api.models import Source
+
+LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+POINTS = ["\u05b0", "\u05b4", "\u05b5", "\u05b6", "\u05b7", "\u05b8", "\u05b9", "\u05bb", "\u05bc", ""]
+
+def vocabulary(rng, size=20000):
+    # Pointed pseudo-words drawn uniformly compress somewhat worse than real text.
+    return ["".join(rng.choice(LETTERS) + rng.choice(POINTS) for _ in range(rng.randint(2, 6))) for _ in range(size)]
+
+def text(rng, words, chars):
+    chosen = []
+    size = 0
+    while size < chars:
+        word = rng.choice(words)
+        chosen.append(word)
+        size += len(word) + 1
+    return " ".join(chosen)
+
+def timed(function, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main(count, chars):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        rng = random.Random(1)
+        words = vocabulary(rng)
+        texts = [text(rng, words, chars) for _ in range(count)]
+        for start in range(0, count, 500):
+            Source.objects.bulk_create([Source(name=f"מקור {i}", content=texts[i])
+                                        for i in range(start, min(start + 500, count))])
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE bench_plain (id integer PRIMARY KEY, name text, content text)")
+            cursor.executemany("INSERT INTO bench_plain (id, name, content) VALUES (%s, %s, %s)",
+                               [(i, f"מקור {i}", content) for i, content in enumerate(texts)])
+            cursor.execute("SELECT SUM(LENGTH(CAST(content AS BLOB))) FROM bench_plain")
+            plain_bytes = cursor.fetchone()[0]
+            cursor.execute("SELECT SUM(LENGTH(content)) FROM api_source")
+            compressed_bytes = cursor.fetchone()[0]
+
+        def read_plain():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT id, name, content FROM bench_plain")
+                cursor.fetchall()
+
+        plain = timed(read_plain)
+        full = timed(lambda: list(Source.objects.with_text()))
+        deferred = timed(lambda: list(Source.objects.all()))
+        client = APIClient()
+
+        def get(params):
+            caches['default'].clear()  # measure the query and serialization, not the read cache
+            client.get('/api/sources/', params)
+
+        api_full = timed(lambda: get({'page_size': 1000, 'expand': 'content'}))
+        api_list = timed(lambda: get({'page_size': 1000}))
+
+        print(f"{count} sources of ~{chars} characters")
+        print(f"stored text:  plain {plain_bytes / 1e6:7.1f} MB   compressed {compressed_bytes / 1e6:7.1f} MB "
+              f"({plain_bytes / compressed_bytes:.1f}x smaller)")
+        print(f"all rows with text:  plain TEXT {plain * 1000:7.1f} ms   compressed {full * 1000:7.1f} ms")
+        print(f"default list query (text deferred): {deferred * 1000:7.1f} ms")
+        print(f"GET /api/sources/ 1000 rows: with content {api_full * 1000:7.1f} ms   "
+              f"default {api_list * 1000:7.1f} ms")
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
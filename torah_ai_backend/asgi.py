@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
 
 application = get_asgi_application()
+
+from api.runner import start_sweeper  # noqa: E402
+
+start_sweeper()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,12 +78,58 @@ WSGI_APPLICATION = 'torah_ai_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Chosen by DATABASE_ENGINE: 'sqlite' (default) or 'postgres'. Connections are
+# kept open for DATABASE_CONN_MAX_AGE seconds and health-checked before reuse.
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+
+if DATABASE_ENGINE == 'postgres':
+    # Requires psycopg (pip install "psycopg[binary]"). Behind a transaction-
+    # pooling PgBouncer set DATABASE_POOLER=1: server-side cursors do not
+    # survive across pooled transactions, and the pooler owns the connections.
+    DATABASE_POOLER = os.environ.get('DATABASE_POOLER', '') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'torah_ai'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DATABASE_POOLER else DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': DATABASE_POOLER,
+        }
+    }
+else:
+    # WAL lets readers run alongside the single writer; synchronous=NORMAL is
+    # durable across application crashes in WAL mode and skips most fsyncs;
+    # busy_timeout makes writers wait for the lock instead of failing; and
+    # IMMEDIATE transactions take the write lock up front (see
+    # torah_ai_backend/sqlite3/base.py).
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 20000))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'torah_ai_backend.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': (
+                    f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}; PRAGMA synchronous={SQLITE_SYNCHRONOUS}; "
+                    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}"
+                ),
+                'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            },
+            # A file-backed test database lets background run workers write concurrently;
+            # in-memory shared-cache databases fail with "table is locked" instead of waiting.
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -127,4 +174,115 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS settings (for development only, should be limited in production)
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.IdCursorPagination',
+}
+
+# Test run execution engine
+# Runs are executed on one background thread pool per LanguageModel.library, sized by
+# RUN_CONCURRENCY (falling back to RUN_DEFAULT_CONCURRENCY). RUN_EAGER executes them inline.
+RUN_EAGER = os.environ.get('RUN_EAGER', '') == '1'
+RUN_DEFAULT_CONCURRENCY = int(os.environ.get('RUN_DEFAULT_CONCURRENCY', 4))
+RUN_CONCURRENCY = {
+    'fake': 16,
+}
+
+# Upper bound on output tokens per provider call; also used to reserve budget before a run
+RUN_MAX_OUTPUT_TOKENS = int(os.environ.get('RUN_MAX_OUTPUT_TOKENS', 1024))
+
+# Provider calls are paced by LanguageModel.requests_per_minute and tokens_per_minute;
+# after an idle spell at most RATE_LIMIT_BURST_SECONDS worth of calls go out at once.
+RATE_LIMIT_BURST_SECONDS = float(os.environ.get('RATE_LIMIT_BURST_SECONDS', 10))
+
+# Provider call resilience (api.resilience): each call times out after PROVIDER_TIMEOUT
+# seconds (0: never); transient failures are retried up to PROVIDER_MAX_ATTEMPTS calls
+# in all, after jittered exponential backoff from PROVIDER_BACKOFF_BASE up to
+# PROVIDER_BACKOFF_MAX seconds. With PROVIDER_HEDGE_DELAY set, a call still unanswered
+# after that many seconds is sent a second time and the first answer wins (both are
+# billed; the loser is charged to the run at its worst-case cost).
+# PROVIDER_BREAKER_THRESHOLD consecutive failures open a model's circuit breaker: its
+# runs pause for PROVIDER_BREAKER_COOLDOWN seconds, then one probe call decides
+# whether it closes again. Calls with a timeout or hedge run on a pool of
+# PROVIDER_CALL_THREADS threads, of which one model's calls, abandoned ones included,
+# hold at most PROVIDER_MODEL_CALL_THREADS.
+PROVIDER_TIMEOUT = float(os.environ.get('PROVIDER_TIMEOUT', 120))
+PROVIDER_MAX_ATTEMPTS = int(os.environ.get('PROVIDER_MAX_ATTEMPTS', 4))
+PROVIDER_BACKOFF_BASE = float(os.environ.get('PROVIDER_BACKOFF_BASE', 0.5))
+PROVIDER_BACKOFF_MAX = float(os.environ.get('PROVIDER_BACKOFF_MAX', 30))
+PROVIDER_HEDGE_DELAY = float(os.environ.get('PROVIDER_HEDGE_DELAY', 0))
+PROVIDER_BREAKER_THRESHOLD = int(os.environ.get('PROVIDER_BREAKER_THRESHOLD', 5))
+PROVIDER_BREAKER_COOLDOWN = float(os.environ.get('PROVIDER_BREAKER_COOLDOWN', 30))
+PROVIDER_CALL_THREADS = int(os.environ.get('PROVIDER_CALL_THREADS', 64))
+PROVIDER_MODEL_CALL_THREADS = int(os.environ.get('PROVIDER_MODEL_CALL_THREADS', 16))
+
+# Per-question results are inserted in batches of RUN_RESULT_BATCH_SIZE rows, or
+# after RUN_RESULT_FLUSH_SECONDS, whichever comes first; a failed run loses at most that.
+RUN_RESULT_BATCH_SIZE = int(os.environ.get('RUN_RESULT_BATCH_SIZE', 20))
+RUN_RESULT_FLUSH_SECONDS = float(os.environ.get('RUN_RESULT_FLUSH_SECONDS', 2))
+
+# Runs paused by an open circuit breaker are queued again at their resume_at by a timer
+# in the pausing process, and by a sweep every RUN_PAUSED_SWEEP_SECONDS (0: off) in each
+# server process, which also catches runs whose process was restarted.
+RUN_PAUSED_SWEEP_SECONDS = float(os.environ.get('RUN_PAUSED_SWEEP_SECONDS', 60))
+
+# Progress streams (/api/test-runs/<id>/events/): heartbeat interval and maximum lifetime, in seconds.
+# Runs executed by another process are followed by reading their status and question rows
+# every RUN_EVENTS_POLL_SECONDS (every RUN_EVENTS_HEARTBEAT while the run publishes in
+# this process); their answers show up as the runner flushes its rows.
+RUN_EVENTS_HEARTBEAT = float(os.environ.get('RUN_EVENTS_HEARTBEAT', 15))
+RUN_EVENTS_POLL_SECONDS = float(os.environ.get('RUN_EVENTS_POLL_SECONDS', 2))
+RUN_EVENTS_MAX_SECONDS = float(os.environ.get('RUN_EVENTS_MAX_SECONDS', 3600))
+
+# Cache of provider completions keyed by model, prompt and generation parameters.
+# Entries live in a per-process LRU and in the CachedResponse table.
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 7 * 24 * 60 * 60))
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MEMORY_ENTRIES', 1024))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 100000))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+RESPONSE_CACHE_EVICT_EVERY = int(os.environ.get('RESPONSE_CACHE_EVICT_EVERY', 100))
+
+# Django's cache, used by the API read cache. The local-memory default is per
+# process; point CACHE_BACKEND/CACHE_LOCATION at a shared cache (e.g.
+# django.core.cache.backends.redis.RedisCache, redis://...) when running
+# several processes, or invalidations in one will not reach the others.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'torah-ai'),
+    }
+}
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000))}
+
+# Cached API reads (sources, tests, language models, today's budget), in seconds.
+READ_CACHE_ALIAS = os.environ.get('READ_CACHE_ALIAS', 'default')
+READ_CACHE_TIMEOUT = int(os.environ.get('READ_CACHE_TIMEOUT', 300))
+
+# Compression of Source and Introduction content and TestRun results: 'zlib',
+# or 'zstd' when the zstandard package is installed. Shorter texts stay plain.
+TEXT_COMPRESSION = os.environ.get('TEXT_COMPRESSION', 'zlib')
+TEXT_COMPRESSION_LEVEL = int(os.environ.get('TEXT_COMPRESSION_LEVEL', 3 if TEXT_COMPRESSION == 'zstd' else 6))
+TEXT_COMPRESSION_MIN_BYTES = int(os.environ.get('TEXT_COMPRESSION_MIN_BYTES', 128))
+
+# Sources are split into chunks of at most SOURCE_CHUNK_TOKENS tokens that
+# overlap by SOURCE_CHUNK_OVERLAP tokens; prompts are cut at chunk ends.
+SOURCE_CHUNK_TOKENS = int(os.environ.get('SOURCE_CHUNK_TOKENS', 512))
+SOURCE_CHUNK_OVERLAP = int(os.environ.get('SOURCE_CHUNK_OVERLAP', 64))
+
+# Similarity index of sources and introductions (api.retrieval): character
+# n-grams found in more than this share of the documents are ignored.
+RETRIEVAL_MAX_DF = float(os.environ.get('RETRIEVAL_MAX_DF', 0.05))
+
+# Processes that compute similarity metrics of open answers (api.similarity)
+# in batch jobs; 0 means one per CPU core.
+METRICS_WORKERS = int(os.environ.get('METRICS_WORKERS', 0))
+
+# Simulated latency (seconds) of the offline 'fake' provider, and the shares of its
+# calls that fail with a transient error or take FAKE_PROVIDER_SLOW_LATENCY instead
+FAKE_PROVIDER_LATENCY = float(os.environ.get('FAKE_PROVIDER_LATENCY', 0))
+FAKE_PROVIDER_ERROR_RATE = float(os.environ.get('FAKE_PROVIDER_ERROR_RATE', 0))
+FAKE_PROVIDER_SLOW_RATE = float(os.environ.get('FAKE_PROVIDER_SLOW_RATE', 0))
+FAKE_PROVIDER_SLOW_LATENCY = float(os.environ.get('FAKE_PROVIDER_SLOW_LATENCY', 5))
@@ -0,0 +1,32 @@
+from django.db.backends.sqlite3 import base
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Django's SQLite backend with the `init_command` and `transaction_mode`
+    OPTIONS that Django 5.1 added, for Django 4.2.
+
+    `init_command` is a `;`-separated list of statements run on every new
+    connection (journal mode, synchronous, busy_timeout pragmas).
+    `transaction_mode` ('DEFERRED', 'IMMEDIATE' or 'EXCLUSIVE') is used to
+    begin atomic blocks: with IMMEDIATE a transaction takes the write lock
+    when it begins, so it waits for busy_timeout instead of failing with
+    "database is locked" when it later tries to upgrade a read lock.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.init_command = params.pop('init_command', '')
+        self.transaction_mode = params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for statement in self.init_command.split(';'):
+            if statement.strip():
+                connection.execute(statement)
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'torah_ai_backend.settings')
 
 application = get_wsgi_application()
+
+from api.runner import start_sweeper  # noqa: E402
+
+start_sweeper()